@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from types import SimpleNamespace
+
+import numpy as np
+import rdflib
+
+EX = rdflib.Namespace("http://example.org/training#")
+XSD = rdflib.XSD
+RDF = rdflib.RDF
+
+COMMANDS = ("receive_weight", "list_workouts", "receive_additional_workout", "receive_recommendation_name",
+            "receive_stat_name", "users", "leaderboard", "cohorts")
+LEVELS = ("Beginner", "Intermediate", "Advanced")
+INTENSITIES = ("Low", "Medium", "High", "Moderate")
+CATEGORIES = ("Cardio", "Strength", "Flexibility")
+
+
+# Синтетичний граф: схема з SPARQL.ttl + N користувачів і M тренувань
+def generate_graph(source, target, users, workouts, seed=0):
+    rnd = random.Random(seed)
+    graph = rdflib.Graph()
+    graph.parse(source, format="n3")
+    workout_ids = []
+    for i in range(workouts):
+        uri = EX[f"Workout_Bench_{i}"]
+        workout_ids.append(uri)
+        graph.add((uri, RDF.type, EX.Workout))
+        graph.add((uri, EX.назва, rdflib.Literal(f"Тренування {i}", lang="uk")))
+        graph.add((uri, EX.вправа, rdflib.Literal(f"Вправа {i}", lang="uk")))
+        graph.add((uri, EX.інтенсивність, EX[rnd.choice(INTENSITIES)]))
+        graph.add((uri, EX.категорія, rdflib.Literal(rnd.choice(CATEGORIES))))
+        graph.add((uri, EX.вимагаєДосвиду, EX[rnd.choice(LEVELS)]))
+        if rnd.random() < 0.5:
+            graph.add((uri, EX.тривалість, rdflib.Literal(rnd.randint(10, 60), datatype=XSD.integer)))
+        else:
+            graph.add((uri, EX.кількістьПідходів, rdflib.Literal(rnd.randint(2, 6), datatype=XSD.integer)))
+        graph.add((uri, EX.спаленіКалорії, rdflib.Literal(float(rnd.randint(50, 600)), datatype=XSD.float)))
+    names = []
+    for i in range(users):
+        name = f"BenchUser_{i}"
+        names.append(name)
+        uri = EX[name]
+        height = round(rnd.uniform(1.5, 2.0), 2)
+        weight = round(rnd.uniform(45, 120), 1)
+        graph.add((uri, RDF.type, EX.User))
+        graph.add((uri, EX.вік, rdflib.Literal(rnd.randint(16, 70), datatype=XSD.integer)))
+        graph.add((uri, EX.зріст, rdflib.Literal(height, datatype=XSD.float)))
+        graph.add((uri, EX.вага, rdflib.Literal(weight, datatype=XSD.float)))
+        graph.add((uri, EX.індексМасиТіла, rdflib.Literal(round(weight / height ** 2, 1), datatype=XSD.float)))
+        graph.add((uri, EX.рівеньФітнесу, EX[rnd.choice(LEVELS)]))
+        graph.add((uri, EX.досвід, EX[rnd.choice(LEVELS)]))
+        for workout in rnd.sample(workout_ids, min(len(workout_ids), rnd.randint(1, 5))):
+            graph.add((uri, EX.маєРекомендацію, workout))
+    graph.serialize(destination=target, format="n3", encoding="utf-8")
+    return names
+
+
+# Мінімальні замінники Update/Context: лише те, що читають обробники
+class FakeMessage:
+    def __init__(self, text, chat_id=1):
+        self.text = text
+        self.chat_id = chat_id
+        self.replies = 0
+
+    async def reply_text(self, text, **kwargs):
+        self.replies += 1
+
+    async def reply_photo(self, photo, caption=None, **kwargs):
+        self.replies += 1
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"bench-{self.replies}")])
+
+
+def fake_update(text, chat_id=1):
+    user = SimpleNamespace(id=chat_id)
+    return SimpleNamespace(message=FakeMessage(text, chat_id), effective_chat=user, effective_user=user)
+
+
+def fake_context(user_data=None, args=None):
+    return SimpleNamespace(user_data=user_data or {}, args=args or [])
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Bench:
+    def __init__(self, bot, names, seed=0):
+        self.bot = bot
+        self.names = names
+        self.rnd = random.Random(seed)
+        self.created = 0
+
+    # Кожна команда повертає корутину одного виклику справжнього обробника
+    def receive_weight(self, i):
+        self.created += 1
+        context = fake_context({"name": f"BenchNew_{self.created}", "age": 30, "height": 1.8})
+        return self.bot.receive_weight(fake_update("80", i), context)
+
+    def list_workouts(self, i):
+        return self.bot.list_workouts(fake_update("", i), fake_context(), select_state=self.bot.WORKOUT_SELECTION)
+
+    def receive_additional_workout(self, i):
+        # Вибір усіх тренувань меню: підтвердження склеює outbox
+        context = fake_context({"new_user": self.rnd.choice(self.names), "menu_version": self.bot.catalog.version})
+        selection = ",".join(str(n + 1) for n in range(len(self.bot.catalog.workouts())))
+        return self.bot.receive_additional_workout(fake_update(selection, i), context)
+
+    def receive_recommendation_name(self, i):
+        return self.bot.receive_recommendation_name(fake_update(self.rnd.choice(self.names), i), fake_context())
+
+    def receive_stat_name(self, i):
+        return self.bot.receive_stat_name(fake_update(self.rnd.choice(self.names), i), fake_context())
+
+    def users(self, i):
+        return self.bot.users(fake_update("/users", i), fake_context())
+
+    def leaderboard(self, i):
+        return self.bot.leaderboard(fake_update("/leaderboard", i), fake_context(args=["planned"]))
+
+    def cohorts(self, i):
+        return self.bot.cohorts(fake_update("/cohorts", i), fake_context())
+
+    async def run(self, command, requests, concurrency):
+        factory = getattr(self, command)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                await factory(i)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        # Відповіді з черги outbox теж входять у час прогону
+        await self.bot.outbox.drain()
+        elapsed = time.perf_counter() - started
+        ms = np.array(latencies) * 1000
+        return {
+            "requests": requests,
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "throughput_rps": round(requests / elapsed, 1),
+            "rss_mb": round(current_rss_mb(), 1),
+        }
+
+
+def compare(results, baseline, tolerance):
+    # Регресія: p99 або RSS гірші за базову лінію більше ніж на tolerance, або пропускна здатність нижча
+    regressions = []
+    for command, current in results.items():
+        base = baseline.get(command)
+        if base is None:
+            continue
+        for key, worse in (("p99_ms", 1), ("rss_mb", 1), ("throughput_rps", -1)):
+            if worse * (current[key] - base[key]) > tolerance * base[key]:
+                regressions.append(f"{command}.{key}: {base[key]} -> {current[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Навантажувальний тест обробників бота на синтетичному графі")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--commands", default=",".join(COMMANDS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    commands = [c for c in args.commands.split(",") if c]
+    unknown = set(commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"невідомі команди: {', '.join(sorted(unknown))}")
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    baseline_path = os.path.abspath(args.baseline)
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    try:
+        names = generate_graph(os.path.join(repo, "SPARQL.ttl"), os.path.join(workdir, "SPARQL.ttl"),
+                               args.users, args.workouts, seed=args.seed)
+        # bot.py читає дані з поточного каталогу під час імпорту
+        os.chdir(workdir)
+        sys.path.insert(0, repo)
+        logging.disable(logging.WARNING)
+        # Попередження matplotlib про гліфи емодзі в підписах графіків
+        warnings.filterwarnings("ignore", category=UserWarning)
+        started = time.perf_counter()
+        bot = importlib.import_module("bot")
+        startup = time.perf_counter() - started
+
+        bench = Bench(bot, names, seed=args.seed)
+        results = {}
+        for command in commands:
+            results[command] = asyncio.run(bench.run(command, args.requests, args.concurrency))
+        bot.chart_renderer.shutdown()
+        bot.progress.close()
+        bot.store.stop()
+    finally:
+        os.chdir(repo)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Граф: {args.users} користувачів, {args.workouts} тренувань; старт {startup * 1000:.0f} мс; "
+          f"паралельність {args.concurrency}")
+    print(f"{'команда':<30}{'p50, мс':>10}{'p99, мс':>10}{'запитів/с':>12}{'RSS, МБ':>10}")
+    for command, r in results.items():
+        print(f"{command:<30}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_rps']:>12.1f}{r['rss_mb']:>10.1f}")
+
+    key = f"users={args.users},workouts={args.workouts},concurrency={args.concurrency}"
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[key] = results
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+        print(f"💾 Базову лінію збережено у {baseline_path} ({key})")
+        return 0
+    if key in baselines:
+        regressions = compare(results, baselines[key], args.tolerance)
+        if regressions:
+            print("🚨 Регресії відносно базової лінії:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("✅ Без регресій відносно базової лінії")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
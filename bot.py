@@ -1,39 +1,107 @@
+import time
+
+# Відлік часу старту до важких імпортів (telegram, rdflib)
+_startup_started = time.perf_counter()
+
+import importlib.util
 import logging
-import re
+import os
 from collections import defaultdict
-from telegram import Update
+from contextlib import contextmanager
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, \
+    InputTextMessageContent
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     ConversationHandler,
     MessageHandler,
     filters,
     ContextTypes,
+    InlineQueryHandler,
 )
 import rdflib
-import matplotlib.pyplot as plt
-import os
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-import matplotlib.image as mpimg
+from storage import GraphStore
+from reasoning import SchemaIndex
+from catalog import WorkoutCatalog
+from profiles import ProfileView
+from intents import IntentIndex
+from names import UserNameIndex
+from records import LEVELS, valid_name, parse_age, parse_height, parse_weight, bmi as body_mass_index, user_triples, workout_triples
+from recommender import RecommendationEngine, priority
+from progress import ProgressStore
+from stats import UserStats, percentile_of, summarize
+from persistence import IdleSessionSweeper, SQLitePersistence
+from updates import PerChatUpdateProcessor
+from outbox import Outbox, RateLimiter
+import metrics
+from charts import ChartRenderer, ChartQueueFull, ChartCache, FileIdRegistry, chart_key, send_chart
 
 # Налаштування логування
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# RDF граф
-g = rdflib.Graph()
+# Звіт про час старту: етап -> секунди
+startup_timings = {"imports": time.perf_counter() - _startup_started}
+
+
+@contextmanager
+def startup_stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+
+def startup_report():
+    total = time.perf_counter() - _startup_started
+    stages = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in startup_timings.items())
+    return f"⏱️ Старт за {total * 1000:.0f} мс: {stages}"
+
+
+# BOT_SHARD_INDEX/BOT_SHARD_PEERS запускають бот вузлом кластера (див. sharding.py):
+# вузол працює зі своєю частиною графа й отримує оновлення від диспетчера
+shard = None
+if os.environ.get("BOT_SHARD_INDEX") is not None:
+    from sharding import Shard
+
+    shard = Shard.from_env()
+
+
+def data_path(path):
+    return shard.path(path) if shard is not None else path
+
+
+# RDF граф (зміни журналюються, знімок SPARQL.ttl оновлюється у фоні).
+# BOT_STORE=sqlite|berkeleydb|oxigraph перемикає на постійне сховище (див. migrate_store.py),
+# BOT_STORE=dataset — на іменовані графи в SPARQL.dataset, де зберігаються лише змінені сегменти
+store = GraphStore(data_path("SPARQL.ttl"), fmt="n3", backend=os.environ.get("BOT_STORE", "memory"),
+                   store_path=os.environ.get("BOT_STORE_PATH"))
+g = store.graph
 EX = rdflib.Namespace("http://example.org/training#")
 XSD = rdflib.Namespace("http://www.w3.org/2001/XMLSchema#")
 RDF = rdflib.Namespace("http://www.w3.org/1999/02/22-rdf-syntax-ns#")
 RDFS = rdflib.RDFS
 
+# Пул рендерингу графіків /stats і кеш готових зображень.
+# matplotlib і логотип завантажуються лише при першому /stats
+chart_renderer = ChartRenderer(logo_path="logo.png")
+chart_cache = ChartCache(EX, max_items=128, disk_dir=data_path("SPARQL.charts"), max_disk_items=1000)
+chart_file_ids = FileIdRegistry(data_path("SPARQL.file_ids.jsonl"), max_items=chart_cache.max_disk_items)
+chart_cache.subscribe(chart_file_ids.discard_many)
+
+# Черга текстових відповідей: підряд ідучі відповіді одному чату склеюються
+outbox = Outbox()
+
 # Стани розмови
-NAME, AGE, HEIGHT, WEIGHT, WORKOUT_SELECTION, ADD_WORKOUT_NAME, ADD_WORKOUT_SELECTION, RECOMMENDATION_NAME, STAT_NAME, MYWORKOUTS_NAME, AI_MODE = range(
-    11)
+NAME, AGE, HEIGHT, WEIGHT, WORKOUT_SELECTION, ADD_WORKOUT_NAME, ADD_WORKOUT_SELECTION, RECOMMENDATION_NAME, STAT_NAME, MYWORKOUTS_NAME, AI_MODE, LOG_NAME, LOG_SELECTION = range(
+    13)
 
 # Завантаження онтології і додавання базових тренувань
 try:
-    g.parse("SPARQL.ttl", format="n3")
+    with startup_stage("graph"):
+        store.load()
 
 
     def ensure_default_workouts():
@@ -63,31 +131,65 @@ try:
         ]
 
         for w in predefined:
-            workout_uri = EX[w["uri"]]
-            if (workout_uri, RDF.type, EX.Workout) not in g:
-                g.add((workout_uri, RDF.type, EX.Workout))
-                g.add((workout_uri, EX.назва, rdflib.Literal(w["назва"], lang="uk")))
-                g.add((workout_uri, EX.вправа, rdflib.Literal(w["exercise"], lang="uk")))
-                g.add((workout_uri, EX.інтенсивність, EX[w["intensity"]]))
-                if w["sets"] is not None:
-                    g.add((workout_uri, EX.кількістьПідходів, rdflib.Literal(w["sets"], datatype=XSD.integer)))
-                if w["duration"] is not None:
-                    g.add((workout_uri, EX.тривалість, rdflib.Literal(w["duration"], datatype=XSD.integer)))
-                g.add((workout_uri, EX.спаленіКалорії, rdflib.Literal(w["calories"], datatype=XSD.float)))
+            if (EX[w["uri"]], RDF.type, EX.Workout) not in g:
+                store.add_many(workout_triples(EX, w))
 
         for uri, label in [("Low", "Низька"), ("Medium", "Середня"), ("High", "Висока"), ("Moderate", "Середня"),
                            ("Висока", "Висока")]:
             intensity_uri = EX[uri]
             if (intensity_uri, RDF.type, EX.Intensity) not in g:
-                g.add((intensity_uri, RDF.type, EX.Intensity))
-            g.set((intensity_uri, RDFS.label, rdflib.Literal(label, lang="uk")))
-
-        g.serialize("SPARQL.ttl", format="n3")
+                store.add((intensity_uri, RDF.type, EX.Intensity))
+            if (intensity_uri, RDFS.label, rdflib.Literal(label, lang="uk")) not in g:
+                store.set((intensity_uri, RDFS.label, rdflib.Literal(label, lang="uk")))
+
+    # Каталог тренувань будується один раз і оновлюється при змінах графа
+    # Замикання підкласів і обернені властивості — до каталогу, який на них спирається
+    with startup_stage("schema"):
+        schema = SchemaIndex(g)
+        schema.rebuild()
+    store.subscribe(schema.on_change)
+
+    with startup_stage("catalog"):
+        catalog = WorkoutCatalog(g, EX, schema)
+        catalog.rebuild()
+    store.subscribe(catalog.on_change)
+    store.subscribe(chart_cache.on_change)
+
+    # Профілі користувачів читають каталог, тому підписуються після нього
+    with startup_stage("profiles"):
+        profiles = ProfileView(g, EX, catalog, schema)
+        profiles.rebuild()
+    store.subscribe(profiles.on_change)
+    # Імена користувачів: перевірка існування, автодоповнення, підказки при помилці
+    with startup_stage("names"):
+        user_names = UserNameIndex(g, EX)
+        user_names.rebuild()
+    store.subscribe(user_names.on_change)
+    # Розбір питань режиму AI: ключові фрази і назви з каталогу
+    intents = IntentIndex(catalog)
+    store.subscribe(intents.on_change)
+
+    # Рушій рекомендацій: матриця ознак тренувань будується при першому запиті
+    recommender = RecommendationEngine(g, EX, catalog, schema)
+    store.subscribe(recommender.on_change)
+
+    # Журнал виконаних тренувань (часовий ряд у SQLite + колонки NumPy)
+    with startup_stage("progress"):
+        progress = ProgressStore(data_path("SPARQL.progress.sqlite")).load()
+        progress.import_rdf(g, EX)
+
+    # Колонки NumPy по всіх користувачах: перцентилі /stats, /leaderboard, /cohorts
+    with startup_stage("stats"):
+        user_stats = UserStats(profiles, progress)
+        user_stats.rebuild()
+    profiles.subscribe(user_stats.on_profile)
 
 except Exception as e:
     logger.error(f"🚨 Помилка завантаження онтології: {e}")
     raise
 
+logger.info(startup_report())
+
 
 # Команди
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -100,6 +202,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📋 /recommendations — Показати рекомендації\n"
         "💪 /myworkouts — Показати всі тренування користувача\n"
         "📊 /stats — Показати статистику тренувань\n"
+        "🏆 /leaderboard — Рейтинг користувачів\n"
+        "📈 /cohorts — Середні показники за рівнями\n"
+        "📝 /log — Записати виконані тренування\n"
         "❌ /cancel — Скасувати операцію\n"
         "ℹ️ /help — Допомога / список команд"
     )
@@ -110,47 +215,167 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📋 Список доступних команд:\n\n"
         "🏋️‍♂️ /start — Привітальне повідомлення\n"
         "🏃 /create_user — Створити нового користувача\n"
-        "👥 /users — Переглянути всіх користувачів\n"
+        "👥 /users — Переглянути всіх користувачів (фільтри: level=Beginner bmi=18.5-25)\n"
         "🏋️ /add_workout — Додати тренування\n"
         "📋 /recommendations — Показати рекомендації тренувань\n"
         "💪 /myworkouts — Показати всі тренування користувача\n"
         "📊 /stats — Показати статистику тренувань\n"
+        "🏆 /leaderboard — Рейтинг користувачів (burned|planned level=Beginner)\n"
+        "📈 /cohorts — Середні показники за рівнями\n"
+        "📝 /log — Записати виконані тренування\n"
         "❌ /cancel — Скасувати поточну операцію\n"
         "ℹ️ /help — Показати це повідомлення"
     )
 
 
+USERS_PAGE_SIZE = 20
+
+# Скільки секунд зберігається незавершена розмова
+CONVERSATION_TTL = 24 * 3600
+
+
+# Telegram приймає callback_data не довше 64 байтів
+CALLBACK_DATA_LIMIT = 64
+# Найбільший зсув сторінки, для якого перевіряється довжина callback_data
+USERS_MAX_OFFSET = 10 ** 9
+BMI_RANGE = (0.0, 100.0)
+
+
+def parse_bmi(value):
+    bmi = round(float(value), 1)
+    if not (BMI_RANGE[0] <= bmi <= BMI_RANGE[1]):
+        raise ValueError(f"ІМТ поза межами {BMI_RANGE[0]:g}–{BMI_RANGE[1]:g}: {value!r}")
+    return bmi
+
+
+def users_callback_data(offset, level=None, bmi_min=None, bmi_max=None):
+    # Фільтри кодуються в callback_data, щоб старі повідомлення гортались коректно
+    return f"users:{offset}:{level or ''}:{'' if bmi_min is None else bmi_min}:{'' if bmi_max is None else bmi_max}"
+
+
+def parse_users_filters(args):
+    # /users level=Beginner bmi=18.5-25
+    filters_ = {"level": None, "bmi_min": None, "bmi_max": None}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key == "level" and value in LEVELS:
+            filters_["level"] = value
+        elif key == "bmi" and value:
+            low, _, high = value.partition("-")
+            filters_["bmi_min"] = parse_bmi(low) if low else None
+            filters_["bmi_max"] = parse_bmi(high) if high else None
+            if None not in (filters_["bmi_min"], filters_["bmi_max"]) and filters_["bmi_min"] > filters_["bmi_max"]:
+                raise ValueError(arg)
+        else:
+            raise ValueError(arg)
+    if len(users_callback_data(USERS_MAX_OFFSET, **filters_).encode("utf-8")) > CALLBACK_DATA_LIMIT:
+        raise ValueError(args)
+    return filters_
+
+
+async def render_users_page(offset, level=None, bmi_min=None, bmi_max=None):
+    if shard is not None:
+        # Користувачі розподілені по вузлах — збираємо сторінку з усіх
+        total, page = await shard.gather_page(profiles, offset, USERS_PAGE_SIZE, level=level,
+                                              bmi_min=bmi_min, bmi_max=bmi_max)
+    else:
+        total, page = profiles.page(offset, USERS_PAGE_SIZE, level=level, bmi_min=bmi_min, bmi_max=bmi_max)
+    if not total:
+        return "👥 Немає користувачів.", None
+
+    lines = [f"📋 Користувачі ({offset + 1}–{offset + len(page)} з {total}):"]
+    for p in page:
+        lines.append(f"👤 {p['name']} — Вік: {p['age']}, Зріст: {p['height']}, Вага: {p['weight']}, "
+                     f"ІМТ: {p['bmi']}, Рівень: {p['level']}")
+
+    filters_ = {"level": level, "bmi_min": bmi_min, "bmi_max": bmi_max}
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=users_callback_data(
+            max(offset - USERS_PAGE_SIZE, 0), **filters_)))
+    if offset + USERS_PAGE_SIZE < total:
+        buttons.append(InlineKeyboardButton("Далі ➡️", callback_data=users_callback_data(
+            offset + USERS_PAGE_SIZE, **filters_)))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
 async def users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = """
-    PREFIX ex: <http://example.org/training#>
-    SELECT ?user ?age ?height ?weight ?fitnessLevel ?bmi
-    WHERE {
-        ?user a ex:User ;
-              ex:вік ?age ;
-              ex:зріст ?height ;
-              ex:вага ?weight ;
-              ex:рівеньФітнесу ?fitnessLevel ;
-              ex:індексМасиТіла ?bmi .
-    }"""
-    results = g.query(q)
-    text = "📋 Користувачі:\n"
-    for r in results:
-        name = r.user.split('#')[-1]
-        text += f"👤 {name} — Вік: {r.age}, Зріст: {r.height}, Вага: {r.weight}, ІМТ: {r.bmi}, Рівень: {r.fitnessLevel.split('#')[-1]}\n"
-    await update.message.reply_text(text or "👥 Немає користувачів.")
+    try:
+        filters_ = parse_users_filters(context.args or [])
+    except ValueError:
+        await update.message.reply_text(f"❌ Формат: /users level=Beginner bmi=18.5-25\n"
+                                        f"Рівні: {', '.join(LEVELS)}; ІМТ: {BMI_RANGE[0]:g}–{BMI_RANGE[1]:g}")
+        return
+    text, markup = await render_users_page(0, **filters_)
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+async def users_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, offset, level, bmi_min, bmi_max = query.data.split(":")
+    text, markup = await render_users_page(int(offset), level=level or None,
+                                     bmi_min=float(bmi_min) if bmi_min else None,
+                                     bmi_max=float(bmi_max) if bmi_max else None)
+    await query.edit_message_text(text, reply_markup=markup)
+
+
+async def foreign_user(update, name):
+    # Вузол кластера обслуговує лише користувачів своєї частини графа
+    if shard is None or shard.owns(name):
+        return False
+    await update.message.reply_text("🔀 Цей користувач обслуговується іншим вузлом. Повторіть команду.")
+    return True
+
+
+async def ask_name(update, text):
+    # Диспетчер повторює команду на вузлі-власнику імені — запит уже надіслав інший вузол
+    if shard is None or not shard.replayed(update):
+        await update.message.reply_text(text)
+
+
+async def find_user_names(query, limit, mode="complete"):
+    # [{name, level, bmi}] з усіх вузлів кластера; без кластера — з локального індексу
+    if shard is not None:
+        return await shard.gather_names(user_names, profiles, query, limit=limit, mode=mode)
+    search = user_names.suggest if mode == "suggest" else user_names.complete
+    return [profiles.get(name) or {"name": name, "level": None, "bmi": None} for name in search(query, limit=limit)]
+
+
+async def reply_unknown_user(update, name):
+    suggestions = [p["name"] for p in await find_user_names(name, 3, mode="suggest")]
+    hint = f" Можливо, ви мали на увазі: {', '.join(suggestions)}?" if suggestions else ""
+    await update.message.reply_text(f"⚠️ Користувача не знайдено.{hint} Спробуйте ще раз:")
+
+
+async def inline_user_names(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # @бот <початок імені> — автодоповнення імені; вибране ім’я надсилається в чат як відповідь розмові
+    query = update.inline_query.query.strip()
+    found = await find_user_names(query, 20)
+    if not found and query:
+        found = await find_user_names(query, 5, mode="suggest")
+    results = []
+    for i, profile in enumerate(found):
+        name = profile["name"]
+        description = f"Рівень: {profile['level'] or '—'}, ІМТ: {profile['bmi'] or '—'}"
+        results.append(InlineQueryResultArticle(id=str(i), title=name, description=description,
+                                                input_message_content=InputTextMessageContent(name)))
+    await update.inline_query.answer(results, cache_time=10)
 
 
 async def create_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🏃 Введіть ім’я користувача:")
+    await ask_name(update, "🏃 Введіть ім’я користувача:")
     return NAME
 
 
 async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = update.message.text.strip()
-    if not re.match(r"^[\w\-]+$", name):
+    if not valid_name(name):
         await update.message.reply_text("❌ Некоректне ім’я. Спробуйте ще раз:")
         return NAME
-    if g.query(f"PREFIX ex: <http://example.org/training#> ASK {{ ex:{name} a ex:User }}").askAnswer:
+    if await foreign_user(update, name):
+        return ConversationHandler.END
+    if name in user_names:
         await update.message.reply_text("⚠️ Користувач вже існує.")
         return NAME
     context.user_data["name"] = name
@@ -160,9 +385,7 @@ async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def receive_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        age = int(update.message.text)
-        if not (0 < age < 120):
-            raise ValueError
+        age = parse_age(update.message.text)
         context.user_data["age"] = age
         await update.message.reply_text("📏 Зріст (м):")
         return HEIGHT
@@ -173,9 +396,7 @@ async def receive_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def receive_height(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        height = float(update.message.text)
-        if not (0.5 < height < 3):
-            raise ValueError
+        height = parse_height(update.message.text)
         context.user_data["height"] = height
         await update.message.reply_text("⚖️ Вага (кг):")
         return WEIGHT
@@ -186,22 +407,21 @@ async def receive_height(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def receive_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        weight = float(update.message.text)
-        if not (10 < weight < 300):
-            raise ValueError
+        weight = parse_weight(update.message.text)
         name = context.user_data["name"]
         age = context.user_data["age"]
         height = context.user_data["height"]
-        bmi = round(weight / (height * height), 1)
+        bmi = body_mass_index(height, weight)
         uri = EX[name]
-        g.add((uri, RDF.type, EX.User))
-        g.add((uri, EX.вік, rdflib.Literal(age, datatype=XSD.integer)))
-        g.add((uri, EX.зріст, rdflib.Literal(height, datatype=XSD.float)))
-        g.add((uri, EX.вага, rdflib.Literal(weight, datatype=XSD.float)))
-        g.add((uri, EX.індексМасиТіла, rdflib.Literal(bmi, datatype=XSD.float)))
-        g.add((uri, EX.рівеньФітнесу, EX.Beginner))
-        g.add((uri, EX.досвід, EX.Beginner))
-        g.serialize("SPARQL.ttl", format="n3")
+        with store.transaction() as tx:
+            # Ім’я могли зайняти в іншій розмові, поки вводились вік і зріст
+            created = not tx.contains((uri, RDF.type, EX.User))
+            if created:
+                tx.add_many(user_triples(EX, name, age, height, weight, bmi))
+        if not created:
+            await update.message.reply_text("⚠️ Користувач вже існує.")
+            context.user_data.clear()
+            return ConversationHandler.END
         await update.message.reply_text(f"✅ Користувача {name} створено! ІМТ: {bmi}")
         context.user_data["new_user"] = name
         return await list_workouts(update, context, select_state=WORKOUT_SELECTION)
@@ -210,58 +430,46 @@ async def receive_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WEIGHT
 
 
+class MenuChanged(Exception):
+    pass
+
+
 async def list_workouts(update, context, select_state):
-    q = "PREFIX ex: <http://example.org/training#> SELECT ?w WHERE { ?w a ?t . ?t rdfs:subClassOf* ex:Workout . }"
-    res = g.query(q, initNs={"ex": EX, "rdfs": RDFS})
-    workouts = []
-    for row in res:
-        wid = row.w
-        label_query = f"""
-        PREFIX ex: <http://example.org/training#>
-        SELECT ?назва WHERE {{
-            <{wid}> ex:назва ?назва .
-        }}
-        """
-        label_result = g.query(label_query)
-        title = next(iter(label_result))[0] if label_result else wid.split('#')[-1]
-        wid = wid.split('#')[-1]
-        workouts.append((wid, str(title)))
-    context.user_data["available_workouts"] = [w[0] for w in workouts]
-    context.user_data["workout_names"] = workouts
-    txt = "\n".join([f"{i + 1}. {w[1]}" for i, w in enumerate(workouts)])
+    # Меню не копіюється в user_data: номери звіряються з каталогом за його версією
+    context.user_data["menu_version"] = catalog.version
+    txt = "\n".join([f"{i + 1}. {w['назва']}" for i, w in enumerate(catalog.workouts())])
     await update.message.reply_text(f"🏋️ Оберіть тренування (введіть номери через кому, наприклад, 1,3,5):\n{txt}")
     return select_state
 
 
+def selected_workouts(context, user_input):
+    if context.user_data.get("menu_version") != catalog.version:
+        raise MenuChanged
+    workouts = catalog.workouts()
+    selected_indices = [int(i.strip()) - 1 for i in user_input.split(',') if i.strip().isdigit()]
+    if not selected_indices or any(i < 0 or i >= len(workouts) for i in selected_indices):
+        raise ValueError
+    return [workouts[i]["uri"] for i in selected_indices]
+
+
 async def receive_workout_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        user_input = update.message.text.strip()
-        selected_indices = [int(i.strip()) - 1 for i in user_input.split(',') if i.strip().isdigit()]
-        workouts = context.user_data["available_workouts"]
-        if not selected_indices or any(i < 0 or i >= len(workouts) for i in selected_indices):
-            raise ValueError
-
-        workout_names = context.user_data["workout_names"]
+        workouts = selected_workouts(context, update.message.text.strip())
         user_name = context.user_data["new_user"]
-        selected_workouts = [workouts[i] for i in selected_indices]
-
-        for workout_name in selected_workouts:
-            g.add((EX[user_name], EX.маєРекомендацію, EX[workout_name]))
-            label_query = f"""
-            PREFIX ex: <http://example.org/training#>
-            SELECT ?назва WHERE {{
-                ex:{workout_name} ex:назва ?назва .
-            }}
-            """
-            label_result = g.query(label_query)
-            workout_label = next(iter(label_result))[0] if label_result else workout_name
-            await update.message.reply_text(f"✅ Додано тренування {workout_label} для {user_name}.")
-
-        g.serialize("SPARQL.ttl", format="n3")
-        await update.message.reply_text(
-            f"💡 Користувач {user_name} створений! Тепер задавайте мені будь-які питання (або введіть /cancel, щоб вийти).")
+        store.add_many((EX[user_name], EX.маєРекомендацію, EX[w]) for w in workouts)
+
+        # Підтвердження йдуть через outbox і приходять одним повідомленням
+        for workout_name in workouts:
+            workout_label = catalog.label(workout_name)
+            outbox.send(update.message, f"✅ Додано тренування {workout_label} для {user_name}.")
+
+        outbox.send(update.message,
+                    f"💡 Користувач {user_name} створений! Тепер задавайте мені будь-які питання (або введіть /cancel, щоб вийти).")
         return AI_MODE
 
+    except MenuChanged:
+        await update.message.reply_text("🔄 Список тренувань змінився.")
+        return await list_workouts(update, context, select_state=WORKOUT_SELECTION)
     except:
         await update.message.reply_text(
             "❌ Некоректний ввід. Введіть номери через кому (наприклад, 1,3,5) у межах доступного списку:")
@@ -277,52 +485,32 @@ async def ai_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.clear()
         return ConversationHandler.END
 
-    # Логіка відповіді AI (проста реалізація на основі доступних даних)
+    # Відповідь локального індексу намірів з кешованого профілю (без SPARQL і зовнішніх сервісів)
     reply = f"🤖 Привіт, {user_name}! Ти запитав: {user_question}\n"
-
-    # Перевірка запитів, пов’язаних із тренуваннями
-    if "тренування" in user_question.lower() or "workout" in user_question.lower():
-        query = f"""
-        PREFIX ex: <http://example.org/training#>
-        SELECT ?назва ?вправа ?калорії
-        WHERE {{
-            ex:{user_name} ex:маєРекомендацію ?workout .
-            OPTIONAL {{ ?workout ex:назва ?назва . }}
-            OPTIONAL {{ ?workout ex:вправа ?вправа . }}
-            OPTIONAL {{ ?workout ex:спаленіКалорії ?калорії . }}
-        }}
-        """
-        results = g.query(query, initNs={"ex": EX})
-        if results:
-            reply += "Твої тренування:\n"
-            for row in results:
-                title = row.назва if row.назва else "Невідоме тренування"
-                exercise = row.вправа if row.вправа else "—"
-                calories = row.калорії if row.калорії else "?"
-                reply += f"• {title} ({exercise}, {calories} ккал)\n"
-        else:
-            reply += "У тебе ще немає тренувань. Додай їх через /add_workout.\n"
-
-    # Загальна відповідь, якщо запит не пов’язаний із тренуваннями
+    answer = intents.answer(user_question, profiles.get(user_name))
+    if answer:
+        reply += answer
     else:
-        reply += "Я можу допомогти з питаннями про твої тренування! Спробуй запитати щось на кшталт 'Які у мене тренування?' або додай нові тренування через /add_workout. 😊"
+        reply += "Я можу допомогти з питаннями про твої тренування! Спробуй запитати щось на кшталт 'Які у мене тренування?', 'Що спалює найбільше калорій?' або 'Скільки калорій спалює біг?'. 😊"
 
     await update.message.reply_text(reply)
     return AI_MODE
 
 
 async def add_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🏋️ Введіть ім’я користувача:")
+    await ask_name(update, "🏋️ Введіть ім’я користувача:")
     return ADD_WORKOUT_NAME
 
 
 async def receive_add_workout_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = update.message.text.strip()
-    if not re.match(r"^[\w\-]+$", name):
+    if not valid_name(name):
         await update.message.reply_text("❌ Некоректне ім’я. Спробуйте ще раз:")
         return ADD_WORKOUT_NAME
-    if (EX[name], RDF.type, EX.User) not in g:
-        await update.message.reply_text("⚠️ Користувача не знайдено. Спробуйте ще раз:")
+    if await foreign_user(update, name):
+        return ConversationHandler.END
+    if name not in user_names:
+        await reply_unknown_user(update, name)
         return ADD_WORKOUT_NAME
     context.user_data["new_user"] = name
     return await list_workouts(update, context, select_state=ADD_WORKOUT_SELECTION)
@@ -330,243 +518,396 @@ async def receive_add_workout_name(update: Update, context: ContextTypes.DEFAULT
 
 async def receive_additional_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        user_input = update.message.text.strip()
-        selected_indices = [int(i.strip()) - 1 for i in user_input.split(',') if i.strip().isdigit()]
-        workouts = context.user_data["available_workouts"]
-        if not selected_indices or any(i < 0 or i >= len(workouts) for i in selected_indices):
-            raise ValueError
-
-        workout_names = context.user_data["workout_names"]
+        workouts = selected_workouts(context, update.message.text.strip())
         user = context.user_data["new_user"]
-        selected_workouts = [workouts[i] for i in selected_indices]
-
-        for workout_name in selected_workouts:
-            g.add((EX[user], EX.маєРекомендацію, EX[workout_name]))
-            label_query = f"""
-            PREFIX ex: <http://example.org/training#>
-            SELECT ?назва WHERE {{
-                ex:{workout_name} ex:назва ?назва .
-            }}
-            """
-            label_result = g.query(label_query)
-            workout_label = next(iter(label_result))[0] if label_result else workout_name
-            await update.message.reply_text(f"✅ Додано тренування {workout_label} для {user}.")
-
-        g.serialize("SPARQL.ttl", format="n3")
+        store.add_many((EX[user], EX.маєРекомендацію, EX[w]) for w in workouts)
+
+        for workout_name in workouts:
+            workout_label = catalog.label(workout_name)
+            outbox.send(update.message, f"✅ Додано тренування {workout_label} для {user}.")
+
         context.user_data.clear()
         return ConversationHandler.END
 
+    except MenuChanged:
+        await update.message.reply_text("🔄 Список тренувань змінився.")
+        return await list_workouts(update, context, select_state=ADD_WORKOUT_SELECTION)
     except:
         await update.message.reply_text("❌ Спробуйте ще раз: введіть номери через кому (наприклад, 1,3,5):")
         return ADD_WORKOUT_SELECTION
 
 
 async def recommendations(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("📋 Введіть ім’я користувача:")
+    await ask_name(update, "📋 Введіть ім’я користувача:")
     return RECOMMENDATION_NAME
 
 
 async def receive_recommendation_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.text.strip()
-    if not re.match(r"^[\w\-]+$", user_name):
+    if not valid_name(user_name):
         await update.message.reply_text("❌ Некоректне ім’я. Спробуйте ще раз:")
         return RECOMMENDATION_NAME
-    if (EX[user_name], RDF.type, EX.User) not in g:
-        await update.message.reply_text("⚠️ Користувача не знайдено. Спробуйте ще раз:")
+    if await foreign_user(update, user_name):
+        return ConversationHandler.END
+    if user_name not in user_names:
+        await reply_unknown_user(update, user_name)
         return RECOMMENDATION_NAME
 
-    query = f"""
-    PREFIX ex: <http://example.org/training#>
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    SELECT ?workout ?назва ?вправа ?інтенсивність ?кількістьПідходів ?тривалість ?калорії
-    WHERE {{
-        ex:{user_name} ex:маєРекомендацію ?workout .
-        OPTIONAL {{ ?workout ex:назва ?назва . }}
-        OPTIONAL {{ ?workout ex:вправа ?вправа . }}
-        OPTIONAL {{ ?workout ex:інтенсивність ?інтенсивність . }}
-        OPTIONAL {{ ?workout ex:кількістьПідходів ?кількістьПідходів . }}
-        OPTIONAL {{ ?workout ex:тривалість ?тривалість . }}
-        OPTIONAL {{ ?workout ex:спаленіКалорії ?калорії . }}
-    }}
-    """
-
-    results = g.query(query, initNs={"ex": EX, "rdfs": RDFS})
-
-    if not results:
+    profile = profiles.get(user_name)
+    workouts = profile["workouts"]
+    suggested = recommender.top_k(user_name, profile, k=3)
+
+    if not workouts and not suggested:
         await update.message.reply_text(f"📋 Рекомендацій для {user_name} не знайдено.")
         return ConversationHandler.END
 
     reply = f"🏋️ Рекомендації для {user_name}:\n"
-    for row in results:
-        title = str(row.назва) if row.назва else row.workout.split('#')[-1]
-        exercise = str(row.вправа) if row.вправа else "—"
-        calories = str(row.калорії) if row.калорії else "?"
-
-        if row.тривалість:
-            duration_or_sets = f"{row.тривалість} хв"
-        elif row.кількістьПідходів:
-            duration_or_sets = f"{row.кількістьПідходів} підходів"
+    for w in workouts:
+        title = w["назва"]
+        exercise = w["exercise"] or "—"
+        calories = w["calories"] if w["calories"] is not None else "?"
+
+        if w["duration"]:
+            duration_or_sets = f"{w['duration']} хв"
+        elif w["sets"]:
+            duration_or_sets = f"{w['sets']} підходів"
         else:
             duration_or_sets = "невідомо"
 
-        intensity_label = None
-        if row.інтенсивність:
-            labels = list(g.objects(row.інтенсивність, RDFS.label))
-            intensity_label = next((str(l) for l in labels if getattr(l, 'language', None) == 'uk'), None)
-        if not intensity_label and row.інтенсивність:
-            intensity_label = row.інтенсивність.split('#')[-1]
-        if not intensity_label:
-            intensity_label = "Невідомо"
+        intensity_label = w["intensity_label"] or "Невідомо"
 
         reply += f"\n🏋️ {title} — {exercise}, Інтенсивність: {intensity_label}, {duration_or_sets}, {calories} ккал"
 
+    # Найкращі тренування за ціллю, рівнем та історією, яких ще немає у списку
+    if suggested:
+        reply += "\n\n✨ Рекомендуємо спробувати:"
+        for workout_id, score in suggested:
+            reply += f"\n⭐ {catalog.label(workout_id)} — відповідність {score:.0%}, пріоритет: {priority(score)}"
+
     await update.message.reply_text(reply)
     return ConversationHandler.END
 
 
 async def myworkouts_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("💪 Введіть ім’я користувача:")
+    await ask_name(update, "💪 Введіть ім’я користувача:")
     return MYWORKOUTS_NAME
 
 
 async def myworkouts_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.text.strip()
-    if not re.match(r"^[\w\-]+$", user_name):
+    if not valid_name(user_name):
         await update.message.reply_text("❌ Некоректне ім’я. Спробуйте ще раз:")
         return MYWORKOUTS_NAME
-    if (EX[user_name], RDF.type, EX.User) not in g:
-        await update.message.reply_text("⚠️ Користувача не знайдено. Спробуйте ще раз:")
+    if await foreign_user(update, user_name):
+        return ConversationHandler.END
+    if user_name not in user_names:
+        await reply_unknown_user(update, user_name)
         return MYWORKOUTS_NAME
 
-    query = f"""
-    PREFIX ex: <http://example.org/training#>
-    SELECT ?workout ?назва
-    WHERE {{
-        ex:{user_name} ex:маєРекомендацію ?workout .
-        OPTIONAL {{ ?workout ex:назва ?назва }}
-    }}
-    """
-
-    results = g.query(query, initNs={"ex": EX})
+    workouts = profiles.get(user_name)["workouts"]
 
-    if not results:
+    if not workouts:
         await update.message.reply_text(f"💪 Для користувача {user_name} не знайдено тренувань.")
         return ConversationHandler.END
 
     reply = f"🏋️‍♂️ Тренування користувача {user_name}:\n"
-    for row in results:
-        label = row.назва if row.назва else row.workout.split('#')[-1]
-        reply += f"• {label}\n"
+    for w in workouts:
+        reply += f"• {w['назва']}\n"
 
     await update.message.reply_text(reply)
     return ConversationHandler.END
 
 
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("📊 Введіть ім’я користувача для перегляду статистики:")
+    await ask_name(update, "📊 Введіть ім’я користувача для перегляду статистики:")
     return STAT_NAME
 
 
 async def receive_stat_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.text.strip()
-    if not re.match(r"^[\w\-]+$", user_name):
+    if not valid_name(user_name):
         await update.message.reply_text("❌ Некоректне ім’я. Спробуйте ще раз:")
         return STAT_NAME
-    if (EX[user_name], RDF.type, EX.User) not in g:
-        await update.message.reply_text("⚠️ Користувача не знайдено. Спробуйте ще раз:")
+    if await foreign_user(update, user_name):
+        return ConversationHandler.END
+    if user_name not in user_names:
+        await reply_unknown_user(update, user_name)
         return STAT_NAME
 
-    # Запит для отримання спалених калорій за тренуваннями
-    query_workouts = f"""
-    PREFIX ex: <http://example.org/training#>
-    SELECT ?назва ?калорії
-    WHERE {{
-        ex:{user_name} ex:маєРекомендацію ?workout .
-        OPTIONAL {{ ?workout ex:назва ?назва . }}
-        OPTIONAL {{ ?workout ex:спаленіКалорії ?калорії . }}
-    }}
-    """
-    results_workouts = g.query(query_workouts, initNs={"ex": EX})
-
-    if not results_workouts:
+    profile = profiles.get(user_name)
+    rollups = progress_rollup_text(user_name)
+    if not profile["workouts"] and not rollups:
         await update.message.reply_text(f"📊 Статистики для {user_name} не знайдено.")
         return ConversationHandler.END
 
-    # Запит для отримання ваги користувача
-    query_weight = f"""
-    PREFIX ex: <http://example.org/training#>
-    SELECT ?вага
-    WHERE {{
-        ex:{user_name} ex:вага ?вага .
-    }}
-    """
-    result_weight = g.query(query_weight, initNs={"ex": EX})
-    weight = float(next(iter(result_weight)).вага) if result_weight else 0.0
+    if profile["workouts"]:
+        await send_stats_chart(update, user_name, profile)
+    text = "\n\n".join(part for part in (rollups, await population_text(user_name)) if part)
+    if text:
+        await update.message.reply_text(text)
+    return ConversationHandler.END
+
+
+STAT_LABELS = {"planned": "Калорії рекомендованих тренувань", "burned": "Спалено за журналом",
+               "bmi": "ІМТ", "weight": "Вага"}
+
+
+POPULATION_COLUMNS = ("planned", "burned", "bmi")
+
+
+async def population_text(user_name):
+    # Місце користувача серед усіх (усіх вузлів кластера): частка тих, у кого значення менше, і квартилі
+    if shard is not None:
+        users, values = await shard.gather_population(user_stats, POPULATION_COLUMNS)
+    else:
+        users, values = len(user_stats), {c: user_stats.sorted_values(c) for c in POPULATION_COLUMNS}
+    if users < 2:
+        return None
+    lines = [f"👥 Порівняно з іншими ({users} користувачів):"]
+    for column in POPULATION_COLUMNS:
+        share = percentile_of(values[column], user_stats.value(user_name, column))
+        summary = summarize(values[column])
+        if share is None or summary is None:
+            continue
+        p25, p50, p75, _ = summary
+        lines.append(f"• {STAT_LABELS[column]}: більше, ніж у {share:.0f}% "
+                     f"(квартилі {p25:.1f} / {p50:.1f} / {p75:.1f})")
+    return "\n".join(lines) if len(lines) > 1 else None
+
+
+LEADERBOARD_SIZE = 10
+
+
+def parse_leaderboard_args(args):
+    # /leaderboard burned level=Beginner
+    column, level = None, None
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if not value and key in ("burned", "planned"):
+            column = key
+        elif key == "level" and value in LEVELS:
+            level = value
+        else:
+            raise ValueError(arg)
+    return column, level
+
+
+async def leaderboard_top(column, level):
+    if shard is not None:
+        return await shard.gather_leaderboard(user_stats, column, limit=LEADERBOARD_SIZE, level=level)
+    return user_stats.leaderboard(column, limit=LEADERBOARD_SIZE, level=level)
+
+
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        column, level = parse_leaderboard_args(context.args or [])
+    except ValueError:
+        await update.message.reply_text("❌ Формат: /leaderboard burned|planned level=Beginner")
+        return
+    if column is None:
+        # Поки ніхто нічого не записав через /log — рейтинг за рекомендованими
+        column = "burned"
+        top = await leaderboard_top(column, level)
+        if not top:
+            column = "planned"
+            top = await leaderboard_top(column, level)
+    else:
+        top = await leaderboard_top(column, level)
+    if not top:
+        await update.message.reply_text("🏆 Рейтинг порожній.")
+        return
+    title = f"🏆 Рейтинг: {STAT_LABELS[column].lower()}"
+    if level is not None:
+        title += f" (рівень {level})"
+    lines = [title + ":"]
+    lines += [f"{place}. {name} — {value:.0f} ккал" for place, (name, value) in enumerate(top, 1)]
+    await update.message.reply_text("\n".join(lines))
+
+
+async def cohorts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    groups = await shard.gather_cohorts(user_stats) if shard is not None else user_stats.cohorts()
+    if not groups:
+        await update.message.reply_text("📈 Немає користувачів із визначеним рівнем.")
+        return
+
+    def fmt(value, digits=1):
+        return "—" if value is None else f"{value:.{digits}f}"
+
+    lines = ["📈 Середні показники за рівнями:"]
+    for level, row in groups.items():
+        lines.append(f"• {level} ({row['users']}): ІМТ {fmt(row['bmi'])}, вага {fmt(row['weight'])} кг, "
+                     f"рекомендовано {fmt(row['planned'], 0)} ккал, спалено {fmt(row['burned'], 0)} ккал")
+    await update.message.reply_text("\n".join(lines))
+
+
+def progress_rollup_text(user_name):
+    # Тижневі й місячні підсумки з журналу /log
+    weekly = progress.rollup(user_name, "week", last=4)
+    if not weekly:
+        return None
+    monthly = progress.rollup(user_name, "month", last=3)
+    lines = [f"📅 Прогрес {user_name} (останні тижні):"]
+    lines += [f"• {label}: {total:.0f} ккал, тренувань: {count}" for label, total, count in weekly]
+    lines.append("🗓️ По місяцях:")
+    lines += [f"• {label}: {total:.0f} ккал, тренувань: {count}" for label, total, count in monthly]
+    return "\n".join(lines)
+
+
+async def send_stats_chart(update, user_name, profile):
+    caption = f"📊 Порівняння спалених калорій та ваги для {user_name}"
+
+    # Теплий кеш: дані користувача не змінювались з останнього графіка
+    cached_key = chart_cache.key_for_user(user_name)
+    if cached_key is not None:
+        if await send_chart(update.message, cached_key, chart_cache.get(cached_key), caption, chart_file_ids):
+            return
 
     # Підготовка даних для графіка
-    labels = []
-    calories_data = []
-    for row in results_workouts:
-        label = str(row.назва) if row.назва else "Невідоме тренування"
-        calories = float(row.калорії) if row.калорії else 0.0
-        labels.append(label)
-        calories_data.append(calories)
-
-    # Генерація графіка з двома осями Y
-    fig, ax1 = plt.subplots(figsize=(10, 6))
-
-    # Перша вісь Y: калорії
-    ax1.bar(labels, calories_data,
-            color=['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40', '#4BC0C0', '#FF6384', '#36A2EB',
-                   '#FFCE56', '#9966FF'])
-    ax1.set_xlabel('Тренування')
-    ax1.set_ylabel('Калорії', color='#FF6384')
-    ax1.tick_params(axis='y', labelcolor='#FF6384')
-    ax1.set_xticks(range(len(labels)))
-    ax1.set_xticklabels(labels, rotation=45, ha='right')
-
-    # Друга вісь Y: вага
-    ax2 = ax1.twinx()
-    ax2.axhline(y=weight, color='#36A2EB', linestyle='--', label=f'Вага ({weight} кг)')
-    ax2.set_ylabel('Вага (кг)', color='#36A2EB')
-    ax2.tick_params(axis='y', labelcolor='#36A2EB')
-    ax2.legend(loc='upper right')
-
-    # Додавання логотипу (зображення)
-    logo_path = "logo.png"  # Шлях до вашої картинки (потрібно завантажити її)
-    logo_img = mpimg.imread(logo_path)
-    imagebox = OffsetImage(logo_img, zoom=0.1)
-    ab = AnnotationBbox(imagebox, (1, 1), xycoords='axes fraction', frameon=False, box_alignment=(1, 1))
-    ax1.add_artist(ab)
-
-    # Заголовок і налаштування
-    plt.title(f'📊 Порівняння спалених калорій та ваги для {user_name}')
-    plt.tight_layout()
-
-    # Збереження графіка у тимчасовий файл
-    chart_path = 'chart.png'
-    plt.savefig(chart_path)
-    plt.close()
-
-    # Надсилання графіка
-    with open(chart_path, 'rb') as chart_file:
-        await update.message.reply_photo(photo=chart_file,
-                                         caption=f"📊 Порівняння спалених калорій та ваги для {user_name}")
-
-    # Видалення тимчасового файлу
-    os.remove(chart_path)
+    weight = profile["weight"] or 0.0
+    labels = [w["назва"] for w in profile["workouts"]]
+    calories_data = [w["calories"] or 0.0 for w in profile["workouts"]]
+
+    key = chart_key(user_name, labels, calories_data, weight)
+    chart_cache.bind_user(user_name, key)
+    if await send_chart(update.message, key, chart_cache.get(key), caption, chart_file_ids):
+        return
+
+    # Рендеринг графіка у пулі процесів, щоб не блокувати інші чати
+    try:
+        chart_png = await chart_renderer.render(user_name, labels, calories_data, weight)
+    except ChartQueueFull:
+        await update.message.reply_text("⏳ Забагато запитів статистики. Спробуйте за хвилину.")
+        return
+    chart_cache.put(key, chart_png)
+    await send_chart(update.message, key, chart_png, caption, chart_file_ids)
+
+
+async def log_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await ask_name(update, "📝 Введіть ім’я користувача:")
+    return LOG_NAME
+
+
+async def receive_log_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    name = update.message.text.strip()
+    if not valid_name(name):
+        await update.message.reply_text("❌ Некоректне ім’я. Спробуйте ще раз:")
+        return LOG_NAME
+    if await foreign_user(update, name):
+        return ConversationHandler.END
+    if name not in user_names:
+        await reply_unknown_user(update, name)
+        return LOG_NAME
+    context.user_data["new_user"] = name
+    return await list_workouts(update, context, select_state=LOG_SELECTION)
 
+
+async def receive_log_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        workouts = selected_workouts(context, update.message.text.strip())
+    except MenuChanged:
+        await update.message.reply_text("🔄 Список тренувань змінився.")
+        return await list_workouts(update, context, select_state=LOG_SELECTION)
+    except ValueError:
+        await update.message.reply_text("❌ Спробуйте ще раз: введіть номери через кому (наприклад, 1,3,5):")
+        return LOG_SELECTION
+
+    user = context.user_data["new_user"]
+    entries = [(w, catalog.get(w)["calories"]) for w in workouts]
+    progress.log(user, entries)
+    total = sum(calories or 0.0 for _, calories in entries)
+    user_stats.add_burned(user, total)
+    labels = ", ".join(catalog.label(workout) for workout, _ in entries)
+    await update.message.reply_text(f"✅ Записано для {user}: {labels} ({total:.0f} ккал).")
+
+    context.user_data.clear()
     return ConversationHandler.END
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
-    await update.message.reply_text("❌ Скасовано.")
+    # Мовчазний /cancel від диспетчера: розмову продовжує інший вузол
+    if shard is None or not shard.replayed(update):
+        await update.message.reply_text("❌ Скасовано.")
     return ConversationHandler.END
 
 
+def health():
+    # Стан для /healthz у режимі webhook
+    return {
+        "triples": len(g),
+        "pending_writes": store.pending,
+        "graph_lock": store.lock.stats(),
+        "users": len(profiles),
+        "workouts": len(catalog),
+        "outbox": outbox.stats(),
+    }
+
+
+def metrics_samples():
+    # Стан графа для /metrics (лічильники подій збирає сам metrics)
+    samples = [("bot_graph_triples", {}, len(g)), ("bot_graph_pending_writes", {}, store.pending),
+               ("bot_outbox_chats", {}, outbox.stats()["chats"])]
+    for mode, lock_stats in store.lock.stats().items():
+        for key, value in lock_stats.items():
+            samples.append((f"bot_graph_lock_{key}", {"mode": mode}, value))
+    return samples
+
+
+metrics.REGISTRY.add_collector(metrics_samples)
+
+# Telegram id адміністраторів для /debug_perf
+ADMINS = {int(a) for a in os.environ.get("BOT_ADMINS", "").split(",") if a.strip()}
+
+
+async def debug_perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user is None or update.effective_user.id not in ADMINS:
+        await update.message.reply_text("⛔ Команда доступна лише адміністраторам.")
+        return
+    # /debug_perf profile — текст останнього профілю повільного запиту
+    if context.args and context.args[0] == "profile":
+        if not metrics.profiler.reports:
+            await update.message.reply_text("Профілів повільних запитів немає.")
+            return
+        name, elapsed, report = metrics.profiler.reports[-1]
+        await update.message.reply_text(f"🐢 {name}: {elapsed * 1000:.0f} мс\n{report[:3500]}")
+        return
+    await update.message.reply_text(metrics.debug_report())
+
+
+async def start_background(app):
+    sweeper.start(app)
+
+
+async def stop_background(app):
+    await sweeper.stop()
+    await outbox.drain()
+
+
+# Покинуті розмови й user_data звільняються з RAM через CONVERSATION_TTL
+sweeper = IdleSessionSweeper(CONVERSATION_TTL)
+
+
 def main():
-    app = Application.builder().token("7973391875:AAHAT7xxc3TWp2ABRI-J3b5_0DhX-FPMWJ4").build()
+    # Пул графіків форкається, поки в процесі немає інших потоків (журнал графа, /metrics, PTB)
+    chart_renderer.start()
+    # Стан розмов переживає перезапуск; покинуті розмови видаляються через CONVERSATION_TTL
+    persistence = SQLitePersistence(data_path("SPARQL.conversations.sqlite"), ttl=CONVERSATION_TTL)
+    app = (Application.builder().token(os.environ.get("BOT_TOKEN", "7973391875:AAHAT7xxc3TWp2ABRI-J3b5_0DhX-FPMWJ4"))
+           .persistence(persistence)
+           # Різні чати обробляються паралельно, повідомлення одного чату — по черзі
+           .concurrent_updates(PerChatUpdateProcessor(int(os.environ.get("BOT_CONCURRENT_UPDATES", "64"))))
+           # Ліміти Telegram на бот діляться між вузлами кластера
+           .rate_limiter(RateLimiter(overall_rate=30 / (len(shard.peers) if shard is not None else 1)))
+           .post_init(start_background)
+           .post_stop(stop_background)
+           .build())
+    # conversation_timeout потребує JobQueue (python-telegram-bot[job-queue], тобто APScheduler);
+    # без нього пам'ять звільняє лише sweeper
+    has_job_queue = importlib.util.find_spec("apscheduler") is not None
+    conversation_options = {
+        "persistent": True,
+        "conversation_timeout": CONVERSATION_TTL if has_job_queue else None,
+    }
 
     # Встановлюємо список команд для бота
     commands = [
@@ -578,6 +919,9 @@ def main():
         ("recommendations", "Показати рекомендації тренувань"),
         ("myworkouts", "Показати всі тренування користувача"),
         ("stats", "Показати статистику тренувань"),
+        ("leaderboard", "Рейтинг користувачів"),
+        ("cohorts", "Середні показники за рівнями"),
+        ("log", "Записати виконані тренування"),
         ("cancel", "Скасувати операцію"),
     ]
     app.bot.set_my_commands(commands)
@@ -594,6 +938,8 @@ def main():
             AI_MODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, ai_mode)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="create_user",
+        **conversation_options,
     )
 
     # Обробник для додавання тренувань
@@ -604,6 +950,8 @@ def main():
             ADD_WORKOUT_SELECTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_additional_workout)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="add_workout",
+        **conversation_options,
     )
 
     # Обробник для рекомендацій
@@ -613,6 +961,8 @@ def main():
             RECOMMENDATION_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_recommendation_name)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="recommendations",
+        **conversation_options,
     )
 
     # Обробник для статистики
@@ -622,6 +972,8 @@ def main():
             STAT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_stat_name)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="stats",
+        **conversation_options,
     )
 
     # Обробник для myworkouts
@@ -631,6 +983,20 @@ def main():
             MYWORKOUTS_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, myworkouts_name)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="myworkouts",
+        **conversation_options,
+    )
+
+    # Обробник для журналу виконаних тренувань
+    log_conv = ConversationHandler(
+        entry_points=[CommandHandler("log", log_progress)],
+        states={
+            LOG_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_log_name)],
+            LOG_SELECTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_log_selection)],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="log",
+        **conversation_options,
     )
 
     # Додавання обробників до програми
@@ -639,10 +1005,54 @@ def main():
     app.add_handler(recommendation_conv)
     app.add_handler(stats_conv)
     app.add_handler(myworkouts_conv)
+    app.add_handler(log_conv)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("users", users))
-    app.run_polling()
+    app.add_handler(CallbackQueryHandler(users_page, pattern=r"^users:"))
+    app.add_handler(CommandHandler("leaderboard", leaderboard))
+    app.add_handler(CommandHandler("cohorts", cohorts))
+    app.add_handler(CommandHandler("debug_perf", debug_perf))
+    # Автодоповнення імен в inline режимі (вмикається у @BotFather: /setinline)
+    app.add_handler(InlineQueryHandler(inline_user_names))
+    # Таймери й лічильники для кожного обробника (/metrics, /debug_perf)
+    metrics.instrument_handlers(app)
+    # Час останнього оновлення кожного користувача для sweeper (поза таймерами обробників)
+    app.add_handler(sweeper.handler(), group=-1)
+
+    store.start()
+    try:
+        # BOT_WEBHOOK_URL вмикає webhook замість long polling
+        webhook_url = os.environ.get("BOT_WEBHOOK_URL")
+        if shard is not None:
+            from urllib.parse import urlparse
+            from webhook import WebhookServer
+
+            # Вузол кластера: оновлення приходять від диспетчера на /update
+            WebhookServer(app, path="/update",
+                          listen=os.environ.get("BOT_WEBHOOK_LISTEN", "127.0.0.1"),
+                          port=urlparse(shard.url).port,
+                          secret_token=os.environ.get("BOT_WEBHOOK_SECRET"),
+                          health=health,
+                          routes=shard.routes(profiles, user_names, user_stats) + [("GET", "/metrics", metrics.handle_metrics)]).run()
+        elif webhook_url:
+            from webhook import WebhookServer
+
+            WebhookServer(app, webhook_url,
+                          listen=os.environ.get("BOT_WEBHOOK_LISTEN", "0.0.0.0"),
+                          port=int(os.environ.get("BOT_WEBHOOK_PORT", "8443")),
+                          secret_token=os.environ.get("BOT_WEBHOOK_SECRET"),
+                          health=health, routes=[("GET", "/metrics", metrics.handle_metrics)]).run()
+        else:
+            # Для long polling /metrics віддає окремий HTTP сервер
+            if os.environ.get("BOT_METRICS_PORT"):
+                metrics.start_http_server(int(os.environ["BOT_METRICS_PORT"]))
+            app.run_polling()
+    finally:
+        chart_renderer.shutdown()
+        progress.close()
+        # Дописуємо незбережені зміни перед виходом
+        store.stop()
 
 
 if __name__ == "__main__":
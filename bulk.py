@@ -0,0 +1,238 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from itertools import chain, islice
+
+import numpy as np
+import rdflib
+
+from reasoning import SchemaIndex
+from progress import ProgressStore
+from records import parse_age, parse_height, parse_level, parse_name, parse_weight, parse_workout, user_triples, \
+    workout_triples
+from storage import GraphStore
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EX = rdflib.Namespace("http://example.org/training#")
+RDF = rdflib.RDF
+
+
+class ImportAborted(Exception):
+    pass
+
+
+def read_records(path, fmt=None):
+    # Потокове читання: (номер рядка, dict) з CSV або JSONL
+    fmt = fmt or ("csv" if path.endswith(".csv") else "jsonl")
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                yield line_no, json.loads(line)
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _workout_list(value):
+    # CSV: "Workout_Yoga;Workout_Cardio", JSONL: список
+    if not value:
+        return []
+    items = value if isinstance(value, list) else str(value).split(";")
+    return [parse_name(item) for item in items if str(item).strip()]
+
+
+class BulkLoader:
+    """Масове завантаження користувачів і тренувань у граф бота.
+
+    Записи читаються потоково і перевіряються чанками тими ж правилами,
+    що й розмова /create_user; ІМТ чанка рахується одним векторним
+    проходом. Усі прийняті триплети застосовуються однією транзакцією
+    GraphStore — один запис журналу замість тисяч. Бот на цьому графі
+    має бути зупинений: журнал підхопиться при наступному старті.
+    """
+
+    def __init__(self, store, chunk_size=5000, strict=False):
+        self.store = store
+        self.chunk_size = chunk_size
+        self.strict = strict
+        self.schema = SchemaIndex(store.graph)
+        self.schema.rebuild()
+        self.errors = []
+        self.skipped = 0
+        self._seen = set()
+        self._new_workouts = set()
+
+    def _reject(self, line_no, error):
+        if self.strict:
+            raise ImportAborted(f"рядок {line_no}: {error}")
+        self.errors.append((line_no, str(error)))
+
+    def _user_rows(self, tx, chunk):
+        rows = []
+        for line_no, record in chunk:
+            try:
+                name = parse_name(record.get("name", ""))
+                row = (line_no, name, parse_age(record.get("age")), parse_height(record.get("height")),
+                       parse_weight(record.get("weight")), parse_level(record.get("level")),
+                       _workout_list(record.get("workouts")))
+                for workout in row[6]:
+                    if workout not in self._new_workouts and not self.schema.is_instance(EX[workout], EX.Workout):
+                        raise ValueError(f"невідоме тренування: {workout}")
+            except (TypeError, ValueError) as e:
+                self._reject(line_no, e)
+                continue
+            if name in self._seen or tx.contains((EX[name], RDF.type, EX.User)):
+                self.skipped += 1
+                continue
+            self._seen.add(name)
+            rows.append(row)
+        return rows
+
+    def import_users(self, records):
+        imported = 0
+        with self.store.transaction() as tx:
+            for chunk in chunks(records, self.chunk_size):
+                rows = self._user_rows(tx, chunk)
+                if not rows:
+                    continue
+                heights = np.fromiter((row[3] for row in rows), dtype=float, count=len(rows))
+                weights = np.fromiter((row[4] for row in rows), dtype=float, count=len(rows))
+                bmis = np.round(weights / (heights * heights), 1)
+                for (_, name, age, height, weight, level, workouts), bmi in zip(rows, bmis.tolist()):
+                    tx.add_many(user_triples(EX, name, age, height, weight, bmi, level))
+                    tx.add_many((EX[name], EX.маєРекомендацію, EX[w]) for w in workouts)
+                imported += len(rows)
+        return imported
+
+    def import_workouts(self, records):
+        imported = 0
+        with self.store.transaction() as tx:
+            for chunk in chunks(records, self.chunk_size):
+                for line_no, record in chunk:
+                    try:
+                        workout = parse_workout(record)
+                    except (TypeError, ValueError) as e:
+                        self._reject(line_no, e)
+                        continue
+                    uri = EX[workout["uri"]]
+                    if workout["uri"] in self._new_workouts or tx.contains((uri, RDF.type, EX.Workout)):
+                        self.skipped += 1
+                        continue
+                    self._new_workouts.add(workout["uri"])
+                    tx.add_many(workout_triples(EX, workout))
+                    imported += 1
+        return imported
+
+
+def _subjects(graph, kind, schema):
+    if kind == "users":
+        return graph.subjects(RDF.type, EX.User)
+    return (w for cls in schema.subclasses(EX.Workout) for w in graph.subjects(RDF.type, cls))
+
+
+def export_ntriples(graph, out, kind="all", chunk_size=5000, schema=None, progress=None):
+    # N-Triples чанками: у пам'яті лише один чанк, а не серіалізований граф цілком
+    if kind == "progress":
+        triples = progress.rdf_triples(EX)
+    elif kind == "all" and progress is not None:
+        # Журнал /log живе поза графом і вже містить ex:Progress, перенесені з графа при першому старті
+        logged = set(graph.subjects(RDF.type, EX.Progress))
+        triples = chain((t for t in graph if t[0] not in logged), progress.rdf_triples(EX))
+    elif kind == "all":
+        triples = iter(graph)
+    else:
+        seen = set()
+        subjects = (s for s in _subjects(graph, kind, schema) if not (s in seen or seen.add(s)))
+        triples = (t for s in subjects for t in graph.triples((s, None, None)))
+    written = 0
+    for chunk in chunks(triples, chunk_size):
+        batch = rdflib.Graph()
+        for t in chunk:
+            batch.add(t)
+        out.write(batch.serialize(format="nt", encoding="utf-8"))
+        written += len(chunk)
+    return written
+
+
+def open_store(path, read_only=False):
+    store = GraphStore(path, fmt="n3", backend=os.environ.get("BOT_STORE", "memory"),
+                       store_path=os.environ.get("BOT_STORE_PATH"))
+    store.load(read_only=read_only)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масовий імпорт/експорт користувачів і тренувань графа бота")
+    parser.add_argument("--graph", default="SPARQL.ttl")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Завантажити CSV/JSONL у граф (бот має бути зупинений)")
+    imp.add_argument("kind", choices=("users", "workouts"))
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    imp.add_argument("--chunk", type=int, default=5000)
+    imp.add_argument("--strict", action="store_true", help="Будь-яка помилка скасовує весь імпорт")
+    exp = sub.add_parser("export", help="Вивантажити граф у N-Triples")
+    exp.add_argument("path", help="Файл .nt або - для stdout")
+    exp.add_argument("--kind", choices=("all", "users", "workouts", "progress"), default="all")
+    exp.add_argument("--progress", default="SPARQL.progress.sqlite", help="Журнал виконаних тренувань (/log)")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store = open_store(args.graph)
+        loader = BulkLoader(store, chunk_size=args.chunk, strict=args.strict)
+        try:
+            records = read_records(args.path, args.format)
+            if args.kind == "users":
+                imported = loader.import_users(records)
+            else:
+                imported = loader.import_workouts(records)
+        except ImportAborted as e:
+            logger.error(f"🚨 Імпорт скасовано, граф не змінено: {e}")
+            return 1
+        finally:
+            store.stop()
+        for line_no, error in loader.errors[:20]:
+            logger.warning(f"⚠️ Рядок {line_no}: {error}")
+        logger.info(f"✅ Імпортовано {imported} ({args.kind}); пропущено існуючих: {loader.skipped}, "
+                    f"з помилками: {len(loader.errors)}")
+        return 0
+
+    store = open_store(args.graph, read_only=True)
+    schema = SchemaIndex(store.graph)
+    schema.rebuild()
+    progress = None
+    if os.path.exists(args.progress):
+        progress = ProgressStore(args.progress).load()
+    elif args.kind == "progress":
+        parser.error(f"журнал {args.progress} не знайдено")
+    try:
+        if args.path == "-":
+            written = export_ntriples(store.graph, sys.stdout.buffer, args.kind, schema=schema, progress=progress)
+        else:
+            with open(args.path, "wb") as out:
+                written = export_ntriples(store.graph, out, args.kind, schema=schema, progress=progress)
+    finally:
+        if progress is not None:
+            progress.close()
+    logger.info(f"✅ Вивантажено {written} триплетів у {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import hashlib
+
+import rdflib
+
+RDFS = rdflib.RDFS
+RDF = rdflib.RDF
+
+
+def local_name(uri):
+    return str(uri).split('#')[-1]
+
+
+def _uk_label(graph, subject, predicate):
+    labels = list(graph.objects(subject, predicate))
+    label = next((l for l in labels if getattr(l, 'language', None) == 'uk'), None)
+    return str(label if label is not None else labels[0]) if labels else None
+
+
+def _number(value, cast):
+    try:
+        return cast(value.toPython()) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class WorkoutCatalog:
+    """Індекс тренувань, побудований один раз з графа.
+
+    Записи мають ті ж ключі, що й список predefined у bot.py, і
+    оновлюються точково при зміні триплетів конкретного тренування.
+    version — хеш упорядкованого списку тренувань меню: однаковий між
+    перезапусками для того самого меню, тож номер зі збереженої розмови
+    не вкаже на інше тренування після змін, зроблених поки бот стояв.
+    """
+
+    def __init__(self, graph, ns, schema):
+        self.graph = graph
+        self.ns = ns
+        self.schema = schema
+        self._entries = {}
+        self._version = None
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = hashlib.sha1("\n".join(self._entries).encode("utf-8")).hexdigest()[:16]
+        return self._version
+
+    def rebuild(self):
+        self._entries = {}
+        self._version = None
+        workouts = set()
+        for workout_type in self.schema.subclasses(self.ns.Workout):
+            workouts.update(self.graph.subjects(RDF.type, workout_type))
+        # Стабільний порядок меню між перезапусками
+        for workout in sorted(workouts):
+            self._refresh(workout)
+
+    def _refresh(self, uri):
+        name = local_name(uri)
+        if not self.schema.is_instance(uri, self.ns.Workout):
+            if self._entries.pop(name, None) is not None:
+                self._version = None
+            return
+        if name not in self._entries:
+            self._version = None
+        ex = self.ns
+        intensity = self.graph.value(uri, ex.інтенсивність)
+        intensity_label = None
+        if intensity is not None:
+            intensity_label = _uk_label(self.graph, intensity, RDFS.label) or local_name(intensity)
+        self._entries[name] = {
+            "uri": name,
+            "назва": _uk_label(self.graph, uri, ex.назва) or name,
+            "exercise": _uk_label(self.graph, uri, ex.вправа),
+            "intensity": local_name(intensity) if intensity is not None else None,
+            "intensity_label": intensity_label,
+            "duration": _number(self.graph.value(uri, ex.тривалість), int),
+            "sets": _number(self.graph.value(uri, ex.кількістьПідходів), int),
+            "calories": _number(self.graph.value(uri, ex.спаленіКалорії), float),
+        }
+
+    # Обробник змін графа (GraphStore.subscribe); підписувати після SchemaIndex
+    def on_change(self, triple, added):
+        s, p, o = triple
+        if p == RDFS.subClassOf:
+            self.rebuild()
+        elif (p == RDF.type and self.schema.is_subclass(o, self.ns.Workout)) or local_name(s) in self._entries:
+            self._refresh(s)
+        elif p == RDFS.label:
+            name = local_name(s)
+            for entry in list(self._entries.values()):
+                if entry["intensity"] == name:
+                    self._refresh(self.ns[entry["uri"]])
+
+    def workouts(self):
+        return list(self._entries.values())
+
+    def get(self, name):
+        return self._entries.get(name)
+
+    def label(self, name):
+        entry = self._entries.get(name)
+        return entry["назва"] if entry else name
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
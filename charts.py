@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from telegram.error import BadRequest
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+BAR_COLORS = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40', '#4BC0C0', '#FF6384', '#36A2EB',
+              '#FFCE56', '#9966FF']
+
+
+# Логотип декодується один раз у головному процесі (при створенні пулу) й передається робочим процесам
+_logo = None
+
+
+class ChartQueueFull(Exception):
+    pass
+
+
+def load_logo(path):
+    if not os.path.exists(path):
+        logger.warning(f"⚠️ Логотип {path} не знайдено, графіки будуть без нього")
+        return None
+    import matplotlib.image as mpimg
+    return mpimg.imread(path)
+
+
+def _init_worker(logo):
+    global _logo
+    _logo = logo
+
+
+def _warm_up():
+    return None
+
+
+def render_stats_chart(user_name, labels, calories_data, weight):
+    # Виконується у процесі пулу: лише об'єктний API Figure/Agg, без глобального стану pyplot
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax1 = fig.subplots()
+
+    # Перша вісь Y: калорії
+    ax1.bar(labels, calories_data, color=BAR_COLORS)
+    ax1.set_xlabel('Тренування')
+    ax1.set_ylabel('Калорії', color='#FF6384')
+    ax1.tick_params(axis='y', labelcolor='#FF6384')
+    ax1.set_xticks(range(len(labels)))
+    ax1.set_xticklabels(labels, rotation=45, ha='right')
+
+    # Друга вісь Y: вага
+    ax2 = ax1.twinx()
+    ax2.axhline(y=weight, color='#36A2EB', linestyle='--', label=f'Вага ({weight} кг)')
+    ax2.set_ylabel('Вага (кг)', color='#36A2EB')
+    ax2.tick_params(axis='y', labelcolor='#36A2EB')
+    ax2.legend(loc='upper right')
+
+    # Додавання логотипу (зображення)
+    if _logo is not None:
+        imagebox = OffsetImage(_logo, zoom=0.1)
+        ab = AnnotationBbox(imagebox, (1, 1), xycoords='axes fraction', frameon=False, box_alignment=(1, 1))
+        ax1.add_artist(ab)
+
+    ax2.set_title(f'📊 Порівняння спалених калорій та ваги для {user_name}')
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+class ChartRenderer:
+    """Пул процесів для рендерингу графіків /stats.
+
+    Кількість задач у черзі обмежена: коли вона заповнена, render()
+    одразу кидає ChartQueueFull, і обробник просить спробувати пізніше.
+    Робочі процеси створюються fork (без повторного імпорту bot.py), тому
+    start() треба викликати до запуску інших потоків: дочірній процес
+    успадковує lock, захоплений чужим потоком, і може зависнути.
+    """
+
+    def __init__(self, workers=2, max_pending=8, logo_path="logo.png"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.logo_path = logo_path
+        self._pending = 0
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            if threading.active_count() > 1:
+                logger.warning("⚠️ Пул графіків створюється після запуску потоків — fork може зависнути")
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork") if "fork" in methods else None
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                             initializer=_init_worker, initargs=(load_logo(self.logo_path),))
+            # Перший submit форкає всіх робочих одразу, ще до службового потоку пулу
+            self._pool.submit(_warm_up).result()
+        return self._pool
+
+    async def render(self, user_name, labels, calories_data, weight):
+        if self._pending >= self.max_pending:
+            raise ChartQueueFull()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with timed("bot_chart_render_seconds"):
+                return await loop.run_in_executor(
+                    self.start(), render_stats_chart, user_name, labels, calories_data, weight)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+def chart_key(user_name, labels, calories_data, weight):
+    payload = json.dumps([user_name, list(labels), list(calories_data), weight], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """Кеш готових PNG за хешем вхідних даних графіка.
+
+    Пам'ять — LRU на max_items записів; якщо задано disk_dir, PNG також
+    зберігаються на диску як <hash>.png і переживають перезапуск. Диск —
+    LRU за mtime (читання оновлює mtime): коли файлів більше, ніж
+    max_disk_items з запасом у 10%, найстаріші видаляються до ліміту.
+    Окремо пам'ятаємо останній ключ кожного користувача, щоб теплий
+    /stats не виконував жодного запиту до графа. Підписники (subscribe)
+    отримують ключі видалених з диска PNG.
+    """
+
+    def __init__(self, ns, max_items=128, disk_dir=None, max_disk_items=1000):
+        self.ns = ns
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_items = max_disk_items
+        self._items = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        self._disk_items = 0
+        self._listeners = []
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._prune()
+
+    # callback(ключі) після видалення PNG з диска
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.png")
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is not None:
+                self._items.move_to_end(key)
+                return png
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    png = f.read()
+                os.utime(self._disk_path(key))
+            except FileNotFoundError:
+                return None
+            self._remember(key, png)
+            return png
+        return None
+
+    def put(self, key, png):
+        self._remember(key, png)
+        if self.disk_dir and not os.path.exists(self._disk_path(key)):
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, self._disk_path(key))
+            with self._lock:
+                self._disk_items += 1
+                full = self._disk_items > self.max_disk_items * 1.1
+            if full:
+                self._prune()
+
+    def _prune(self):
+        # Видаляємо найдавніше використані PNG, доки їх не стане max_disk_items
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".png"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        excess = entries[:max(0, len(entries) - self.max_disk_items)]
+        for _, path in excess:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._disk_items = len(entries) - len(excess)
+        keys = [os.path.basename(path)[:-len(".png")] for _, path in excess]
+        for callback in self._listeners:
+            callback(keys)
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._items[key] = png
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def bind_user(self, user_name, key):
+        with self._lock:
+            self._user_keys[user_name] = key
+
+    def key_for_user(self, user_name):
+        with self._lock:
+            return self._user_keys.get(user_name)
+
+    # Обробник змін графа (GraphStore.subscribe)
+    def on_change(self, triple, added):
+        s, p, o = triple
+        ex = self.ns
+        if p in (ex.маєРекомендацію, ex.вага):
+            with self._lock:
+                self._user_keys.pop(str(s).split('#')[-1], None)
+        elif p == ex.рекомендуєтьсяДля:
+            with self._lock:
+                self._user_keys.pop(str(o).split('#')[-1], None)
+        elif p in (ex.назва, ex.спаленіКалорії):
+            # Змінилось тренування — воно може бути на графіках будь-якого користувача
+            with self._lock:
+                self._user_keys.clear()
+
+
+class FileIdRegistry:
+    """Відповідність хеш графіка -> file_id, який повернув Telegram.
+
+    Зберігається поруч із SPARQL.ttl як журнал JSON-рядків ([хеш, file_id],
+    null — видалення), щоб після перезапуску однакові графіки надсилались
+    за file_id без повторного завантаження. Новий запис — один дописаний
+    рядок; журнал ущільнюється при старті й у фоновому потоці, коли рядків
+    удвічі більше за max_items. Записів не більше max_items (LRU).
+    """
+
+    def __init__(self, path, max_items=1000):
+        self.path = path
+        self.max_items = max_items
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self._log = None
+        self._lines = 0
+        self._compacting = False
+        self._load()
+        while len(self._ids) > max_items:
+            self._ids.popitem(last=False)
+        with self._lock:
+            self._compact_locked()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        key, file_id = json.loads(line)
+                    except (TypeError, ValueError):
+                        # Обірваний рядок після аварії
+                        continue
+                    self._ids.pop(key, None)
+                    if file_id is not None:
+                        self._ids[key] = file_id
+        except OSError as e:
+            logger.error(f"🚨 Не вдалося прочитати {self.path}: {e}")
+
+    def get(self, key):
+        with self._lock:
+            file_id = self._ids.get(key)
+            if file_id is not None:
+                self._ids.move_to_end(key)
+            return file_id
+
+    def set(self, key, file_id):
+        with self._lock:
+            self._ids[key] = file_id
+            self._ids.move_to_end(key)
+            self._append(key, file_id)
+            while len(self._ids) > self.max_items:
+                evicted, _ = self._ids.popitem(last=False)
+                self._append(evicted, None)
+
+    def discard(self, key):
+        self.discard_many([key])
+
+    # Слухач ChartCache.subscribe: file_id живе не довше за PNG на диску
+    def discard_many(self, keys):
+        with self._lock:
+            for key in keys:
+                if self._ids.pop(key, None) is not None:
+                    self._append(key, None)
+
+    def _append(self, key, file_id):
+        if self._log is None:
+            return
+        self._log.write(json.dumps([key, file_id], ensure_ascii=False) + "\n")
+        self._log.flush()
+        self._lines += 1
+        if self._lines > 2 * self.max_items and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact, name="file-ids-compact", daemon=True).start()
+
+    def _compact(self):
+        with self._lock:
+            self._compact_locked()
+            self._compacting = False
+
+    def _compact_locked(self):
+        # Живі записи в порядку LRU замість усієї історії
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps([key, file_id], ensure_ascii=False) + "\n"
+                             for key, file_id in self._ids.items())
+            os.replace(tmp_path, self.path)
+            if self._log is not None:
+                self._log.close()
+            self._log = open(self.path, "a", encoding="utf-8")
+            self._lines = len(self._ids)
+        except OSError as e:
+            logger.error(f"🚨 Не вдалося зберегти {self.path}: {e}")
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._ids
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
+
+
+async def send_chart(message, key, png, caption, file_ids):
+    # Спершу пробуємо file_id; якщо його немає або Telegram його відхилив — завантажуємо PNG
+    file_id = file_ids.get(key)
+    if file_id is not None:
+        try:
+            with timed("bot_telegram_upload_seconds", kind="file_id"):
+                return await message.reply_photo(photo=file_id, caption=caption)
+        except BadRequest as e:
+            logger.warning(f"⚠️ file_id графіка відхилено: {e}")
+            file_ids.discard(key)
+    if png is None:
+        return None
+    with timed("bot_telegram_upload_seconds", kind="upload"):
+        sent = await message.reply_photo(photo=png, caption=caption)
+    if sent is not None and sent.photo:
+        file_ids.set(key, sent.photo[-1].file_id)
+    return sent
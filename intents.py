@@ -0,0 +1,193 @@
+import re
+
+import rdflib
+
+from catalog import local_name
+
+RDF = rdflib.RDF
+RDFS = rdflib.RDFS
+
+_TOKEN = re.compile(r"\w+")
+_ENDINGS = "аеєиіїоуюяьйaeiouy"
+STEM_LENGTH = 5
+
+# Ключові фрази намірів; порядок задає пріоритет, коли збігається кілька
+INTENTS = (
+    ("most_calories", ("найбільше калорій", "найбільше ккал", "найбільше спалює", "найефективніше",
+                       "most calories", "burns the most")),
+    ("least_calories", ("найменше калорій", "найменше ккал", "найменше спалює", "least calories")),
+    ("duration", ("тривалість", "триває", "скільки часу", "хвилин", "найдовше", "довго", "підходів",
+                  "duration", "longest", "how long")),
+    ("intensity", ("інтенсивність", "інтенсивні", "інтенсивне", "intensity")),
+    ("calories", ("калорій", "ккал", "спалює", "calories", "burn")),
+    ("profile", ("імт", "вага", "зріст", "вік", "рівень", "профіль", "bmi", "weight", "profile")),
+    ("workouts", ("тренування", "список", "workout")),
+)
+PRIORITY = {intent: i for i, (intent, _) in enumerate(INTENTS)}
+
+
+def stem(token):
+    # Грубий стемер: без голосних закінчень і не довше STEM_LENGTH ("калорії", "калорій" -> "калор")
+    return (token.rstrip(_ENDINGS) or token)[:STEM_LENGTH]
+
+
+def tokenize(text):
+    return [stem(t) for t in _TOKEN.findall(text.lower())]
+
+
+class PhraseTrie:
+    """Префіксне дерево фраз над стемами слів.
+
+    find() проходить текст зліва направо і на кожній позиції бере
+    найдовшу фразу, тож "кардіо біг" не дає окремого збігу "біг".
+    """
+
+    _END = None
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, phrase, payload):
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(self._END, set()).add(payload)
+
+    def find(self, tokens):
+        found = []
+        i = 0
+        while i < len(tokens):
+            node = self.root
+            best = None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if self._END in node:
+                    best = (j + 1, node[self._END])
+            if best is None:
+                i += 1
+                continue
+            found.extend(best[1])
+            i = best[0]
+        return found
+
+
+class IntentIndex:
+    """Локальний розбір питань режиму AI.
+
+    Ключові фрази намірів і назви з каталогу (тренування, вправи,
+    інтенсивності) компілюються в одне PhraseTrie; відповідь
+    будується з матеріалізованого профілю без SPARQL і без зовнішніх
+    сервісів. Індекс перекомпільовується при першому питанні після
+    зміни тренувань у графі.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._trie = None
+
+    def _compile(self):
+        trie = PhraseTrie()
+        for intent, phrases in INTENTS:
+            for phrase in phrases:
+                trie.add(phrase, ("intent", intent))
+        for entry in self.catalog.workouts():
+            trie.add(entry["назва"], ("workout", entry["uri"]))
+            if entry["exercise"]:
+                trie.add(entry["exercise"], ("workout", entry["uri"]))
+            if entry["intensity"]:
+                trie.add(entry["intensity"], ("intensity", entry["intensity"]))
+                if entry["intensity_label"]:
+                    trie.add(entry["intensity_label"], ("intensity", entry["intensity"]))
+        self._trie = trie
+
+    # Обробник змін графа (GraphStore.subscribe); підписувати після каталогу
+    def on_change(self, triple, added):
+        s, p, o = triple
+        if local_name(s) in self.catalog or p in (RDF.type, RDFS.label, RDFS.subClassOf):
+            self._trie = None
+
+    def match(self, text):
+        # -> (намір або None, id тренувань, інтенсивності) у порядку появи в тексті
+        if self._trie is None:
+            self._compile()
+        intents, workouts, intensities = [], [], []
+        for kind, value in self._trie.find(tokenize(text)):
+            target = {"intent": intents, "workout": workouts, "intensity": intensities}[kind]
+            if value not in target:
+                target.append(value)
+        intent = min(intents, key=PRIORITY.get) if intents else None
+        return intent, workouts, intensities
+
+    def answer(self, text, profile):
+        intent, workout_ids, intensities = self.match(text)
+        workouts = profile["workouts"] if profile else []
+        if workout_ids:
+            # Питання про конкретні тренування: дані з каталогу, навіть якщо їх немає у користувача
+            asked = [self.catalog.get(w) for w in workout_ids if w in self.catalog]
+            return "\n".join(_describe(w, intent) for w in asked)
+        if intent == "profile":
+            return _profile(profile)
+        if intent is None:
+            return None
+        if not workouts:
+            return "У тебе ще немає тренувань. Додай їх через /add_workout."
+        if intensities:
+            workouts = [w for w in workouts if w["intensity"] in intensities]
+            if not workouts:
+                return "Серед твоїх тренувань немає таких за інтенсивністю."
+        if intent in ("most_calories", "least_calories"):
+            rated = [w for w in workouts if w["calories"] is not None]
+            if not rated:
+                return "Для твоїх тренувань не вказано калорій."
+            pick = max if intent == "most_calories" else min
+            w = pick(rated, key=lambda w: w["calories"])
+            word = "Найбільше" if intent == "most_calories" else "Найменше"
+            return f"🔥 {word} калорій спалює {w['назва']}: {w['calories']:.0f} ккал."
+        if intent == "calories":
+            total = sum(w["calories"] or 0.0 for w in workouts)
+            return f"🔥 Разом твої тренування ({len(workouts)}) спалюють {total:.0f} ккал."
+        if intent == "duration":
+            timed = sorted((w for w in workouts if w["duration"] is not None), key=lambda w: -w["duration"])
+            lines = [f"⏱️ {w['назва']}: {w['duration']} хв" for w in timed]
+            lines += [f"🔁 {w['назва']}: {w['sets']} підходів" for w in workouts if w["sets"] is not None]
+            return "\n".join(lines) or "Для твоїх тренувань не вказано тривалості."
+        if intent == "intensity" and not intensities:
+            return "\n".join(f"⚡ {w['назва']}: {w['intensity_label'] or '—'}" for w in workouts)
+        lines = ["Твої тренування:"]
+        lines += [f"• {w['назва']} ({w['exercise'] or '—'}, {_calories(w)} ккал)" for w in workouts]
+        return "\n".join(lines)
+
+
+def _calories(workout):
+    return f"{workout['calories']:.0f}" if workout["calories"] is not None else "?"
+
+
+def _describe(workout, intent):
+    if intent in ("calories", "most_calories", "least_calories"):
+        return f"🔥 {workout['назва']}: {_calories(workout)} ккал."
+    if intent == "duration":
+        if workout["duration"] is not None:
+            return f"⏱️ {workout['назва']}: {workout['duration']} хв."
+        if workout["sets"] is not None:
+            return f"🔁 {workout['назва']}: {workout['sets']} підходів."
+    if intent == "intensity":
+        return f"⚡ {workout['назва']}: інтенсивність {workout['intensity_label'] or '—'}."
+    details = [f"вправа {workout['exercise'] or '—'}", f"інтенсивність {workout['intensity_label'] or '—'}"]
+    if workout["duration"] is not None:
+        details.append(f"{workout['duration']} хв")
+    if workout["sets"] is not None:
+        details.append(f"{workout['sets']} підходів")
+    details.append(f"{_calories(workout)} ккал")
+    return f"🏋️ {workout['назва']}: " + ", ".join(details) + "."
+
+
+def _profile(profile):
+    if profile is None:
+        return "Профіль не знайдено."
+    return (f"👤 {profile['name']}: вік {profile['age'] or '—'}, зріст {profile['height'] or '—'} м, "
+            f"вага {profile['weight'] or '—'} кг, ІМТ {profile['bmi'] or '—'}, рівень {profile['level'] or '—'}.")
@@ -0,0 +1,287 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Межі гістограм у секундах (як у клієнтів Prometheus за замовчуванням)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "bot_handler_seconds": "Час виконання обробника Telegram",
+    "bot_handler_errors_total": "Винятки в обробниках Telegram",
+    "bot_graph_serialize_seconds": "Час серіалізації графа (знімок або запис журналу)",
+    "bot_chart_render_seconds": "Час рендерингу графіка /stats у пулі процесів",
+    "bot_telegram_upload_seconds": "Час надсилання фото в Telegram",
+    "bot_telegram_throttle_seconds": "Очікування запиту до Telegram через ліміти",
+    "bot_telegram_retry_after_total": "Відповіді 429 RetryAfter від Telegram",
+    "bot_outbox_errors_total": "Відповіді з черги outbox, які не вдалося надіслати",
+}
+
+
+class Timer:
+    """Одна серія вимірів: лічильник, сума, максимум, гістограма
+    і вікно останніх значень для p50/p99 у /debug_perf."""
+
+    __slots__ = ("count", "total", "max", "buckets", "recent")
+
+    def __init__(self, window=512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self._collectors = []
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = Timer()
+            timer.observe(seconds)
+
+    @contextmanager
+    def time(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # collector() -> [(назва, {мітки}, значення)] — стан, який не рахується подіями (розмір графа тощо)
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def timers(self, name):
+        # {значення міток через кому: Timer} для однієї метрики
+        with self._lock:
+            return {",".join(str(v) for _, v in labels): timer
+                    for (n, labels), timer in self._timers.items() if n == name}
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+        seen = set()
+        for (name, labels), timer in timers:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS, timer.buckets):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {timer.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {timer.total}")
+            lines.append(f"{name}_count{_labels(labels)} {timer.count}")
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                logger.error(f"🚨 Помилка збору метрик: {e}")
+                continue
+            for name, labels, value in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+REGISTRY = Registry()
+observe = REGISTRY.observe
+timed = REGISTRY.time
+
+
+class SlowRequestProfiler:
+    """Вибіркове профілювання обробників (pyinstrument, якщо встановлено).
+
+    Кожен rate-й виклик виконується під семплюючим профайлером; якщо він
+    триває довше threshold, текстовий звіт лишається в кільцевому буфері
+    для /debug_perf. Без pyinstrument профілювання просто вимкнене.
+    """
+
+    def __init__(self, threshold=1.0, rate=0.0, keep=5):
+        self.threshold = threshold
+        self.rate = rate
+        self.reports = deque(maxlen=keep)
+        self._calls = 0
+        self._active = False
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+            if rate:
+                logger.warning("⚠️ pyinstrument не встановлено — профілювання повільних запитів вимкнене")
+        self._profiler = Profiler
+
+    @classmethod
+    def from_env(cls):
+        return cls(threshold=float(os.environ.get("BOT_PROFILE_SLOW_MS", "1000")) / 1000,
+                   rate=float(os.environ.get("BOT_PROFILE_RATE", "0")))
+
+    def should_sample(self):
+        # Одночасно профілюється лише один обробник
+        if self._profiler is None or self.rate <= 0 or self._active:
+            return False
+        self._calls += 1
+        return self._calls % max(1, round(1 / self.rate)) == 0
+
+    @contextmanager
+    def capture(self, name):
+        profiler = self._profiler(async_mode="enabled")
+        self._active = True
+        profiler.start()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            self._active = False
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                self.reports.append((name, elapsed, profiler.output_text(unicode=True, color=False)))
+
+
+profiler = SlowRequestProfiler.from_env()
+
+
+def instrument(callback):
+    # Обгортка обробника: час, винятки, вибіркове профілювання
+    name = getattr(callback, "__name__", repr(callback))
+    if getattr(callback, "__wrapped_metrics__", False):
+        return callback
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            if profiler.should_sample():
+                with profiler.capture(name):
+                    return await callback(update, context, *args, **kwargs)
+            return await callback(update, context, *args, **kwargs)
+        except Exception:
+            REGISTRY.inc("bot_handler_errors_total", handler=name)
+            raise
+        finally:
+            observe("bot_handler_seconds", time.perf_counter() - started, handler=name)
+
+    wrapper.__wrapped_metrics__ = True
+    return wrapper
+
+
+def instrument_handlers(app):
+    # Обгортає callback кожного обробника, включно з вкладеними у ConversationHandler
+    from telegram.ext import ConversationHandler
+
+    def walk(handlers):
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                walk(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    walk(state_handlers)
+                walk(handler.fallbacks)
+            elif hasattr(handler, "callback"):
+                handler.callback = instrument(handler.callback)
+
+    for handlers in app.handlers.values():
+        walk(handlers)
+
+
+def debug_report(limit=10):
+    # Текст для /debug_perf: найповільніші обробники й запити за p99
+    lines = []
+    for title, name in (("Обробники", "bot_handler_seconds"), ("Графіки", "bot_chart_render_seconds"),
+                        ("Telegram", "bot_telegram_upload_seconds"), ("Ліміти Telegram", "bot_telegram_throttle_seconds"),
+                        ("Серіалізація", "bot_graph_serialize_seconds")):
+        timers = REGISTRY.timers(name)
+        if not timers:
+            continue
+        lines.append(f"⏱️ {title} (p50 / p99 / max, мс; викликів):")
+        ranked = sorted(timers.items(), key=lambda item: item[1].percentile(0.99), reverse=True)[:limit]
+        for label, t in ranked:
+            lines.append(f"• {label or name}: {t.percentile(0.5) * 1000:.1f} / {t.percentile(0.99) * 1000:.1f} / "
+                         f"{t.max * 1000:.1f}; {t.count}")
+    if profiler.reports:
+        lines.append("🐢 Повільні запити з профілем:")
+        lines.extend(f"• {name}: {elapsed * 1000:.0f} мс" for name, elapsed, _ in profiler.reports)
+    return "\n".join(lines) or "Метрик ще немає."
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="0.0.0.0"):
+    # Окремий потік з /metrics для режиму long polling (у webhook режимі — маршрут aiohttp)
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+async def handle_metrics(request):
+    from aiohttp import web
+
+    return web.Response(text=REGISTRY.prometheus(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,52 @@
+import argparse
+import logging
+import os
+
+from storage import BACKENDS, GraphStore, backend_path, open_backend
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Одноразове перенесення графа (SPARQL.ttl з незлитим журналом або SPARQL.dataset) у постійне сховище
+def migrate(backend, source="SPARQL.ttl", target=None, batch_size=10000, source_backend="memory"):
+    if source_backend == backend:
+        raise ValueError(f"Граф уже у сховищі {backend}")
+    target = target or backend_path(source, backend)
+    src = GraphStore.open_source(source, backend=source_backend)
+    dst = open_backend(backend, target)
+    try:
+        for prefix, ns in src.graph.namespaces():
+            dst.bind(prefix, ns)
+        batch = []
+        for s, p, o in src.graph:
+            batch.append((s, p, o, dst))
+            if len(batch) >= batch_size:
+                dst.addN(batch)
+                batch = []
+        if batch:
+            dst.addN(batch)
+        if dst.store.transaction_aware:
+            dst.commit()
+        logger.info(f"✅ Перенесено {len(src.graph)} триплетів у {target} ({backend})")
+    finally:
+        dst.close()
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенесення графа бота у постійне сховище")
+    parser.add_argument("backend", choices=sorted(BACKENDS))
+    parser.add_argument("--source", default="SPARQL.ttl")
+    parser.add_argument("--target", default=None)
+    parser.add_argument("--source-store", default=os.environ.get("BOT_STORE", "memory"),
+                        help="сховище, з якого читати граф (як BOT_STORE у бота)")
+    args = parser.parse_args()
+    try:
+        migrate(args.backend, args.source, args.target, source_backend=args.source_store)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import bisect
+import difflib
+
+import rdflib
+
+from catalog import local_name
+
+RDF = rdflib.RDF
+
+
+def closest(name, candidates, limit=3):
+    # Та сама назва в іншому регістрі — найімовірніша помилка, далі найближчі за difflib
+    folded = name.casefold()
+    found = list(dict.fromkeys(n for n in candidates if n.casefold() == folded and n != name))
+    for match in difflib.get_close_matches(name, candidates, n=limit, cutoff=0.7):
+        if match not in found and match != name:
+            found.append(match)
+    return found[:limit]
+
+
+class UserNameIndex:
+    """Індекс імен користувачів (локальні імена всіх ex:User).
+
+    Множина дає перевірку існування за O(1), відсортований за
+    casefold() список — автодоповнення за префіксом бісекцією.
+    Підказки "можливо, ви мали на увазі" шукаються difflib серед
+    кандидатів: для невеликих графів — серед усіх імен, для великих —
+    серед max_candidates алфавітних сусідів введеного імені.
+    Індекс оновлюється підпискою на зміни графа.
+    """
+
+    def __init__(self, graph, ns, max_candidates=2000):
+        self.graph = graph
+        self.ns = ns
+        self.max_candidates = max_candidates
+        self._names = set()
+        self._folded = []
+
+    def rebuild(self):
+        self._names = {local_name(s) for s in self.graph.subjects(RDF.type, self.ns.User)}
+        self._folded = sorted((name.casefold(), name) for name in self._names)
+
+    def add(self, name):
+        if name not in self._names:
+            self._names.add(name)
+            bisect.insort(self._folded, (name.casefold(), name))
+
+    def discard(self, name):
+        if name in self._names:
+            self._names.discard(name)
+            entry = (name.casefold(), name)
+            i = bisect.bisect_left(self._folded, entry)
+            if i < len(self._folded) and self._folded[i] == entry:
+                del self._folded[i]
+
+    # Обробник змін графа (GraphStore.subscribe)
+    def on_change(self, triple, added):
+        s, p, o = triple
+        if p == RDF.type and o == self.ns.User:
+            if added:
+                self.add(local_name(s))
+            elif (s, RDF.type, self.ns.User) not in self.graph:
+                self.discard(local_name(s))
+
+    def _prefix_range(self, prefix):
+        lo = bisect.bisect_left(self._folded, (prefix,))
+        hi = bisect.bisect_left(self._folded, (prefix + "\U0010ffff",))
+        return lo, hi
+
+    def complete(self, prefix, limit=10):
+        # Імена, що починаються з prefix (без урахування регістру), в алфавітному порядку
+        lo, hi = self._prefix_range(prefix.casefold())
+        return [name for _, name in self._folded[lo:min(hi, lo + limit)]]
+
+    def suggest(self, name, limit=3):
+        folded = name.casefold()
+        if len(self._names) <= self.max_candidates:
+            candidates = [n for _, n in self._folded]
+        else:
+            # Сусіди за алфавітом: помилки після перших літер лишають ім’я поруч
+            middle = bisect.bisect_left(self._folded, (folded,))
+            lo = max(0, middle - self.max_candidates // 2)
+            candidates = [n for _, n in self._folded[lo:lo + self.max_candidates]]
+        return closest(name, candidates, limit)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        return len(self._names)
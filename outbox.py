@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+from metrics import REGISTRY, observe
+
+logger = logging.getLogger(__name__)
+
+# Ліміт довжини текстового повідомлення Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Кошик токенів з резервуванням.
+
+    reserve() завжди забирає токен і повертає, скільки секунд треба
+    почекати до його появи; запас може піти в мінус, тож паралельні
+    виклики отримують зростаючі затримки і не проскакують ліміт разом.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+def _seconds(retry_after):
+    # RetryAfter.retry_after — int або timedelta залежно від налаштувань PTB
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+class RateLimiter(BaseRateLimiter):
+    """Ліміти вихідних запитів до Bot API і повтори після 429.
+
+    Кожен чат має власний кошик (приватні — private_rate повідомлень на
+    секунду, групи — group_rate на хвилину), усі запити ділять спільний
+    кошик на overall_rate за секунду. Якщо Telegram усе ж відповідає
+    RetryAfter, пауза діє на всі запити, а сам запит повторюється до
+    max_retries разів.
+    """
+
+    def __init__(self, overall_rate=30, private_rate=1, group_rate=20, burst=3, max_retries=3, max_chats=10000):
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._overall = TokenBucket(overall_rate, overall_rate)
+        self._chats = OrderedDict()
+        self._paused_until = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.pop(chat_id, None)
+        if bucket is None:
+            # Від'ємні id і @username — групи та канали
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate / 60, self.burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.burst)
+        self._chats[chat_id] = bucket
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return bucket
+
+    async def _throttle(self, endpoint, chat_id):
+        waited = 0.0
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay:
+                await asyncio.sleep(delay)
+                waited += delay
+        delay = max(self._overall.reserve(), self._paused_until - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+        if waited:
+            observe("bot_telegram_throttle_seconds", waited, endpoint=endpoint)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        await self._throttle(endpoint, chat_id if isinstance(chat_id, (int, str)) else None)
+        attempt = 0
+        while True:
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                seconds = _seconds(e.retry_after)
+                REGISTRY.inc("bot_telegram_retry_after_total", endpoint=endpoint)
+                logger.warning(f"⏳ Flood control Telegram: пауза {seconds:.0f} с ({endpoint}, спроба {attempt})")
+                self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+                await asyncio.sleep(seconds)
+
+
+def coalesce(texts, limit=MAX_MESSAGE_LENGTH):
+    # Підряд ідучі тексти склеюються рядками, поки вміщаються в одне повідомлення
+    batch = []
+    size = 0
+    for text in texts:
+        if batch and size + 1 + len(text) > limit:
+            yield "\n".join(batch)
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text) + (1 if size else 0)
+    if batch:
+        yield "\n".join(batch)
+
+
+class Outbox:
+    """Черга вихідних текстових відповідей з об'єднанням.
+
+    send() кладе текст у чергу чату й одразу повертається, тож обробник
+    не чекає на мережу. Для кожного чату працює одна задача: вона
+    забирає все накопичене, склеює підряд ідучі тексти в повідомлення
+    до MAX_MESSAGE_LENGTH символів і надсилає їх по черзі. Порядок
+    відповідей у чаті зберігається; ліміти й повтори — за RateLimiter.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._tasks = {}
+        self.sent = 0
+        self.coalesced = 0
+
+    def send(self, message, text):
+        chat_id = message.chat_id
+        self._pending.setdefault(chat_id, []).append((message, text))
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.get_running_loop().create_task(self._deliver(chat_id))
+
+    async def _deliver(self, chat_id):
+        try:
+            # Дати обробнику дописати решту відповідей цього кроку
+            await asyncio.sleep(0)
+            while self._pending.get(chat_id):
+                batch = self._pending.pop(chat_id)
+                message = batch[0][0]
+                for text in coalesce(text for _, text in batch):
+                    try:
+                        await message.reply_text(text)
+                    except TelegramError as e:
+                        REGISTRY.inc("bot_outbox_errors_total")
+                        logger.error(f"🚨 Не вдалося надіслати відповідь у чат {chat_id}: {e}")
+                        continue
+                    self.sent += 1
+                self.coalesced += len(batch)
+        finally:
+            del self._tasks[chat_id]
+
+    def stats(self):
+        return {"chats": len(self._tasks), "sent": self.sent, "replies": self.coalesced}
+
+    async def drain(self):
+        # Дочекатися доставки всього, що вже в черзі (перед зупинкою бота)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence):
+    """Стан ConversationHandler і user_data у SQLite.
+
+    Application віддає зміни раз на update_interval; усі зміни одного
+    такого проходу записуються однією транзакцією. Записи, не оновлювані
+    довше ttl секунд (покинуті розмови), видаляються при старті і під
+    час запису. Це лише файл: PTB тримає в RAM стан усіх розмов і
+    user_data, доки їх не звільнить IdleSessionSweeper.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, update_interval=5):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.path = path
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS conversations (name TEXT NOT NULL, key TEXT NOT NULL, "
+                           "state TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (name, key))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, "
+                           "data TEXT NOT NULL, updated REAL NOT NULL)")
+        self._conn.commit()
+        self._conversation_updates = {}
+        self._user_updates = {}
+        self._flush_scheduled = False
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        self._conn.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,))
+        self._conn.execute("DELETE FROM user_data WHERE updated < ?", (cutoff,))
+
+    def _schedule_write(self):
+        # Запис після того, як відпрацюють усі update_* поточного проходу
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._write)
+
+    def _write(self):
+        self._flush_scheduled = False
+        if self._conn is None:
+            return
+        conversations, self._conversation_updates = self._conversation_updates, {}
+        users, self._user_updates = self._user_updates, {}
+        now = time.time()
+        with self._conn:
+            for (name, key), state in conversations.items():
+                if state is None:
+                    self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)",
+                                       (name, key, json.dumps(state), now))
+            for user_id, data in users.items():
+                if not data:
+                    self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO user_data VALUES (?, ?, ?)",
+                                       (user_id, json.dumps(data, ensure_ascii=False), now))
+            self._evict()
+
+    async def get_user_data(self):
+        with self._conn:
+            self._evict()
+        return {user_id: json.loads(data) for user_id, data in self._conn.execute("SELECT user_id, data FROM user_data")}
+
+    async def get_conversations(self, name):
+        with self._conn:
+            self._evict()
+        rows = self._conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        self._conversation_updates[(name, json.dumps(list(key)))] = new_state
+        self._schedule_write()
+
+    async def update_user_data(self, user_id, data):
+        self._user_updates[user_id] = data
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._user_updates[user_id] = None
+        self._schedule_write()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def flush(self):
+        self._write()
+        self._conn.close()
+        self._conn = None
+
+    # chat_data, bot_data і callback_data не зберігаються (див. store_data)
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+
+class IdleSessionSweeper:
+    """Звільнення пам'яті від покинутих розмов і user_data.
+
+    ConversationHandler і Application тримають стан кожного користувача,
+    поки розмову не завершено, а conversation_timeout без JobQueue
+    (APScheduler) не працює і не стосується відновлених з диска розмов.
+    Обробник у групі -1 запам'ятовує час останнього оновлення кожного
+    користувача; раз на interval секунд розмови й user_data тих, хто
+    мовчить довше ttl, видаляються — і з RAM, і з persistence.
+    Користувачі, яких ще не бачили (стан відновлено з диска), отримують
+    відлік від першого проходу.
+    """
+
+    def __init__(self, ttl, interval=600):
+        self.ttl = ttl
+        self.interval = interval
+        self.swept = 0
+        self._last_seen = {}
+        self._task = None
+
+    def handler(self):
+        return TypeHandler(Update, self.touch)
+
+    async def touch(self, update, context):
+        if update.effective_user is not None:
+            self._last_seen[update.effective_user.id] = time.monotonic()
+
+    def _stale(self, user_id, now):
+        return self._last_seen.setdefault(user_id, now) < now - self.ttl
+
+    def sweep(self, app):
+        now = time.monotonic()
+        stale = {user_id for user_id in list(app.user_data) if self._stale(user_id, now)}
+        ended = 0
+        for handlers in app.handlers.values():
+            for handler in handlers:
+                if not isinstance(handler, ConversationHandler):
+                    continue
+                # Ключ розмови (chat_id, user_id); END — той самий виклик, що й conversation_timeout у PTB
+                for key in list(handler._conversations):
+                    if self._stale(key[-1], now):
+                        handler._update_state(ConversationHandler.END, key)
+                        stale.add(key[-1])
+                        ended += 1
+        for user_id in stale:
+            app.drop_user_data(user_id)
+            self._last_seen.pop(user_id, None)
+        self.swept += len(stale)
+        return ended, len(stale)
+
+    async def _run(self, app):
+        while True:
+            await asyncio.sleep(self.interval)
+            ended, users = self.sweep(app)
+            if users:
+                logger.info(f"🧹 Завершено покинутих розмов: {ended}, звільнено user_data: {users}")
+
+    def start(self, app):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(app))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,166 @@
+import bisect
+
+import rdflib
+
+from catalog import local_name
+
+RDF = rdflib.RDF
+RDFS = rdflib.RDFS
+OWL = rdflib.OWL
+
+
+def _value(graph, subject, predicate, cast):
+    value = graph.value(subject, predicate)
+    if value is None:
+        return None
+    try:
+        return cast(value.toPython())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProfileView:
+    """Матеріалізований профіль кожного користувача.
+
+    Містить поля профілю, розгорнутий через каталог список тренувань
+    (ex:маєРекомендацію разом з оберненою ex:рекомендуєтьсяДля) і підсумки. Профіль перебудовується точково,
+    коли змінюються триплети користувача або його тренувань; підписники
+    (subscribe) отримують ім'я кожного перебудованого профілю.
+    """
+
+    def __init__(self, graph, ns, catalog, schema):
+        self.graph = graph
+        self.ns = ns
+        self.catalog = catalog
+        self.schema = schema
+        self._profiles = {}
+        # тренування -> користувачі, яким воно рекомендоване
+        self._by_workout = {}
+        # Відсортовані індекси для сторінок /users і фільтрів
+        self._names = []
+        self._by_level = {}
+        self._by_bmi = []
+        self._listeners = []
+
+    # callback(name) після кожної зміни або видалення профілю
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def rebuild(self):
+        self._profiles = {}
+        self._by_workout = {}
+        self._names = []
+        self._by_level = {}
+        self._by_bmi = []
+        for user in self.graph.subjects(RDF.type, self.ns.User):
+            self._refresh(user)
+
+    def _refresh(self, uri):
+        name = local_name(uri)
+        old = self._profiles.pop(name, None)
+        if old is not None:
+            for workout in old["workout_ids"]:
+                self._by_workout.get(workout, set()).discard(name)
+            self._unindex(old)
+        if (uri, RDF.type, self.ns.User) not in self.graph:
+            self._changed(name)
+            return
+
+        ex = self.ns
+        workout_ids = sorted(local_name(w) for w in self.schema.related(uri, ex.маєРекомендацію))
+        workouts = [self._resolve(w) for w in workout_ids]
+        level = self.graph.value(uri, ex.рівеньФітнесу)
+        experience = self.graph.value(uri, ex.досвід)
+        self._profiles[name] = {
+            "name": name,
+            "age": _value(self.graph, uri, ex.вік, int),
+            "height": _value(self.graph, uri, ex.зріст, float),
+            "weight": _value(self.graph, uri, ex.вага, float),
+            "bmi": _value(self.graph, uri, ex.індексМасиТіла, float),
+            "level": local_name(level) if level is not None else None,
+            "experience": local_name(experience) if experience is not None else None,
+            "workout_ids": workout_ids,
+            "workouts": workouts,
+            "total_calories": sum(w["calories"] or 0.0 for w in workouts),
+        }
+        for workout in workout_ids:
+            self._by_workout.setdefault(workout, set()).add(name)
+        self._index(self._profiles[name])
+        self._changed(name)
+
+    def _changed(self, name):
+        for callback in self._listeners:
+            callback(name)
+
+    @staticmethod
+    def _discard(sorted_list, item):
+        i = bisect.bisect_left(sorted_list, item)
+        if i < len(sorted_list) and sorted_list[i] == item:
+            del sorted_list[i]
+
+    def _index(self, profile):
+        bisect.insort(self._names, profile["name"])
+        if profile["level"] is not None:
+            bisect.insort(self._by_level.setdefault(profile["level"], []), profile["name"])
+        if profile["bmi"] is not None:
+            bisect.insort(self._by_bmi, (profile["bmi"], profile["name"]))
+
+    def _unindex(self, profile):
+        self._discard(self._names, profile["name"])
+        if profile["level"] is not None:
+            self._discard(self._by_level.get(profile["level"], []), profile["name"])
+        if profile["bmi"] is not None:
+            self._discard(self._by_bmi, (profile["bmi"], profile["name"]))
+
+    def _resolve(self, workout_id):
+        entry = self.catalog.get(workout_id)
+        if entry is not None:
+            return entry
+        # Тренування без типу ex:Workout — показуємо хоча б ім'я
+        return {"uri": workout_id, "назва": workout_id, "exercise": None, "intensity": None,
+                "intensity_label": None, "duration": None, "sets": None, "calories": None}
+
+    # Обробник змін графа (GraphStore.subscribe); підписувати після SchemaIndex і каталогу
+    def on_change(self, triple, added):
+        s, p, o = triple
+        name = local_name(s)
+        if p == OWL.inverseOf:
+            self.rebuild()
+        elif p == self.schema.inverse(self.ns.маєРекомендацію):
+            # Рекомендація, записана з боку тренування: змінюється профіль користувача-об'єкта
+            self._refresh(o)
+        elif name in self._profiles or (p == RDF.type and o == self.ns.User):
+            self._refresh(s)
+        elif name in self._by_workout:
+            for user in list(self._by_workout[name]):
+                self._refresh(self.ns[user])
+        elif p == RDFS.label:
+            for workout in self.catalog.workouts():
+                if workout["intensity"] == name:
+                    for user in list(self._by_workout.get(workout["uri"], ())):
+                        self._refresh(self.ns[user])
+
+    def get(self, name):
+        return self._profiles.get(name)
+
+    def page(self, offset=0, limit=20, level=None, bmi_min=None, bmi_max=None):
+        # Повертає (кількість, профілі сторінки) в порядку імен, без обходу графа
+        if level is not None:
+            names = self._by_level.get(level, [])
+        else:
+            names = self._names
+        if bmi_min is not None or bmi_max is not None:
+            lo, hi = 0, len(self._by_bmi)
+            if bmi_min is not None:
+                lo = bisect.bisect_left(self._by_bmi, (bmi_min,))
+            if bmi_max is not None:
+                hi = bisect.bisect_right(self._by_bmi, (bmi_max, "\U0010ffff"))
+            in_range = {name for _, name in self._by_bmi[lo:hi]}
+            names = [n for n in names if n in in_range] if level is not None else sorted(in_range)
+        return len(names), [self._profiles[n] for n in names[offset:offset + limit]]
+
+    def __contains__(self, name):
+        return name in self._profiles
+
+    def __len__(self):
+        return len(self._profiles)
@@ -0,0 +1,145 @@
+import datetime
+import sqlite3
+import threading
+from array import array
+
+import numpy as np
+import rdflib
+
+from catalog import local_name
+
+RDF = rdflib.RDF
+XSD = rdflib.XSD
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day(date):
+    return (date - EPOCH).days
+
+
+def from_day(day):
+    return EPOCH + datetime.timedelta(days=int(day))
+
+
+class ProgressStore:
+    """Часовий ряд виконаних тренувань (ex:Progress) по користувачах.
+
+    У пам'яті кожен користувач має колонкові буфери array (день, калорії,
+    код тренування), які NumPy читає без копіювання для агрегацій.
+    Записи також дописуються в SQLite, тож переживають перезапуск;
+    RDF граф використовується лише як формат експорту/імпорту.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._series = {}
+        self._workouts = []
+        self._workout_codes = {}
+
+    def load(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS progress (user TEXT NOT NULL, day INTEGER NOT NULL, "
+            "calories REAL NOT NULL, workout TEXT NOT NULL)")
+        self._conn.commit()
+        for user, day, calories, workout in self._conn.execute(
+                "SELECT user, day, calories, workout FROM progress ORDER BY rowid"):
+            self._append(user, day, calories, workout)
+        return self
+
+    def _code(self, workout):
+        code = self._workout_codes.get(workout)
+        if code is None:
+            code = self._workout_codes[workout] = len(self._workouts)
+            self._workouts.append(workout)
+        return code
+
+    def _append(self, user, day, calories, workout):
+        series = self._series.get(user)
+        if series is None:
+            series = self._series[user] = (array("i"), array("f"), array("i"))
+        days, cals, workouts = series
+        days.append(day)
+        cals.append(calories)
+        workouts.append(self._code(workout))
+
+    def log(self, user, entries, date=None):
+        # entries: [(ідентифікатор тренування, калорії)]
+        day = to_day(date or datetime.date.today())
+        rows = [(user, day, float(calories or 0.0), workout) for workout, calories in entries]
+        with self._lock:
+            if self._conn is not None:
+                self._conn.executemany("INSERT INTO progress (user, day, calories, workout) VALUES (?, ?, ?, ?)", rows)
+                self._conn.commit()
+            for row in rows:
+                self._append(*row)
+        return len(rows)
+
+    def series(self, user):
+        series = self._series.get(user)
+        if series is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int32)
+        days, cals, workouts = series
+        return (np.frombuffer(days, dtype=np.int32), np.frombuffer(cals, dtype=np.float32),
+                np.frombuffer(workouts, dtype=np.int32))
+
+    def rollup(self, user, period="week", last=4):
+        # Повертає [(мітка періоду, калорії, кількість тренувань)] для останніх `last` періодів
+        days, cals, _ = self.series(user)
+        if not len(days):
+            return []
+        if period == "week":
+            # 1970-01-01 — четвер, тож +3 вирівнює тижні на понеділок
+            keys = (days.astype(np.int64) + 3) // 7
+        else:
+            keys = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        periods, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=cals)
+        counts = np.bincount(inverse)
+        result = []
+        for key, total, count in list(zip(periods, totals, counts))[-last:]:
+            if period == "week":
+                start = from_day(key * 7 - 3)
+                label = f"{start.isocalendar()[0]}-W{start.isocalendar()[1]:02d}"
+            else:
+                label = str(np.datetime64(int(key), "M"))
+            result.append((label, float(total), int(count)))
+        return result
+
+    def import_rdf(self, graph, ns):
+        # Одноразовий перенос наявних ex:Progress з графа, якщо сховище порожнє
+        if self._series:
+            return 0
+        imported = 0
+        for p in graph.subjects(RDF.type, ns.Progress):
+            user = graph.value(p, ns.належитьКористувачу)
+            date = graph.value(p, ns.датаПрогресу)
+            if user is None or date is None:
+                continue
+            calories = graph.value(p, ns.досягнутіКалорії)
+            workout = graph.value(p, ns.виконанеТренування)
+            imported += self.log(local_name(user),
+                                 [(local_name(workout) if workout is not None else "",
+                                   float(calories.toPython()) if calories is not None else 0.0)],
+                                 date=date.toPython())
+        return imported
+
+    def rdf_triples(self, ns):
+        # ex:Progress у форматі, який читає import_rdf (bulk.py export --kind progress)
+        for user, (days, cals, workouts) in self._series.items():
+            for i, (day, calories, code) in enumerate(zip(days, cals, workouts)):
+                node = ns[f"Progress_{user}_{i + 1}"]
+                yield node, RDF.type, ns.Progress
+                yield node, ns.датаПрогресу, rdflib.Literal(from_day(day), datatype=XSD.date)
+                yield node, ns.досягнутіКалорії, rdflib.Literal(float(calories), datatype=XSD.float)
+                yield node, ns.належитьКористувачу, ns[user]
+                if self._workouts[code]:
+                    yield node, ns.виконанеТренування, ns[self._workouts[code]]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
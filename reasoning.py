@@ -0,0 +1,96 @@
+import rdflib
+
+RDF = rdflib.RDF
+RDFS = rdflib.RDFS
+OWL = rdflib.OWL
+
+
+class SchemaIndex:
+    """Матеріалізоване замикання rdfs:subClassOf і пари owl:inverseOf.
+
+    Будується один раз при завантаженні графа; при додаванні аксіом
+    замикання доповнюється точково, при видаленні — перераховується.
+    Перевірка належності до класу стає пошуком у множині замість
+    обчислення шляху rdfs:subClassOf* при кожному запиті.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._parents = {}
+        self._ancestors = {}
+        self._descendants = {}
+        self._inverse = {}
+
+    def rebuild(self):
+        self._parents = {}
+        for sub, sup in self.graph.subject_objects(RDFS.subClassOf):
+            self._parents.setdefault(sub, set()).add(sup)
+        self._ancestors = {}
+        self._descendants = {}
+        for cls in list(self._parents):
+            self._close(cls)
+        self._inverse = {}
+        for p, q in self.graph.subject_objects(OWL.inverseOf):
+            self._add_inverse(p, q)
+
+    def _close(self, cls):
+        seen = set()
+        stack = [cls]
+        while stack:
+            current = stack.pop()
+            for sup in self._parents.get(current, ()):
+                if sup not in seen:
+                    seen.add(sup)
+                    stack.append(sup)
+        self._ancestors[cls] = seen
+        for sup in seen:
+            self._descendants.setdefault(sup, set()).add(cls)
+
+    def _add_subclass(self, sub, sup):
+        self._parents.setdefault(sub, set()).add(sup)
+        # Усі нащадки sub (і він сам) отримують sup та його предків
+        new_ancestors = {sup} | self._ancestors.get(sup, set())
+        for cls in {sub} | self._descendants.get(sub, set()):
+            ancestors = self._ancestors.setdefault(cls, set())
+            for a in new_ancestors - ancestors:
+                ancestors.add(a)
+                self._descendants.setdefault(a, set()).add(cls)
+
+    def _add_inverse(self, p, q):
+        self._inverse[p] = q
+        self._inverse[q] = p
+
+    # Обробник змін графа (GraphStore.subscribe); підписувати до каталогу
+    def on_change(self, triple, added):
+        s, p, o = triple
+        if p == RDFS.subClassOf:
+            if added:
+                self._add_subclass(s, o)
+            else:
+                self.rebuild()
+        elif p == OWL.inverseOf:
+            if added:
+                self._add_inverse(s, o)
+            else:
+                self.rebuild()
+
+    def subclasses(self, cls):
+        # Клас разом з усіма його підкласами (як rdfs:subClassOf*)
+        return {cls} | self._descendants.get(cls, set())
+
+    def is_subclass(self, sub, sup):
+        return sub == sup or sup in self._ancestors.get(sub, ())
+
+    def is_instance(self, subject, cls):
+        return any(self.is_subclass(t, cls) for t in self.graph.objects(subject, RDF.type))
+
+    def inverse(self, prop):
+        return self._inverse.get(prop)
+
+    def related(self, subject, prop):
+        # Об'єкти prop разом із суб'єктами оберненої властивості
+        result = set(self.graph.objects(subject, prop))
+        inverse = self._inverse.get(prop)
+        if inverse is not None:
+            result.update(self.graph.subjects(inverse, subject))
+        return result
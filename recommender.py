@@ -0,0 +1,178 @@
+import numpy as np
+import rdflib
+
+from catalog import local_name
+
+RDF = rdflib.RDF
+
+# Числові шкали для рівнів підготовки та інтенсивності
+LEVELS = {"Beginner": 1.0, "Intermediate": 2.0, "Advanced": 3.0}
+INTENSITIES = {"Low": 1.0, "Medium": 2.0, "Moderate": 2.0, "High": 3.0, "Висока": 3.0}
+
+# Ваги складових оцінки
+WEIGHTS = {"goal": 0.35, "level": 0.25, "calories": 0.2, "intensity": 0.1, "category": 0.1}
+
+
+class RecommendationEngine:
+    """Ранжування тренувань для користувача за онтологією.
+
+    Ознаки всіх тренувань зібрані в матрицю NumPy (калорії, рівень,
+    інтенсивність, категорія, придатність для цілей), тому оцінка
+    для користувача — кілька векторних операцій над усім каталогом.
+    Матриця перебудовується ліниво, коли змінюються тренування чи цілі.
+    """
+
+    def __init__(self, graph, ns, catalog, schema):
+        self.graph = graph
+        self.ns = ns
+        self.catalog = catalog
+        self.schema = schema
+        self._dirty = True
+        self.workout_ids = []
+        self.goal_ids = []
+        self.goals = {}
+
+    # Обробник змін графа (GraphStore.subscribe)
+    def on_change(self, triple, added):
+        s, p, o = triple
+        name = local_name(s)
+        if name in self.catalog or name in self.goals:
+            self._dirty = True
+        elif p == RDF.type and (self.schema.is_subclass(o, self.ns.Workout)
+                                or self.schema.is_subclass(o, self.ns.TrainingGoal)):
+            self._dirty = True
+
+    def _build(self):
+        ex = self.ns
+        workouts = self.catalog.workouts()
+        self.workout_ids = [w["uri"] for w in workouts]
+        self._workout_index = {w: i for i, w in enumerate(self.workout_ids)}
+
+        goal_uris = set()
+        for goal_type in self.schema.subclasses(ex.TrainingGoal):
+            goal_uris.update(self.graph.subjects(RDF.type, goal_type))
+        self.goal_ids = sorted(local_name(g) for g in goal_uris)
+        self.goals = {}
+        for g in sorted(goal_uris):
+            calories = self.graph.value(g, ex.цільовіКалорії)
+            intensity = self.graph.value(g, ex.інтенсивністьЦілі)
+            self.goals[local_name(g)] = {
+                "calories": float(calories.toPython()) if calories is not None else None,
+                "type": str(self.graph.value(g, ex.необхіднийТипТренування) or ""),
+                "intensity": INTENSITIES.get(local_name(intensity)) if intensity is not None else None,
+            }
+
+        n = len(workouts)
+        self.calories = np.array([w["calories"] or 0.0 for w in workouts], dtype=float)
+        self.intensity = np.array([INTENSITIES.get(w["intensity"], 2.0) for w in workouts], dtype=float)
+        self.required_level = np.ones(n)
+        self.categories = []
+        # Матриця придатності: тренування x ціль
+        self.suitability = np.zeros((n, len(self.goal_ids)))
+        goal_index = {g: j for j, g in enumerate(self.goal_ids)}
+        for i, w in enumerate(workouts):
+            uri = ex[w["uri"]]
+            required = self.graph.value(uri, ex.вимагаєДосвиду)
+            if required is not None:
+                self.required_level[i] = LEVELS.get(local_name(required), 1.0)
+            self.categories.append(self._category(uri))
+            for goal in self.graph.objects(uri, ex.підходитьДля):
+                j = goal_index.get(local_name(goal))
+                if j is not None:
+                    self.suitability[i, j] = 1.0
+            # Тренування без явного ex:підходитьДля підходить цілям свого типу
+            for j, g in enumerate(self.goal_ids):
+                if self.goals[g]["type"] and self.goals[g]["type"] == self.categories[i]:
+                    self.suitability[i, j] = max(self.suitability[i, j], 0.5)
+        self.categories, self._category_codes = np.unique(np.array(self.categories, dtype=str), return_inverse=True)
+        self._goal_index = goal_index
+        self._dirty = False
+
+    def _category(self, uri):
+        ex = self.ns
+        category = self.graph.value(uri, ex.категорія)
+        if category is not None:
+            return str(category)
+        if self.schema.is_instance(uri, ex.CardioWorkout):
+            return "Cardio"
+        if self.schema.is_instance(uri, ex.StrengthWorkout):
+            return "Strength"
+        return ""
+
+    def user_goals(self, name, profile):
+        explicit = [local_name(g) for g in self.graph.objects(self.ns[name], self.ns.маєЦіль)]
+        goals = [g for g in explicit if g in self.goals]
+        if goals:
+            return goals
+        # Ціль не задано — виводимо з ІМТ
+        bmi = profile.get("bmi")
+        if bmi is None or 18.5 <= bmi < 25:
+            return []
+        wanted = "Cardio" if bmi >= 25 else "Strength"
+        return [g for g in self.goal_ids if self.goals[g]["type"] == wanted]
+
+    def score(self, name, profile):
+        if self._dirty:
+            self._build()
+        n = len(self.workout_ids)
+        if not n:
+            return np.zeros(0)
+
+        # Рівень: тренування понад рівень користувача штрафуються сильніше
+        user_level = LEVELS.get(profile.get("level"), 1.0)
+        gap = self.required_level - user_level
+        level_fit = np.where(gap > 0, 1.0 - 0.5 * gap, 1.0 - 0.15 * -gap).clip(0.0, 1.0)
+
+        goals = self.user_goals(name, profile)
+        if goals:
+            idx = [self._goal_index[g] for g in goals]
+            goal_fit = self.suitability[:, idx].max(axis=1)
+            targets = [self.goals[g]["calories"] for g in goals if self.goals[g]["calories"]]
+            target = float(np.mean(targets)) if targets else float(self.calories.max() or 1.0)
+            calorie_fit = 1.0 - np.minimum(np.abs(self.calories - target) / target, 1.0)
+            intensities = [self.goals[g]["intensity"] for g in goals if self.goals[g]["intensity"]]
+            wanted_intensity = float(np.mean(intensities)) if intensities else 2.0
+        else:
+            goal_fit = np.full(n, 0.5)
+            calorie_fit = self.calories / (self.calories.max() or 1.0)
+            wanted_intensity = user_level + 0.5
+        intensity_fit = 1.0 - np.abs(self.intensity - wanted_intensity) / 2.0
+
+        # Історія: улюблена категорія користувача отримує бонус
+        done = self._done_mask(profile)
+        if done.any():
+            counts = np.bincount(self._category_codes[done], minlength=len(self.categories))
+            category_fit = (counts / done.sum())[self._category_codes]
+        else:
+            category_fit = np.full(n, 0.5)
+
+        return (WEIGHTS["goal"] * goal_fit + WEIGHTS["level"] * level_fit + WEIGHTS["calories"] * calorie_fit
+                + WEIGHTS["intensity"] * intensity_fit.clip(0.0, 1.0) + WEIGHTS["category"] * category_fit)
+
+    def _done_mask(self, profile):
+        done = np.zeros(len(self.workout_ids), dtype=bool)
+        idx = [self._workout_index[w] for w in profile.get("workout_ids", ()) if w in self._workout_index]
+        done[idx] = True
+        return done
+
+    def top_k(self, name, profile, k=3, exclude_done=True):
+        scores = self.score(name, profile)
+        if not len(scores):
+            return []
+        if exclude_done:
+            scores = np.where(self._done_mask(profile), -np.inf, scores)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.workout_ids[i], float(scores[i])) for i in top]
+
+
+def priority(score):
+    # Шкала пріоритету як у ex:пріоритетРекомендації
+    if score >= 0.75:
+        return "High"
+    if score >= 0.5:
+        return "Medium"
+    return "Low"
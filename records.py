@@ -0,0 +1,112 @@
+import re
+
+import rdflib
+
+RDF = rdflib.RDF
+XSD = rdflib.XSD
+
+# Правила введення, спільні для розмови /create_user і bulk.py
+NAME_RE = re.compile(r"^[\w\-]+$")
+LEVELS = ("Beginner", "Intermediate", "Advanced")
+
+
+def valid_name(name):
+    return bool(NAME_RE.match(name))
+
+
+def parse_name(value):
+    name = str(value).strip()
+    if not valid_name(name):
+        raise ValueError(f"некоректне ім’я: {value!r}")
+    return name
+
+
+def parse_age(value):
+    age = int(value)
+    if not (0 < age < 120):
+        raise ValueError(f"вік поза межами 1–119: {value!r}")
+    return age
+
+
+def parse_height(value):
+    height = float(value)
+    if not (0.5 < height < 3):
+        raise ValueError(f"зріст поза межами 0.5–3 м: {value!r}")
+    return height
+
+
+def parse_weight(value):
+    weight = float(value)
+    if not (10 < weight < 300):
+        raise ValueError(f"вага поза межами 10–300 кг: {value!r}")
+    return weight
+
+
+def parse_level(value):
+    level = str(value or "Beginner").strip()
+    if level not in LEVELS:
+        raise ValueError(f"невідомий рівень: {value!r}")
+    return level
+
+
+def bmi(height, weight):
+    return round(weight / (height * height), 1)
+
+
+def user_triples(ns, name, age, height, weight, bmi, level="Beginner"):
+    uri = ns[name]
+    return [
+        (uri, RDF.type, ns.User),
+        (uri, ns.вік, rdflib.Literal(age, datatype=XSD.integer)),
+        (uri, ns.зріст, rdflib.Literal(height, datatype=XSD.float)),
+        (uri, ns.вага, rdflib.Literal(weight, datatype=XSD.float)),
+        (uri, ns.індексМасиТіла, rdflib.Literal(bmi, datatype=XSD.float)),
+        (uri, ns.рівеньФітнесу, ns[level]),
+        (uri, ns.досвід, ns[level]),
+    ]
+
+
+def _optional_int(value):
+    if value is None or value == "":
+        return None
+    number = int(value)
+    if number <= 0:
+        raise ValueError(f"очікується додатне число: {value!r}")
+    return number
+
+
+def parse_workout(record):
+    # Запис у форматі списку predefined з bot.py
+    uri = parse_name(record.get("uri", ""))
+    title = str(record.get("назва") or "").strip()
+    if not title:
+        raise ValueError("порожня назва")
+    intensity = parse_name(record.get("intensity", ""))
+    calories = float(record.get("calories"))
+    if calories < 0:
+        raise ValueError(f"від'ємні калорії: {record.get('calories')!r}")
+    return {
+        "uri": uri,
+        "назва": title,
+        "exercise": str(record.get("exercise") or title).strip(),
+        "intensity": intensity,
+        "duration": _optional_int(record.get("duration")),
+        "calories": calories,
+        "sets": _optional_int(record.get("sets")),
+    }
+
+
+def workout_triples(ns, w):
+    workout_uri = ns[w["uri"]]
+    triples = [
+        (workout_uri, RDF.type, ns.Workout),
+        (workout_uri, ns.назва, rdflib.Literal(w["назва"], lang="uk")),
+        (workout_uri, ns.вправа, rdflib.Literal(w["exercise"], lang="uk")),
+        (workout_uri, ns.інтенсивність, ns[w["intensity"]]),
+    ]
+    if w["sets"] is not None:
+        triples.append((workout_uri, ns.кількістьПідходів, rdflib.Literal(w["sets"], datatype=XSD.integer)))
+    if w["duration"] is not None:
+        triples.append((workout_uri, ns.тривалість, rdflib.Literal(w["duration"], datatype=XSD.integer)))
+    triples.append((workout_uri, ns.спаленіКалорії, rdflib.Literal(w["calories"], datatype=XSD.float)))
+    return triples
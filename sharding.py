@@ -0,0 +1,483 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import heapq
+import logging
+import os
+import re
+from collections import OrderedDict
+
+import aiohttp
+from aiohttp import web
+
+from webhook import SECRET_HEADER, UpdateDeduplicator
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EX = "http://example.org/training#"
+NAME_RE = re.compile(r"^[\w\-]+$")
+
+# Команди, другим повідомленням яких є ім'я користувача (ex:{name})
+NAME_COMMANDS = {"create_user", "add_workout", "recommendations", "myworkouts", "stats", "log"}
+
+# Поле оновлення, яке ставить диспетчер на повторах для вузла-власника:
+# обробник мовчки відновлює стан розмови, бо запит користувач уже бачив
+REPLAY_FIELD = "shard_replay"
+
+# Поля профілю, які вузли віддають для /users
+SUMMARY_FIELDS = ("name", "age", "height", "weight", "bmi", "level")
+
+
+def user_key(name):
+    return f"ex:{name}"
+
+
+def _replay(data, text=None):
+    data = dict(data, **{REPLAY_FIELD: True})
+    if text is not None:
+        key = "message" if "message" in data else "edited_message"
+        # CommandHandler розпізнає команду лише за сутністю bot_command
+        data[key] = dict(data[key], text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(text)}])
+    return data
+
+
+def shard_path(path, index):
+    # SPARQL.ttl -> SPARQL.shard0.ttl
+    base, ext = os.path.splitext(path)
+    return f"{base}.shard{index}{ext}"
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Консистентне хешування ключів на вузли (з віртуальними точками)."""
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        self._points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._keys = [point for point, _ in self._points]
+
+    def node_for(self, key):
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._points[i][1]
+
+
+class ShardRouter:
+    """Вибір вузла для кожного оновлення Telegram.
+
+    Користувачі графа розподілені за ключем ex:{name}, але ім'я приходить
+    лише другим повідомленням розмови. Команда з NAME_COMMANDS одразу йде
+    на вузол за Telegram user id, який і надсилає запит імені. Коректне
+    ім'я закріплює сесію за вузлом-власником: якщо це інший вузол, він
+    отримує повтор команди (REPLAY_FIELD) разом з іменем, а перший вузол —
+    мовчазний /cancel. Некоректне ім'я лишається на першому вузлі, який
+    попросить ввести його ще раз. Подальші повідомлення чату липнуть до
+    закріпленого вузла до наступної команди. Решта оновлень
+    розподіляється за Telegram user id.
+    """
+
+    def __init__(self, ring, max_sessions=10000):
+        self.ring = ring
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def _start_session(self, key, data, node):
+        self._sessions[key] = {"node": None, "prompted": node, "command": data}
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def route(self, data):
+        # Повертає [(вузол, [оновлення])] у порядку доставки
+        message = data.get("message") or data.get("edited_message")
+        sender = (message or data.get("callback_query") or data.get("inline_query") or {}).get("from")
+        if sender is None:
+            return [(self.ring.node_for(str(data.get("update_id"))), [data])]
+        default = self.ring.node_for(f"tg:{sender['id']}")
+        if message is None:
+            return [(default, [data])]
+
+        key = (message["chat"]["id"], sender["id"])
+        text = (message.get("text") or "").strip()
+        session = self._sessions.get(key)
+        if text.startswith("/"):
+            command = text[1:].split(maxsplit=1)[0].split("@")[0] if len(text) > 1 else ""
+            if command in NAME_COMMANDS:
+                self._start_session(key, data, default)
+                return [(default, [data])]
+            self._sessions.pop(key, None)
+            if command == "cancel" and session is not None and session["node"] is not None:
+                return [(session["node"], [data])]
+            return [(default, [data])]
+
+        if session is None:
+            return [(default, [data])]
+        if session["node"] is None:
+            prompted = session["prompted"]
+            if not NAME_RE.match(text):
+                return [(prompted, [data])]
+            owner = session["node"] = self.ring.node_for(user_key(text))
+            if owner == prompted:
+                return [(owner, [data])]
+            # update_id імені перший вузол ще не бачив — дедуплікація не відкине /cancel
+            return [(prompted, [_replay(data, "/cancel")]), (owner, [_replay(session["command"]), data])]
+        return [(session["node"], [data])]
+
+
+class Shard:
+    """Вузол кластера бота: власник частини користувачів графа.
+
+    Вузол i з peers обслуговує користувачів, чий ключ ex:{name} лягає
+    на нього в HashRing. Запити про всіх користувачів (/users, підказки
+    й автодоповнення імен, /leaderboard, /cohorts, перцентилі /stats)
+    розсилаються на всі вузли й зливаються.
+    """
+
+    def __init__(self, index, peers, secret_token=None):
+        self.index = index
+        self.peers = list(peers)
+        self.secret_token = secret_token
+        self.ring = HashRing(range(len(self.peers)))
+
+    @classmethod
+    def from_env(cls):
+        index = os.environ.get("BOT_SHARD_INDEX")
+        if index is None:
+            return None
+        peers = [p.strip().rstrip("/") for p in os.environ.get("BOT_SHARD_PEERS", "").split(",") if p.strip()]
+        return cls(int(index), peers, secret_token=os.environ.get("BOT_WEBHOOK_SECRET"))
+
+    @property
+    def url(self):
+        return self.peers[self.index]
+
+    def path(self, path):
+        return shard_path(path, self.index)
+
+    def owns(self, name):
+        return self.ring.node_for(user_key(name)) == self.index
+
+    @staticmethod
+    def replayed(update):
+        # Повтор від диспетчера: запит імені користувач уже отримав від іншого вузла
+        return bool(update.api_kwargs.get(REPLAY_FIELD))
+
+    def _authorized(self, request):
+        return not self.secret_token or request.headers.get(SECRET_HEADER) == self.secret_token
+
+    def routes(self, profiles, user_names, user_stats):
+        # Ендпоінти вузла для розсилки /users, пошуку імен і статистики
+        async def handle_users(request):
+            if not self._authorized(request):
+                return web.Response(status=403)
+            q = request.query
+            total, page = profiles.page(0, int(q.get("limit", 20)), level=q.get("level") or None,
+                                        bmi_min=float(q["bmi_min"]) if q.get("bmi_min") else None,
+                                        bmi_max=float(q["bmi_max"]) if q.get("bmi_max") else None)
+            return web.json_response({"total": total, "profiles": [{k: p[k] for k in SUMMARY_FIELDS} for p in page]})
+
+        async def handle_names(request):
+            if not self._authorized(request):
+                return web.Response(status=403)
+            q = request.query
+            search = user_names.suggest if q.get("mode") == "suggest" else user_names.complete
+            found = search(q.get("query", ""), limit=int(q.get("limit", 10)))
+            return web.json_response({"names": [_name_summary(profiles, name) for name in found]})
+
+        async def handle_stats(request):
+            if not self._authorized(request):
+                return web.Response(status=403)
+            q = request.query
+            try:
+                if q.get("kind") == "population":
+                    values = {c: user_stats.sorted_values(c).tolist() for c in q.get("columns", "").split(",")}
+                    return web.json_response({"users": len(user_stats), "values": values})
+                if q.get("kind") == "leaderboard":
+                    top = user_stats.leaderboard(q["column"], limit=int(q.get("limit", 10)), level=q.get("level") or None)
+                    return web.json_response({"top": top})
+                if q.get("kind") == "cohorts":
+                    return web.json_response({"cohorts": user_stats.cohort_sums()})
+            except (KeyError, ValueError):
+                pass
+            return web.Response(status=400)
+
+        return [("GET", "/shard/users", handle_users), ("GET", "/shard/names", handle_names),
+                ("GET", "/shard/stats", handle_stats)]
+
+    async def _fetch(self, session, peer, path, params, parse):
+        headers = {SECRET_HEADER: self.secret_token} if self.secret_token else {}
+        try:
+            async with session.get(f"{peer}{path}", params=params, headers=headers) as response:
+                response.raise_for_status()
+                return parse(await response.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            logger.error(f"🚨 Вузол {peer} недоступний: {e}")
+            return None
+
+    async def _gather(self, path, params, parse):
+        # Відповіді всіх інших вузлів; недоступні вузли пропускаються
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            remote = await asyncio.gather(*(self._fetch(session, peer, path, params, parse)
+                                            for i, peer in enumerate(self.peers) if i != self.index))
+        return [r for r in remote if r is not None]
+
+    async def gather_page(self, profiles, offset=0, limit=20, level=None, bmi_min=None, bmi_max=None):
+        # Кожен вузол віддає перші offset + limit своїх профілів; злиття за іменем
+        params = {"limit": str(offset + limit)}
+        if level is not None:
+            params["level"] = level
+        if bmi_min is not None:
+            params["bmi_min"] = str(bmi_min)
+        if bmi_max is not None:
+            params["bmi_max"] = str(bmi_max)
+        local_total, local_page = profiles.page(0, offset + limit, level=level, bmi_min=bmi_min, bmi_max=bmi_max)
+        remote = await self._gather("/shard/users", params, lambda body: (body["total"], body["profiles"]))
+        total = local_total + sum(t for t, _ in remote)
+        pages = [[{k: p[k] for k in SUMMARY_FIELDS} for p in local_page]] + [page for _, page in remote]
+        merged = heapq.merge(*pages, key=lambda p: p["name"])
+        return total, list(merged)[offset:offset + limit]
+
+    async def gather_names(self, user_names, profiles, query, limit=10, mode="complete"):
+        # Автодоповнення (mode="complete") або підказки ("suggest") з імен усіх вузлів
+        from names import closest
+
+        params = {"query": query, "limit": str(limit), "mode": mode}
+        search = user_names.suggest if mode == "suggest" else user_names.complete
+        local = [_name_summary(profiles, name) for name in search(query, limit=limit)]
+        remote = await self._gather("/shard/names", params, lambda body: body["names"])
+        found = {p["name"]: p for p in local}
+        for names in remote:
+            found.update((p["name"], p) for p in names)
+        if mode == "suggest":
+            ranked = closest(query, list(found), limit)
+        else:
+            ranked = sorted(found, key=lambda name: (name.casefold(), name))[:limit]
+        return [found[name] for name in ranked]
+
+
+    # Статистика по всіх вузлах: кожен віддає свою частину, злиття тут (numpy імпортується лише на вузлах)
+    async def gather_population(self, user_stats, columns):
+        # (кількість користувачів, {колонка: відсортовані значення всіх вузлів})
+        from stats import merge_sorted
+
+        params = {"kind": "population", "columns": ",".join(columns)}
+        remote = await self._gather("/shard/stats", params, lambda body: (body["users"], body["values"]))
+        users = len(user_stats) + sum(u for u, _ in remote)
+        return users, {c: merge_sorted([user_stats.sorted_values(c)] + [values[c] for _, values in remote])
+                       for c in columns}
+
+    async def gather_leaderboard(self, user_stats, column, limit=10, level=None):
+        from stats import merge_leaderboards
+
+        params = {"kind": "leaderboard", "column": column, "limit": str(limit)}
+        if level is not None:
+            params["level"] = level
+        remote = await self._gather("/shard/stats", params, lambda body: body["top"])
+        local = user_stats.leaderboard(column, limit=limit, level=level)
+        return [tuple(entry) for entry in merge_leaderboards([local] + remote, limit)]
+
+    async def gather_cohorts(self, user_stats):
+        from stats import cohort_means, merge_cohort_sums
+
+        remote = await self._gather("/shard/stats", {"kind": "cohorts"}, lambda body: body["cohorts"])
+        return cohort_means(merge_cohort_sums([user_stats.cohort_sums()] + remote))
+
+
+def _name_summary(profiles, name):
+    profile = profiles.get(name) or {}
+    return {"name": name, "level": profile.get("level"), "bmi": profile.get("bmi")}
+
+
+class ShardDispatcher:
+    """Фронт кластера: отримує оновлення Telegram і пересилає вузлам.
+
+    Для кожного вузла окрема черга й відправник, тож порядок оновлень
+    одного чату зберігається. Недоступний вузол отримує повтори з паузою.
+    """
+
+    def __init__(self, token, peers, secret_token=None, max_queue=1000):
+        self.token = token
+        self.peers = list(peers)
+        self.secret_token = secret_token
+        self.router = ShardRouter(HashRing(range(len(self.peers))))
+        self.dedup = UpdateDeduplicator()
+        self._queues = [asyncio.Queue(max_queue) for _ in self.peers]
+        self.forwarded = [0] * len(self.peers)
+
+    async def dispatch(self, data):
+        if self.dedup.seen(data.get("update_id")):
+            return
+        for node, updates in self.router.route(data):
+            for update in updates:
+                await self._queues[node].put(update)
+
+    async def _sender(self, node, session):
+        queue = self._queues[node]
+        url = f"{self.peers[node]}/update"
+        headers = {SECRET_HEADER: self.secret_token} if self.secret_token else {}
+        while True:
+            data = await queue.get()
+            delay = 0.5
+            while True:
+                try:
+                    async with session.post(url, json=data, headers=headers) as response:
+                        if response.status < 500:
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"🚨 Вузол {node} ({url}) недоступний: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+            self.forwarded[node] += 1
+            queue.task_done()
+
+    async def _poll(self):
+        from telegram import Bot, Update
+        from telegram.error import NetworkError, RetryAfter
+
+        offset = None
+        delay = 1.0
+        async with Bot(self.token) as bot:
+            await bot.delete_webhook()
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds")
+                                        else e.retry_after)
+                    continue
+                except NetworkError as e:
+                    # TimedOut теж NetworkError; диспетчер не падає, а повторює з паузою
+                    logger.error(f"🚨 getUpdates не вдався: {e}; повтор через {delay:.0f} с")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 60.0)
+                    continue
+                delay = 1.0
+                for update in updates:
+                    await self.dispatch(update.to_dict())
+                    offset = update.update_id + 1
+
+    async def _serve_webhook(self, url, listen, port):
+        from telegram import Bot, Update
+        from urllib.parse import urlparse
+
+        async def handle_update(request):
+            if self.secret_token and request.headers.get(SECRET_HEADER) != self.secret_token:
+                return web.Response(status=403)
+            try:
+                data = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            await self.dispatch(data)
+            return web.Response()
+
+        async def handle_health(request):
+            return web.json_response({"forwarded": self.forwarded, "queued": [q.qsize() for q in self._queues],
+                                      "duplicates": self.dedup.duplicates})
+
+        web_app = web.Application()
+        web_app.router.add_post(urlparse(url).path or "/", handle_update)
+        web_app.router.add_get("/healthz", handle_health)
+        runner = web.AppRunner(web_app)
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        async with Bot(self.token) as bot:
+            await bot.set_webhook(url, secret_token=self.secret_token, allowed_updates=Update.ALL_TYPES)
+        logger.info(f"🌐 Диспетчер слухає {listen}:{port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def serve(self, url=None, listen="0.0.0.0", port=8443):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            senders = [asyncio.create_task(self._sender(node, session)) for node in range(len(self.peers))]
+            try:
+                if url:
+                    await self._serve_webhook(url, listen, port)
+                else:
+                    await self._poll()
+            finally:
+                # Дочікуємось доставки вже прийнятих оновлень
+                try:
+                    await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout=10)
+                except asyncio.TimeoutError:
+                    logger.error("🚨 Не всі оновлення доставлено вузлам")
+                for task in senders:
+                    task.cancel()
+
+
+# Розбиття наявного графа на файли вузлів
+def split(source, shards, backend="memory"):
+    import rdflib
+
+    from storage import GraphStore
+
+    ex = rdflib.Namespace(EX)
+    rdf = rdflib.RDF
+    ring = HashRing(range(shards))
+    src = GraphStore.open_source(source, backend=backend)
+    graph = src.graph
+
+    def owner(node):
+        if (node, rdf.type, ex.User) in graph:
+            return ring.node_for(user_key(str(node)[len(EX):]))
+        user = graph.value(node, ex.належитьКористувачу)
+        if user is not None:
+            return owner(user)
+        return None
+
+    outputs = [rdflib.Graph() for _ in range(shards)]
+    for out in outputs:
+        for prefix, ns in graph.namespaces():
+            out.bind(prefix, ns)
+    for s, p, o in graph:
+        node = owner(s)
+        if node is None and isinstance(o, rdflib.URIRef):
+            node = owner(o)
+        targets = outputs if node is None else [outputs[node]]
+        for out in targets:
+            out.add((s, p, o))
+    paths = []
+    for i, out in enumerate(outputs):
+        path = shard_path(source, i)
+        out.serialize(destination=path, format="n3", encoding="utf-8")
+        logger.info(f"✅ Вузол {i}: {len(out)} триплетів у {path}")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кластер бота: розбиття графа і диспетчер оновлень")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split_parser = sub.add_parser("split", help="розбити граф на файли вузлів")
+    split_parser.add_argument("--shards", type=int, required=True)
+    split_parser.add_argument("--source", default="SPARQL.ttl")
+    split_parser.add_argument("--source-store", default=os.environ.get("BOT_STORE", "memory"),
+                              help="сховище, з якого читати граф (як BOT_STORE у бота)")
+    sub.add_parser("dispatch", help="запустити диспетчер (BOT_TOKEN, BOT_SHARD_PEERS)")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        try:
+            split(args.source, args.shards, backend=args.source_store)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+    peers = [p.strip().rstrip("/") for p in os.environ.get("BOT_SHARD_PEERS", "").split(",") if p.strip()]
+    if not peers:
+        parser.error("BOT_SHARD_PEERS не задано")
+    dispatcher = ShardDispatcher(os.environ["BOT_TOKEN"], peers, secret_token=os.environ.get("BOT_WEBHOOK_SECRET"))
+    try:
+        asyncio.run(dispatcher.serve(url=os.environ.get("BOT_WEBHOOK_URL"),
+                                     listen=os.environ.get("BOT_WEBHOOK_LISTEN", "0.0.0.0"),
+                                     port=int(os.environ.get("BOT_WEBHOOK_PORT", "8443"))))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
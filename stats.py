@@ -0,0 +1,214 @@
+import numpy as np
+
+from records import LEVELS
+
+LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+
+# Числові колонки: planned — калорії рекомендованих тренувань, burned — записані через /log
+COLUMNS = ("age", "height", "weight", "bmi", "planned", "burned", "workouts")
+COHORT_COLUMNS = ("bmi", "weight", "planned", "burned")
+
+
+class UserStats:
+    """Колонковий знімок користувачів для статистики по всій базі.
+
+    Кожна числова ознака — масив NumPy (рядок на користувача, NaN для
+    відсутніх значень), рівень — код int8. Рядки оновлюються точково:
+    ProfileView повідомляє про змінені профілі, а /log додає спалені
+    калорії, тож перцентилі, рейтинги й агрегати за рівнем рахуються
+    векторно без звернень до графа. Відсортовані значення колонки
+    кешуються до наступної зміни, тож перцентиль — це бісекція.
+    Видалений рядок заміщується останнім, ємність масивів подвоюється
+    при нестачі.
+    """
+
+    def __init__(self, profiles, progress, capacity=1024):
+        self.profiles = profiles
+        self.progress = progress
+        self.names = []
+        self._rows = {}
+        self._columns = {c: np.full(capacity, np.nan) for c in COLUMNS}
+        self._level = np.full(capacity, -1, dtype=np.int8)
+        self._dirty = set()
+        self._sorted = {}
+
+    def rebuild(self):
+        self.names = []
+        self._rows = {}
+        self._dirty = set()
+        self._sorted = {}
+        _, profiles = self.profiles.page(0, len(self.profiles))
+        for profile in profiles:
+            self._set(profile["name"], profile)
+
+    # Слухач ProfileView.subscribe: рядок оновиться перед наступним запитом
+    def on_profile(self, name):
+        self._dirty.add(name)
+
+    def add_burned(self, name, calories):
+        # Нового рядка ще немає — _set прочитає суму з журналу, де запис уже є
+        row = self._rows.get(name)
+        if row is not None:
+            self._columns["burned"][row] += calories
+            self._sorted.pop("burned", None)
+
+    def _sync(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        self._sorted = {}
+        for name in dirty:
+            profile = self.profiles.get(name)
+            if profile is None:
+                self._remove(name)
+            else:
+                self._set(name, profile)
+
+    def _grow(self):
+        capacity = len(self._level) * 2
+        for c, values in self._columns.items():
+            grown = np.full(capacity, np.nan)
+            grown[:len(values)] = values
+            self._columns[c] = grown
+        level = np.full(capacity, -1, dtype=np.int8)
+        level[:len(self._level)] = self._level
+        self._level = level
+
+    def _set(self, name, profile):
+        row = self._rows.get(name)
+        if row is None:
+            if len(self.names) == len(self._level):
+                self._grow()
+            row = self._rows[name] = len(self.names)
+            self.names.append(name)
+            _, cals, _ = self.progress.series(name)
+            self._columns["burned"][row] = float(cals.sum())
+        for c in ("age", "height", "weight", "bmi"):
+            self._columns[c][row] = np.nan if profile[c] is None else profile[c]
+        self._columns["planned"][row] = profile["total_calories"]
+        self._columns["workouts"][row] = len(profile["workout_ids"])
+        self._level[row] = LEVEL_CODES.get(profile["level"], -1)
+
+    def _remove(self, name):
+        row = self._rows.pop(name, None)
+        if row is None:
+            return
+        last = len(self.names) - 1
+        if row != last:
+            moved = self.names[last]
+            self.names[row] = moved
+            self._rows[moved] = row
+            for values in self._columns.values():
+                values[row] = values[last]
+            self._level[row] = self._level[last]
+        self.names.pop()
+
+    def column(self, name):
+        self._sync()
+        return self._columns[name][:len(self.names)]
+
+    def levels(self):
+        self._sync()
+        return self._level[:len(self.names)]
+
+    def sorted_values(self, column):
+        values = self.column(column)
+        cached = self._sorted.get(column)
+        if cached is None:
+            cached = self._sorted[column] = np.sort(values[~np.isnan(values)])
+        return cached
+
+    def value(self, name, column):
+        self._sync()
+        row = self._rows.get(name)
+        if row is None or np.isnan(self._columns[column][row]):
+            return None
+        return float(self._columns[column][row])
+
+    def percentile(self, name, column):
+        # Частка користувачів (у %), у яких значення менше, ніж у name; None — немає даних
+        return percentile_of(self.sorted_values(column), self.value(name, column))
+
+    def summary(self, column):
+        # (p25, p50, p75, середнє) по всіх користувачах зі значенням
+        return summarize(self.sorted_values(column))
+
+    def leaderboard(self, column="burned", limit=10, level=None):
+        values = self.column(column).copy()
+        if level is not None:
+            values[self.levels() != LEVEL_CODES.get(level, -2)] = np.nan
+        # Користувачі без калорій (0 або NaN) у рейтинг не потрапляють
+        values[~(values > 0)] = -np.inf
+        k = min(limit, int(np.isfinite(values).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-values, k - 1)[:k]
+        top = top[np.lexsort((np.array([self.names[i] for i in top]), -values[top]))]
+        return [(self.names[i], float(values[i])) for i in top]
+
+    def cohort_sums(self, columns=COHORT_COLUMNS):
+        # {рівень: {"users": кількість, колонка: (сума, кількість значень)}} — групування через bincount
+        codes = self.levels()
+        known = codes >= 0
+        users = np.bincount(codes[known], minlength=len(LEVELS))
+        result = {level: {"users": int(users[code])} for code, level in enumerate(LEVELS) if users[code]}
+        for c in columns:
+            values = self.column(c)
+            mask = known & ~np.isnan(values)
+            sums = np.bincount(codes[mask], weights=values[mask], minlength=len(LEVELS))
+            counts = np.bincount(codes[mask], minlength=len(LEVELS))
+            for code, level in enumerate(LEVELS):
+                if level in result:
+                    result[level][c] = (float(sums[code]), int(counts[code]))
+        return result
+
+    def cohorts(self, columns=COHORT_COLUMNS):
+        # {рівень: {"users": кількість, колонка: середнє}}
+        return cohort_means(self.cohort_sums(columns))
+
+    def __len__(self):
+        self._sync()
+        return len(self.names)
+
+
+# Функції нижче рахують і по одному вузлу, і по злитих даних усіх вузлів кластера
+def percentile_of(sorted_values, value):
+    if value is None or not len(sorted_values):
+        return None
+    return 100.0 * np.searchsorted(sorted_values, value) / len(sorted_values)
+
+
+def summarize(sorted_values):
+    if not len(sorted_values):
+        return None
+    # Лінійна інтерполяція, як у np.percentile, але без повторного сортування
+    p25, p50, p75 = np.interp(np.array([0.25, 0.5, 0.75]) * (len(sorted_values) - 1),
+                              np.arange(len(sorted_values)), sorted_values)
+    return float(p25), float(p50), float(p75), float(sorted_values.mean())
+
+
+def merge_sorted(parts):
+    return np.sort(np.concatenate([np.asarray(part, dtype=float) for part in parts]))
+
+
+def merge_leaderboards(parts, limit=10):
+    # Перші limit кожного вузла містять загальні перші limit
+    return sorted((entry for part in parts for entry in part), key=lambda e: (-e[1], e[0]))[:limit]
+
+
+def merge_cohort_sums(parts):
+    merged = {}
+    for part in parts:
+        for level, row in part.items():
+            target = merged.setdefault(level, {"users": 0})
+            target["users"] += row["users"]
+            for c, value in row.items():
+                if c != "users":
+                    total, count = target.get(c, (0.0, 0))
+                    target[c] = (total + value[0], count + value[1])
+    return {level: merged[level] for level in LEVELS if level in merged}
+
+
+def cohort_means(sums):
+    return {level: {c: v if c == "users" else (v[0] / v[1] if v[1] else None) for c, v in row.items()}
+            for level, row in sums.items()}
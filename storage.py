@@ -0,0 +1,711 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+from itertools import groupby
+
+import rdflib
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Постійні сховища: назва -> (плагін rdflib Store, конфігурація для graph.open)
+BACKENDS = {
+    "sqlite": ("SQLAlchemy", lambda path: rdflib.Literal(f"sqlite:///{path}")),
+    "berkeleydb": ("BerkeleyDB", lambda path: path),
+    "oxigraph": ("Oxigraph", lambda path: path),
+}
+GRAPH_ID = rdflib.URIRef("http://example.org/training")
+# Розкладка BOT_STORE=dataset: іменовані графи схеми, каталогу і кожного користувача
+GRAPHS = rdflib.Namespace("http://example.org/training/graphs/")
+USER_CLASS = rdflib.URIRef("http://example.org/training#User")
+RDF = rdflib.RDF
+RDFS = rdflib.RDFS
+OWL = rdflib.OWL
+TBOX_TYPES = {OWL.Class, RDFS.Class, RDF.Property, OWL.ObjectProperty, OWL.DatatypeProperty, OWL.AnnotationProperty,
+              OWL.TransitiveProperty, OWL.SymmetricProperty, OWL.FunctionalProperty, OWL.InverseFunctionalProperty,
+              OWL.Restriction, OWL.Ontology}
+TBOX_PREDICATES = (RDFS.subClassOf, RDFS.subPropertyOf, RDFS.domain, RDFS.range, OWL.inverseOf, OWL.equivalentClass,
+                   OWL.equivalentProperty)
+# Видалення в журналі: рядок N-Quads у цьому графі (додавання — звичайні рядки N-Triples)
+REMOVED = rdflib.URIRef("urn:x-journal:removed")
+REMOVED_SUFFIX = f"{REMOVED.n3()} .".encode("utf-8")
+
+SNAPSHOT_VERSION = 1
+
+
+def _encode_term(term):
+    if isinstance(term, rdflib.Literal):
+        return ("L", str(term), str(term.datatype) if term.datatype else None, term.language)
+    if isinstance(term, rdflib.BNode):
+        return ("B", str(term))
+    return ("U", str(term))
+
+
+def _decode_term(encoded):
+    kind = encoded[0]
+    if kind == "L":
+        _, value, datatype, lang = encoded
+        return rdflib.Literal(value, datatype=rdflib.URIRef(datatype) if datatype else None, lang=lang)
+    if kind == "B":
+        return rdflib.BNode(encoded[1])
+    return rdflib.URIRef(encoded[1])
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Бінарний знімок графа: таблиця термів + масив індексів триплетів.
+# Дійсний лише для SPARQL.ttl з тим самим sha256 (source_hash).
+def write_snapshot(path, graph, source_hash):
+    dump_snapshot(path, graph.namespaces(), graph, source_hash)
+
+
+def dump_snapshot(path, namespaces, triples, source_hash):
+    index = {}
+    terms = []
+    ids = array("I")
+    for triple in triples:
+        for term in triple:
+            i = index.get(term)
+            if i is None:
+                i = index[term] = len(terms)
+                terms.append(_encode_term(term))
+            ids.append(i)
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "source_hash": source_hash,
+        "namespaces": [(prefix, str(ns)) for prefix, ns in namespaces],
+        "terms": terms,
+        "triples": ids.tobytes(),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path, source_hash):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ Пошкоджений знімок {path}: {e}")
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION or payload.get("source_hash") != source_hash:
+        return None
+    terms = [_decode_term(t) for t in payload["terms"]]
+    ids = array("I")
+    ids.frombytes(payload["triples"])
+    triples = [(terms[ids[i]], terms[ids[i + 1]], terms[ids[i + 2]]) for i in range(0, len(ids), 3)]
+    return payload["namespaces"], triples
+
+
+def replay_journal(graph, journal):
+    # Застосовує журнал до graph по порядку; повертає кількість записів
+    if not os.path.exists(journal):
+        return 0
+    with open(journal, "rb") as f:
+        data = f.read()
+    # Обірваний останній рядок після аварії відкидаємо
+    complete = data[:data.rfind(b"\n") + 1]
+    if len(complete) != len(data):
+        logger.warning(f"⚠️ Відкинуто неповний запис у журналі {journal}")
+    # Суцільні відрізки додавань і видалень розбираються цілком, відрізки — по черзі
+    lines = complete.splitlines(keepends=True)
+    for removed, run in groupby(lines, key=lambda line: line.rstrip().endswith(REMOVED_SUFFIX)):
+        data = b"".join(run).decode("utf-8")
+        if removed:
+            dataset = rdflib.Dataset()
+            dataset.parse(data=data, format="nquads")
+            for t in dataset.graph(REMOVED):
+                graph.remove(t)
+        else:
+            graph.parse(data=data, format="nt")
+    return len(lines)
+
+
+def backend_path(path, backend):
+    return os.path.splitext(path)[0] + "." + backend
+
+
+def open_backend(backend, path, graph=None):
+    plugin_name, config = BACKENDS[backend]
+    if graph is None:
+        graph = rdflib.Graph(store=plugin_name, identifier=GRAPH_ID)
+    # Деякі сховища (Oxigraph) відмовляються "створювати" наявний каталог
+    graph.open(config(path), create=not os.path.exists(path))
+    return graph
+
+
+def write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def fsync_dir(path):
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _local_name(uri):
+    return str(uri).split("#")[-1]
+
+
+class DatasetLayout:
+    """Розбиття графа на іменовані графи і сегменти N-Quads з відстеженням змін.
+
+    Кожен суб'єкт належить одному іменованому графу: користувач — своєму
+    GRAPHS["users/<ім'я>"], класи, властивості й аксіоми — GRAPHS.schema,
+    решта (тренування, інтенсивності, рівні) — GRAPHS.catalog. Графи
+    користувачів розкладено по user_segments файлах за хешем імені.
+    Зміна триплета позначає брудним лише сегмент його суб'єкта, і
+    ущільнення переписує тільки брудні сегменти. Поруч із кожним .nq
+    лежить бінарний знімок, дійсний для того самого sha256 файла.
+    """
+
+    def __init__(self, directory, user_segments=256):
+        self.directory = directory
+        self.user_segments = user_segments
+        self._graph_of = {}
+        self._members = {}
+        self.dirty = set()
+
+    def exists(self):
+        return os.path.isdir(self.directory) and any(n.endswith(".nq") for n in os.listdir(self.directory))
+
+    def classify(self, graph, subject):
+        if isinstance(subject, rdflib.BNode):
+            return GRAPHS.schema
+        types = set(graph.objects(subject, RDF.type))
+        if USER_CLASS in types:
+            return GRAPHS["users/" + _local_name(subject)]
+        if types & TBOX_TYPES or any((subject, p, None) in graph for p in TBOX_PREDICATES):
+            return GRAPHS.schema
+        return GRAPHS.catalog
+
+    def segment(self, graph_id):
+        name = str(graph_id)[len(GRAPHS):]
+        if not name.startswith("users/"):
+            return name
+        return f"users-{zlib.crc32(name.encode('utf-8')) % self.user_segments:03d}"
+
+    def touch(self, graph, subject):
+        # Перекласифікація суб'єкта після зміни його триплетів
+        old = self._graph_of.get(subject)
+        new = self.classify(graph, subject) if (subject, None, None) in graph else None
+        if old is not None and old != new:
+            self._members[self.segment(old)].discard(subject)
+            self.dirty.add(self.segment(old))
+        if new is None:
+            self._graph_of.pop(subject, None)
+            return
+        self._graph_of[subject] = new
+        segment = self.segment(new)
+        self._members.setdefault(segment, set()).add(subject)
+        self.dirty.add(segment)
+
+    def index(self, graph):
+        self._graph_of = {}
+        self._members = {}
+        for subject in set(graph.subjects()):
+            self.touch(graph, subject)
+        self.dirty = set()
+
+    def mark_all_dirty(self):
+        self.dirty = set(self._members)
+        if os.path.isdir(self.directory):
+            # Сегменти, що більше не існують у графі, теж переписуються (видаляються)
+            self.dirty.update(n[:-3] for n in os.listdir(self.directory) if n.endswith(".nq"))
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def collect(self, graph, segments):
+        # {сегмент: [(s, p, o, граф)]}; викликати під блокуванням читача
+        return {segment: [t + (self._graph_of[s],) for s in self._members.get(segment, ())
+                          for t in graph.triples((s, None, None))]
+                for segment in segments}
+
+    def _paths(self, segment):
+        base = os.path.join(self.directory, segment)
+        return base + ".nq", base + ".pickle"
+
+    def write(self, collected, namespaces):
+        os.makedirs(self.directory, exist_ok=True)
+        namespaces = list(namespaces)
+        for segment, quads in collected.items():
+            nq_path, pickle_path = self._paths(segment)
+            if not quads:
+                for path in (nq_path, pickle_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                continue
+            dataset = rdflib.Dataset()
+            dataset.addN((s, p, o, dataset.graph(g)) for s, p, o, g in quads)
+            with timed("bot_graph_serialize_seconds", kind="segment"):
+                data = dataset.serialize(format="nquads", encoding="utf-8")
+            write_atomic(nq_path, data)
+            dump_snapshot(pickle_path, namespaces, (q[:3] for q in quads), hashlib.sha256(data).hexdigest())
+        fsync_dir(os.path.join(self.directory, "."))
+
+    def load(self, graph, read_only=False):
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".nq"):
+                continue
+            nq_path, pickle_path = self._paths(name[:-3])
+            source_hash = file_hash(nq_path)
+            snapshot = read_snapshot(pickle_path, source_hash)
+            if snapshot is not None:
+                namespaces, triples = snapshot
+                for prefix, ns in namespaces:
+                    graph.bind(prefix, ns, override=True)
+                graph.addN((s, p, o, graph) for s, p, o in triples)
+                continue
+            # Сегмент змінено вручну: N-Quads розбираються лише в Dataset
+            dataset = rdflib.Dataset()
+            dataset.parse(nq_path, format="nquads")
+            triples = [(s, p, o) for s, p, o, _ in dataset.quads((None, None, None, None))]
+            graph.addN((s, p, o, graph) for s, p, o in triples)
+            if not read_only:
+                dump_snapshot(pickle_path, graph.namespaces(), triples, source_hash)
+
+
+class RWLock:
+    """Багато читачів або один писач; писач, що чекає, має пріоритет.
+
+    Лічильники очікувань показують, наскільки читачі й писачі
+    заважають одне одному (stats()).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._stats = {mode: {"count": 0, "contended": 0, "wait_total": 0.0, "wait_max": 0.0}
+                       for mode in ("read", "write")}
+
+    def _record(self, mode, contended, waited):
+        stats = self._stats[mode]
+        stats["count"] += 1
+        if contended:
+            stats["contended"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+
+    @contextmanager
+    def read(self):
+        started = time.perf_counter()
+        contended = False
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                contended = True
+                self._cond.wait()
+            self._readers += 1
+            self._record("read", contended, time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        started = time.perf_counter()
+        contended = False
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                contended = True
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+            self._record("write", contended, time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {mode: {"count": s["count"], "contended": s["contended"],
+                           "wait_total_ms": round(s["wait_total"] * 1000, 3),
+                           "wait_max_ms": round(s["wait_max"] * 1000, 3)}
+                    for mode, s in self._stats.items()}
+
+
+class Batch:
+    """Зміни однієї транзакції GraphStore.transaction().
+
+    Операції накопичуються і застосовуються разом при виході з блоку;
+    виняток у блоці відкидає всю транзакцію. contains() читає граф
+    під тим самим блокуванням писача.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.ops = []
+
+    def contains(self, triple):
+        return triple in self.graph
+
+    def add(self, triple):
+        self.ops.append(("add", triple))
+
+    def add_many(self, triples):
+        self.ops.extend(("add", t) for t in triples)
+
+    def set(self, triple):
+        self.ops.append(("set", triple))
+
+    def remove(self, triple):
+        self.ops.append(("remove", triple))
+
+
+class GraphStore:
+    """RDF граф з журналом змін (write-behind).
+
+    Кожна зміна одразу дописується у журнал: додавання — рядками
+    N-Triples, видалення (remove і заміна старих значень у set) —
+    рядками N-Quads у графі REMOVED. Журнал відтворюється по порядку,
+    тож для кожного триплета перемагає остання зміна. Фоновий потік
+    періодично (або після порогу змін) ущільнює журнал: попередній знімок
+    разом із ротованим журналом стає новим знімком з атомарною заміною
+    файлу, а живий граф під блокуванням не копіюється.
+
+    Якщо задано backend з BACKENDS, граф живе у постійному сховищі
+    (SQLite, BerkeleyDB, Oxigraph): файл SPARQL.ttl не читається при
+    старті, а журнал і ущільнення не потрібні.
+
+    backend="dataset" лишає граф у пам'яті, але зберігає його як
+    іменовані графи в сегментах каталогу SPARQL.dataset (DatasetLayout):
+    ущільнення переписує лише змінені сегменти, а не весь SPARQL.ttl.
+    """
+
+    def __init__(self, path, fmt="n3", flush_interval=30.0, flush_threshold=500, fsync=True,
+                 backend="memory", store_path=None):
+        self.backend = backend
+        self.persistent = backend not in ("memory", "dataset")
+        self.layout = None
+        if backend == "dataset":
+            self.layout = DatasetLayout(store_path or os.path.splitext(path)[0] + ".dataset")
+        if self.persistent:
+            if backend not in BACKENDS:
+                raise ValueError(f"Невідоме сховище графа: {backend}")
+            self.store_path = store_path or backend_path(path, backend)
+            self.graph = rdflib.Graph(store=BACKENDS[backend][0], identifier=GRAPH_ID)
+        else:
+            self.store_path = None
+            self.graph = rdflib.Graph()
+        self.path = path
+        self.format = fmt
+        self.journal_path = os.path.splitext(path)[0] + ".journal.nt"
+        self.snapshot_path = os.path.splitext(path)[0] + ".snapshot.pickle"
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.fsync = fsync
+        self.lock = RWLock()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._pending = 0
+        self._needs_compact = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    @property
+    def pending(self):
+        # Кількість змін, ще не злитих у знімок
+        return self._pending
+
+    # Підписка на зміни: callback(triple, added)
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, triples, added):
+        for callback in self._listeners:
+            for t in triples:
+                try:
+                    callback(t, added)
+                except Exception as e:
+                    logger.error(f"🚨 Помилка обробника змін графа: {e}")
+
+    # Завантаження: знімок + незлиті журнали (повтор змін по порядку ідемпотентний)
+    def load(self, read_only=False):
+        if self.persistent:
+            open_backend(self.backend, self.store_path, self.graph)
+            if not len(self.graph) and os.path.exists(self.path):
+                logger.warning(f"⚠️ Сховище {self.store_path} порожнє — перенесіть дані: "
+                               f"python migrate_store.py {self.backend}")
+            return self.graph
+        if self.layout is not None and self.layout.exists():
+            self.layout.load(self.graph, read_only)
+        elif os.path.exists(self.path):
+            self._load_snapshot(self.graph, read_only)
+        for journal in (self.journal_path + ".1", self.journal_path):
+            self._pending += replay_journal(self.graph, journal)
+        if self.layout is not None:
+            self.layout.index(self.graph)
+            # Перший запуск з SPARQL.ttl або незлитий журнал: переписати всі сегменти
+            if not self.layout.exists() or self._pending:
+                self.layout.mark_all_dirty()
+                self._needs_compact = True
+        if not read_only:
+            self._journal = open(self.journal_path, "ab")
+        return self.graph
+
+    def _load_snapshot(self, graph, read_only, quiet=False):
+        source_hash = file_hash(self.path)
+        snapshot = read_snapshot(self.snapshot_path, source_hash)
+        if snapshot is not None:
+            namespaces, triples = snapshot
+            for prefix, ns in namespaces:
+                graph.bind(prefix, ns, override=True)
+            graph.addN((s, p, o, graph) for s, p, o in triples)
+            if not quiet:
+                logger.info(f"⚡ Граф завантажено з бінарного знімка {self.snapshot_path}")
+            return
+        # Знімка немає або SPARQL.ttl змінено вручну — розбираємо N3 і створюємо знімок
+        graph.parse(self.path, format=self.format)
+        if not read_only:
+            write_snapshot(self.snapshot_path, graph, source_hash)
+
+    # Узгоджене читання кількох триплетів: with store.read(): ...
+    def read(self):
+        return self.lock.read()
+
+    def contains(self, triple):
+        with self.lock.read():
+            return triple in self.graph
+
+    def add(self, triple):
+        self._apply([("add", triple)])
+
+    def add_many(self, triples):
+        self._apply([("add", t) for t in triples])
+
+    def set(self, triple):
+        self._apply([("set", triple)])
+
+    def remove(self, triple):
+        self._apply([("remove", triple)])
+
+    @contextmanager
+    def transaction(self):
+        # Кілька змін як одна атомарна: один запис журналу, одне сповіщення підписників
+        with self.lock.write():
+            batch = Batch(self.graph)
+            yield batch
+            changes = self._apply_locked(batch.ops)
+        self._after_apply(changes)
+
+    def _apply(self, ops):
+        if not ops:
+            return
+        with self.lock.write():
+            changes = self._apply_locked(ops)
+        self._after_apply(changes)
+
+    def _apply_locked(self, ops):
+        changes = []
+        # Записи журналу по порядку: (додано?, триплет)
+        records = []
+        for kind, triple in ops:
+            if kind == "add":
+                self.graph.add(triple)
+                records.append((True, triple))
+                changes.append(([triple], True))
+                self._touch([triple])
+            elif kind == "set":
+                s, p, _ = triple
+                removed = [t for t in self.graph.triples((s, p, None)) if t != triple]
+                self.graph.set(triple)
+                records += [(False, t) for t in removed] + [(True, triple)]
+                changes += [(removed, False), ([triple], True)]
+                self._touch([triple])
+            else:
+                removed = list(self.graph.triples(triple))
+                self.graph.remove(triple)
+                records += [(False, t) for t in removed]
+                changes.append((removed, False))
+                self._touch(removed)
+        if self.persistent:
+            # Зміна вже у сховищі: ущільнювати нічого, pending лишається 0
+            self._commit()
+            return changes
+        if records and self._journal is not None:
+            with timed("bot_graph_serialize_seconds", kind="journal"):
+                data = b"".join(self._journal_run(added, [t for _, t in run])
+                                for added, run in groupby(records, key=lambda r: r[0]))
+            self._journal.write(data)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+        self._pending += len(records)
+        return changes
+
+    @staticmethod
+    def _journal_run(added, triples):
+        if added:
+            batch = rdflib.Graph()
+            for t in triples:
+                batch.add(t)
+            return batch.serialize(format="nt", encoding="utf-8")
+        dataset = rdflib.Dataset()
+        removed = dataset.graph(REMOVED)
+        for t in triples:
+            removed.add(t)
+        return dataset.serialize(format="nquads", encoding="utf-8")
+
+    def _touch(self, triples):
+        if self.layout is not None:
+            for subject in {t[0] for t in triples}:
+                self.layout.touch(self.graph, subject)
+
+    def _after_apply(self, changes):
+        for triples, added in changes:
+            self._notify(triples, added)
+        if self._needs_compact or self._pending >= self.flush_threshold:
+            self._wake.set()
+
+    def _commit(self):
+        if self.graph.store.transaction_aware:
+            self.graph.commit()
+
+    def flush(self):
+        if self.persistent:
+            return False
+        with self._flush_lock:
+            with self.lock.write():
+                if not self._pending and not self._needs_compact:
+                    return False
+                # Ротація журналу: нові записи йдуть у свіжий файл під час запису знімка
+                if self._journal is not None:
+                    self._journal.close()
+                    self._rotate_journal()
+                    self._journal = open(self.journal_path, "ab")
+                self._pending = 0
+                self._needs_compact = False
+                if self.layout is not None:
+                    segments = self.layout.take_dirty()
+                else:
+                    namespaces = list(self.graph.namespaces())
+            if self.layout is not None:
+                self._flush_segments(segments)
+            else:
+                self._flush_snapshot(namespaces)
+            if os.path.exists(self.journal_path + ".1"):
+                os.remove(self.journal_path + ".1")
+            return True
+
+    def _flush_snapshot(self, namespaces):
+        # Новий знімок = попередній знімок + ротований журнал. Живий граф не читається,
+        # тож писачі не чекають, поки ущільнення копіює чи серіалізує граф
+        snapshot = rdflib.Graph()
+        if os.path.exists(self.path):
+            self._load_snapshot(snapshot, read_only=True, quiet=True)
+        replay_journal(snapshot, self.journal_path + ".1")
+        for prefix, ns in namespaces:
+            snapshot.bind(prefix, ns, override=True)
+        self._write_atomic(snapshot)
+
+    def _flush_segments(self, segments):
+        with self.lock.read():
+            collected = self.layout.collect(self.graph, segments)
+            namespaces = list(self.graph.namespaces())
+        try:
+            self.layout.write(collected, namespaces)
+        except Exception:
+            # Журнал .1 лишається, а сегменти — брудними до наступної спроби
+            self.layout.dirty |= segments
+            raise
+
+    def _rotate_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        rotated = self.journal_path + ".1"
+        if not os.path.exists(rotated):
+            os.replace(self.journal_path, rotated)
+            return
+        # Попереднє ущільнення не завершилось — дописуємо, а не перезаписуємо
+        with open(self.journal_path, "rb") as src, open(rotated, "ab") as dst:
+            dst.write(src.read())
+        os.remove(self.journal_path)
+
+    def _write_atomic(self, snapshot):
+        with timed("bot_graph_serialize_seconds", kind="snapshot"):
+            data = snapshot.serialize(format=self.format, encoding="utf-8")
+        write_atomic(self.path, data)
+        write_snapshot(self.snapshot_path, snapshot, hashlib.sha256(data).hexdigest())
+        fsync_dir(self.path)
+
+    # Фоновий потік ущільнення
+    def start(self):
+        if self._thread is not None or self.persistent:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="graph-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                if self.flush():
+                    logger.info(f"💾 Граф збережено у {self.layout.directory if self.layout else self.path}")
+            except Exception as e:
+                logger.error(f"🚨 Помилка збереження графа: {e}")
+
+    @classmethod
+    def open_source(cls, path, backend="memory", store_path=None):
+        # Граф для офлайн-інструментів (split, migrate) з того ж сховища, що й у бота
+        store = cls(path, fmt="n3", backend=backend, store_path=store_path)
+        if backend == "memory":
+            layout = DatasetLayout(os.path.splitext(path)[0] + ".dataset")
+            if layout.exists():
+                # З BOT_STORE=dataset файл SPARQL.ttl не оновлюється
+                raise ValueError(f"{path} застарів: актуальний граф у {layout.directory} (BOT_STORE=dataset)")
+        store.load(read_only=True)
+        return store
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.persistent:
+            self.graph.close(commit_pending_transaction=True)
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+
+import rdflib
+from telegram.error import BadRequest
+
+from charts import ChartCache, FileIdRegistry, send_chart
+
+EX = rdflib.Namespace("http://example.org/training#")
+
+
+def test_disk_cache_prunes_least_recently_used(tmp_path):
+    cache = ChartCache(EX, max_items=1, disk_dir=str(tmp_path), max_disk_items=10)
+    for i in range(10):
+        cache.put(f"k{i}", b"png%d" % i)
+        os.utime(tmp_path / f"k{i}.png", (i, i))
+    # Читання з диска оновлює mtime — k0 стає найсвіжішим
+    assert cache.get("k0") == b"png0"
+    cache.put("k10", b"png10")
+    assert len(os.listdir(tmp_path)) == 11
+    cache.put("k11", b"png11")
+
+    names = set(os.listdir(tmp_path))
+    assert len(names) == 10
+    assert {"k0.png", "k10.png", "k11.png"} <= names
+    assert not {"k1.png", "k2.png"} & names
+    assert cache.get("k1") is None
+
+
+def test_disk_cache_prunes_on_start(tmp_path):
+    for i in range(5):
+        (tmp_path / f"k{i}.png").write_bytes(b"png")
+        os.utime(tmp_path / f"k{i}.png", (i, i))
+    ChartCache(EX, disk_dir=str(tmp_path), max_disk_items=3)
+    assert sorted(os.listdir(tmp_path)) == ["k2.png", "k3.png", "k4.png"]
+
+
+class StubMessage:
+    """reply_photo як у Bot API: file_id для байтів, BadRequest для відкликаних file_id."""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.sent = []
+
+    async def reply_photo(self, photo, caption=None):
+        self.sent.append(photo)
+        if isinstance(photo, str):
+            if photo in self.rejected:
+                raise BadRequest("Wrong file identifier/http url specified")
+            file_id = photo
+        else:
+            file_id = f"file-{len(self.sent)}"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="thumb"), SimpleNamespace(file_id=file_id)])
+
+
+def test_first_send_uploads_and_repeat_uses_file_id(tmp_path):
+    registry = FileIdRegistry(str(tmp_path / "file_ids.jsonl"))
+    message = StubMessage()
+    asyncio.run(send_chart(message, "k", b"png", "caption", registry))
+    assert message.sent == [b"png"]
+    assert registry.get("k") == "file-1"
+
+    # Після перезапуску реєстр читається з диска, байти більше не надсилаються
+    registry = FileIdRegistry(str(tmp_path / "file_ids.jsonl"))
+    asyncio.run(send_chart(message, "k", b"png", "caption", registry))
+    assert message.sent == [b"png", "file-1"]
+
+
+def test_rejected_file_id_falls_back_to_upload(tmp_path):
+    registry = FileIdRegistry(str(tmp_path / "file_ids.jsonl"))
+    registry.set("k", "expired")
+    message = StubMessage(rejected={"expired"})
+    sent = asyncio.run(send_chart(message, "k", b"png", "caption", registry))
+    assert message.sent == ["expired", b"png"]
+    assert sent.photo[-1].file_id == "file-2"
+    assert registry.get("k") == "file-2"
+
+
+def test_rejected_file_id_without_png_reports_miss(tmp_path):
+    registry = FileIdRegistry(str(tmp_path / "file_ids.jsonl"))
+    registry.set("k", "expired")
+    message = StubMessage(rejected={"expired"})
+    assert asyncio.run(send_chart(message, "k", None, "caption", registry)) is None
+    assert "k" not in registry
+
+
+def test_registry_is_lru_capped_and_survives_restart(tmp_path):
+    path = str(tmp_path / "file_ids.jsonl")
+    registry = FileIdRegistry(path, max_items=2)
+    registry.set("a", "id-a")
+    registry.set("b", "id-b")
+    registry.get("a")
+    registry.set("c", "id-c")
+    assert "b" not in registry
+
+    registry = FileIdRegistry(path, max_items=2)
+    assert (registry.get("a"), registry.get("b"), registry.get("c")) == ("id-a", None, "id-c")
+    # Ущільнення при старті лишає лише живі записи
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_registry_compacts_log_in_background(tmp_path):
+    path = str(tmp_path / "file_ids.jsonl")
+    registry = FileIdRegistry(path, max_items=3)
+    for i in range(20):
+        registry.set("k", f"id-{i}")
+    for thread in [t for t in threading.enumerate() if t.name == "file-ids-compact"]:
+        thread.join()
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) <= 2 * 3
+    assert FileIdRegistry(path).get("k") == "id-19"
+
+
+def test_pruned_png_drops_its_file_id(tmp_path):
+    cache = ChartCache(EX, max_items=1, disk_dir=str(tmp_path / "charts"), max_disk_items=1)
+    registry = FileIdRegistry(str(tmp_path / "file_ids.jsonl"))
+    cache.subscribe(registry.discard_many)
+    cache.put("old", b"png")
+    registry.set("old", "id-old")
+    os.utime(tmp_path / "charts" / "old.png", (0, 0))
+    cache.put("new", b"png")
+    registry.set("new", "id-new")
+    assert "old" not in registry and registry.get("new") == "id-new"
@@ -0,0 +1,58 @@
+import rdflib
+
+from catalog import WorkoutCatalog
+from profiles import ProfileView
+from reasoning import SchemaIndex
+from storage import GraphStore
+
+EX = rdflib.Namespace("http://example.org/training#")
+RDF = rdflib.RDF
+OWL = rdflib.OWL
+XSD = rdflib.XSD
+
+
+def open_views(tmp_path):
+    path = tmp_path / "SPARQL.ttl"
+    graph = rdflib.Graph()
+    graph.add((EX.CardioWorkout, rdflib.RDFS.subClassOf, EX.Workout))
+    graph.add((EX.маєРекомендацію, OWL.inverseOf, EX.рекомендуєтьсяДля))
+    graph.add((EX.Run, RDF.type, EX.CardioWorkout))
+    graph.add((EX.Run, EX.спаленіКалорії, rdflib.Literal(300.0, datatype=XSD.float)))
+    graph.add((EX.Swim, RDF.type, EX.CardioWorkout))
+    graph.add((EX.Swim, EX.спаленіКалорії, rdflib.Literal(200.0, datatype=XSD.float)))
+    graph.add((EX.Roma, RDF.type, EX.User))
+    graph.add((EX.Roma, EX.маєРекомендацію, EX.Run))
+    graph.serialize(destination=str(path), format="n3", encoding="utf-8")
+
+    store = GraphStore(str(path), fmt="n3", fsync=False)
+    store.load()
+    schema = SchemaIndex(store.graph)
+    schema.rebuild()
+    store.subscribe(schema.on_change)
+    catalog = WorkoutCatalog(store.graph, EX, schema)
+    catalog.rebuild()
+    store.subscribe(catalog.on_change)
+    profiles = ProfileView(store.graph, EX, catalog, schema)
+    profiles.rebuild()
+    store.subscribe(profiles.on_change)
+    return store, profiles
+
+
+def test_profile_reads_recommendations_through_inverse(tmp_path):
+    store, profiles = open_views(tmp_path)
+    assert profiles.get("Roma")["workout_ids"] == ["Run"]
+
+    store.add((EX.Swim, EX.рекомендуєтьсяДля, EX.Roma))
+    assert profiles.get("Roma")["workout_ids"] == ["Run", "Swim"]
+    assert profiles.get("Roma")["total_calories"] == 500.0
+
+    store.remove((EX.Swim, EX.рекомендуєтьсяДля, EX.Roma))
+    assert profiles.get("Roma")["workout_ids"] == ["Run"]
+
+
+def test_dropping_inverse_axiom_rebuilds_profiles(tmp_path):
+    store, profiles = open_views(tmp_path)
+    store.add((EX.Swim, EX.рекомендуєтьсяДля, EX.Roma))
+
+    store.remove((EX.маєРекомендацію, OWL.inverseOf, EX.рекомендуєтьсяДля))
+    assert profiles.get("Roma")["workout_ids"] == ["Run"]
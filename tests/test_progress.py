@@ -0,0 +1,37 @@
+import datetime
+import io
+
+import numpy as np
+import rdflib
+
+from bulk import export_ntriples
+from progress import ProgressStore
+
+EX = rdflib.Namespace("http://example.org/training#")
+
+
+def test_progress_export_round_trips_through_import(tmp_path):
+    progress = ProgressStore(str(tmp_path / "progress.sqlite")).load()
+    progress.log("Рома", [("Workout_Yoga", 150.0), ("Workout_Run", 300.0)], date=datetime.date(2026, 10, 1))
+    progress.log("Ден", [("", 80.0)], date=datetime.date(2026, 10, 3))
+
+    graph = rdflib.Graph()
+    graph.add((EX.Рома, rdflib.RDF.type, EX.User))
+    # Запис, уже перенесений у журнал при першому старті, — не дублюється у повному вивантаженні
+    graph.add((EX.Progress_seed, rdflib.RDF.type, EX.Progress))
+    graph.add((EX.Progress_seed, EX.належитьКористувачу, EX.Рома))
+    out = io.BytesIO()
+    written = export_ntriples(graph, out, "progress", progress=progress)
+    everything = io.BytesIO()
+    assert export_ntriples(graph, everything, "all", progress=progress) == written + 1
+    progress.close()
+
+    exported = rdflib.Graph().parse(data=out.getvalue().decode("utf-8"), format="nt")
+    assert len(exported) == written == 14
+    restored = ProgressStore(str(tmp_path / "restored.sqlite")).load()
+    assert restored.import_rdf(exported, EX) == 3
+    days, cals, _ = restored.series("Рома")
+    assert sorted(cals.tolist()) == [150.0, 300.0]
+    assert restored.rollup("Ден", "month") == [("2026-10", 80.0, 1)]
+    assert np.array_equal(days, np.full(2, (datetime.date(2026, 10, 1) - datetime.date(1970, 1, 1)).days))
+    restored.close()
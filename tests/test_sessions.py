@@ -0,0 +1,90 @@
+import asyncio
+
+import rdflib
+from telegram.ext import Application, CommandHandler, ConversationHandler
+
+import persistence
+from catalog import WorkoutCatalog
+from persistence import IdleSessionSweeper, SQLitePersistence
+from reasoning import SchemaIndex
+
+EX = rdflib.Namespace("http://example.org/training#")
+
+
+async def noop(update, context):
+    return ConversationHandler.END
+
+
+def make_app():
+    app = Application.builder().token("1:test").build()
+    conv = ConversationHandler(entry_points=[CommandHandler("stats", noop)], states={1: []}, fallbacks=[])
+    app.add_handler(conv)
+    return app, conv
+
+
+def test_sweeper_ends_idle_conversations_and_drops_user_data(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(persistence.time, "monotonic", lambda: clock[0])
+    app, conv = make_app()
+    sweeper = IdleSessionSweeper(ttl=60)
+    conv._conversations[(10, 7)] = 1
+    conv._conversations[(11, 8)] = 1
+    app._user_data[7]["new_user"] = "Рома"
+    app._user_data[8]["new_user"] = "Ден"
+
+    # Відновлені з диска розмови отримують відлік від першого проходу
+    assert sweeper.sweep(app) == (0, 0)
+    clock[0] += 30
+    user = type("User", (), {"id": 8})()
+    asyncio.run(sweeper.touch(type("Update", (), {"effective_user": user})(), None))
+    clock[0] += 45
+
+    assert sweeper.sweep(app) == (1, 1)
+    assert dict(conv._conversations) == {(11, 8): 1}
+    assert set(app.user_data) == {8}
+    assert 7 in app._user_ids_to_be_deleted_in_persistence
+
+
+def test_persistence_evicts_expired_rows_on_load(tmp_path, monkeypatch):
+    path = str(tmp_path / "conversations.sqlite")
+    store = SQLitePersistence(path, ttl=60)
+
+    async def write():
+        await store.update_conversation("stats", (10, 7), 1)
+        await store.update_user_data(7, {"new_user": "Рома"})
+        await asyncio.sleep(0)
+        await store.flush()
+
+    asyncio.run(write())
+    assert asyncio.run(SQLitePersistence(path, ttl=60).get_conversations("stats")) == {(10, 7): 1}
+    monkeypatch.setattr(persistence.time, "time", lambda: 10 ** 10)
+    later = SQLitePersistence(path, ttl=60)
+    assert asyncio.run(later.get_conversations("stats")) == {}
+    assert asyncio.run(later.get_user_data()) == {}
+
+
+def catalog_for(graph):
+    schema = SchemaIndex(graph)
+    schema.rebuild()
+    catalog = WorkoutCatalog(graph, EX, schema)
+    catalog.rebuild()
+    return catalog
+
+
+def test_menu_version_is_stable_across_restarts_and_tracks_menu():
+    graph = rdflib.Graph()
+    for name in ("Workout_Yoga", "Workout_Run"):
+        graph.add((EX[name], rdflib.RDF.type, EX.Workout))
+    version = catalog_for(graph).version
+    assert catalog_for(graph).version == version
+
+    # Тренування додано, поки бот стояв: після перезапуску номери меню інші
+    graph.add((EX.Workout_Box, rdflib.RDF.type, EX.Workout))
+    restarted = catalog_for(graph)
+    assert restarted.version != version
+
+    # Зміна назви не зсуває номери
+    before = restarted.version
+    graph.add((EX.Workout_Box, EX.назва, rdflib.Literal("Бокс", lang="uk")))
+    restarted.on_change((EX.Workout_Box, EX.назва, rdflib.Literal("Бокс", lang="uk")), True)
+    assert restarted.version == before
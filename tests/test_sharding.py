@@ -0,0 +1,246 @@
+import asyncio
+
+import numpy as np
+import pytest
+import rdflib
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from names import UserNameIndex
+from sharding import REPLAY_FIELD, HashRing, Shard, ShardRouter, shard_path, split, user_key
+from stats import UserStats, percentile_of, summarize
+from storage import GraphStore
+
+EX = rdflib.Namespace("http://example.org/training#")
+
+
+def message(update_id, text, chat_id=10, user_id=7):
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "date": 0, "text": text,
+                        "chat": {"id": chat_id, "type": "private"},
+                        "from": {"id": user_id, "is_bot": False, "first_name": "u"}}}
+
+
+def name_on(ring, node):
+    # Перше ім'я, яке лягає на node
+    for i in range(10000):
+        name = f"user{i}"
+        if ring.node_for(user_key(name)) == node:
+            return name
+    raise AssertionError(node)
+
+
+def test_hash_ring_is_stable_and_balanced():
+    ring = HashRing(range(4))
+    keys = [user_key(f"user{i}") for i in range(4000)]
+    nodes = [ring.node_for(k) for k in keys]
+    assert nodes == [HashRing(range(4)).node_for(k) for k in keys]
+    counts = [nodes.count(n) for n in range(4)]
+    assert min(counts) > 600, counts
+
+
+def test_hash_ring_moves_few_keys_when_node_added():
+    keys = [user_key(f"user{i}") for i in range(4000)]
+    before = HashRing(range(4))
+    after = HashRing(range(5))
+    moved = sum(before.node_for(k) != after.node_for(k) for k in keys)
+    # Ідеально — 1/5 ключів; кожен переміщений ключ іде саме на новий вузол
+    assert moved < len(keys) * 0.3
+    assert all(after.node_for(k) == 4 for k in keys if before.node_for(k) != after.node_for(k))
+
+
+def test_name_command_is_forwarded_immediately():
+    router = ShardRouter(HashRing(range(3)))
+    default = router.ring.node_for("tg:7")
+    assert router.route(message(1, "/stats")) == [(default, [message(1, "/stats")])]
+
+
+def test_name_on_prompting_node_goes_there_alone():
+    router = ShardRouter(HashRing(range(3)))
+    default = router.ring.node_for("tg:7")
+    router.route(message(1, "/stats"))
+    name = name_on(router.ring, default)
+    assert router.route(message(2, name)) == [(default, [message(2, name)])]
+
+
+def test_name_on_other_node_replays_command_and_cancels_prompting_node():
+    router = ShardRouter(HashRing(range(3)))
+    default = router.ring.node_for("tg:7")
+    owner = (default + 1) % 3
+    name = name_on(router.ring, owner)
+    router.route(message(1, "/create_user"))
+    routed = router.route(message(2, name))
+
+    (cancel_node, [cancel]), (owner_node, [replayed, forwarded]) = routed
+    assert (cancel_node, owner_node) == (default, owner)
+    assert cancel[REPLAY_FIELD] and cancel["message"]["text"] == "/cancel"
+    assert cancel["message"]["entities"] == [{"type": "bot_command", "offset": 0, "length": 7}]
+    assert cancel["update_id"] == 2
+    assert replayed[REPLAY_FIELD] and replayed["message"]["text"] == "/create_user"
+    assert forwarded == message(2, name)
+
+    # Решта розмови (вік, зріст...) липне до власника
+    assert router.route(message(3, "30")) == [(owner, [message(3, "30")])]
+
+
+def test_invalid_name_does_not_pin_session():
+    router = ShardRouter(HashRing(range(3)))
+    default = router.ring.node_for("tg:7")
+    owner = (default + 1) % 3
+    router.route(message(1, "/log"))
+    assert router.route(message(2, "не ім'я!")) == [(default, [message(2, "не ім'я!")])]
+    name = name_on(router.ring, owner)
+    routed = router.route(message(3, name))
+    assert [node for node, _ in routed] == [default, owner]
+
+
+def test_cancel_follows_pinned_node_and_other_commands_reset_session():
+    router = ShardRouter(HashRing(range(3)))
+    default = router.ring.node_for("tg:7")
+    owner = (default + 1) % 3
+    router.route(message(1, "/myworkouts"))
+    router.route(message(2, name_on(router.ring, owner)))
+    assert router.route(message(3, "/cancel")) == [(owner, [message(3, "/cancel")])]
+    assert router.route(message(4, "hello")) == [(default, [message(4, "hello")])]
+
+
+def test_updates_without_sender_are_routed_by_update_id():
+    router = ShardRouter(HashRing(range(3)))
+    data = {"update_id": 5, "poll": {}}
+    assert router.route(data) == [(router.ring.node_for("5"), [data])]
+
+
+def test_split_puts_user_triples_on_owner_and_shared_triples_everywhere(tmp_path):
+    source = tmp_path / "SPARQL.ttl"
+    graph = rdflib.Graph()
+    graph.bind("ex", EX)
+    graph.add((EX.Workout_Yoga, rdflib.RDF.type, EX.Workout))
+    users = [f"user{i}" for i in range(20)]
+    for name in users:
+        graph.add((EX[name], rdflib.RDF.type, EX.User))
+        graph.add((EX[name], EX.маєРекомендацію, EX.Workout_Yoga))
+        graph.add((EX[f"log_{name}"], EX.належитьКористувачу, EX[name]))
+    graph.serialize(destination=str(source), format="n3", encoding="utf-8")
+
+    paths = split(str(source), 3)
+    assert paths == [shard_path(str(source), i) for i in range(3)]
+    ring = HashRing(range(3))
+    shards = [rdflib.Graph().parse(path, format="n3") for path in paths]
+    for i, shard in enumerate(shards):
+        assert (EX.Workout_Yoga, rdflib.RDF.type, EX.Workout) in shard
+        for name in users:
+            owned = ring.node_for(user_key(name)) == i
+            assert ((EX[name], rdflib.RDF.type, EX.User) in shard) == owned
+            assert ((EX[name], EX.маєРекомендацію, EX.Workout_Yoga) in shard) == owned
+            assert ((EX[f"log_{name}"], EX.належитьКористувачу, EX[name]) in shard) == owned
+    assert sum(len(s) for s in shards) == len(graph) + 2
+
+
+def test_split_reads_dataset_store_and_refuses_stale_ttl(tmp_path):
+    source = tmp_path / "SPARQL.ttl"
+    rdflib.Graph().serialize(destination=str(source), format="n3", encoding="utf-8")
+    store = GraphStore(str(source), fmt="n3", fsync=False, backend="dataset")
+    store.load()
+    store.add((EX.user1, rdflib.RDF.type, EX.User))
+    store.stop()
+
+    with pytest.raises(ValueError):
+        split(str(source), 2)
+    paths = split(str(source), 2, backend="dataset")
+    owner = HashRing(range(2)).node_for(user_key("user1"))
+    assert (EX.user1, rdflib.RDF.type, EX.User) in rdflib.Graph().parse(paths[owner], format="n3")
+
+
+class FakeProfiles:
+    def __init__(self, levels, planned=None):
+        planned = planned or {}
+        self._profiles = {name: {"name": name, "level": level, "bmi": 22.0, "age": 30, "height": 1.8,
+                                 "weight": 80.0, "total_calories": planned.get(name, 0.0), "workout_ids": []}
+                          for name, level in levels.items()}
+
+    def get(self, name):
+        return self._profiles.get(name)
+
+    def page(self, offset=0, limit=20):
+        names = sorted(self._profiles)
+        return len(names), [self._profiles[n] for n in names[offset:offset + limit]]
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+class FakeProgress:
+    def __init__(self, burned):
+        self.burned = burned
+
+    def series(self, name):
+        cals = np.array([self.burned[name]] if name in self.burned else [], dtype=float)
+        return np.zeros(len(cals)), cals, [None] * len(cals)
+
+
+def user_stats(levels, planned, burned):
+    stats = UserStats(FakeProfiles(levels, planned), FakeProgress(burned))
+    stats.rebuild()
+    return stats
+
+
+def name_index(names):
+    graph = rdflib.Graph()
+    for name in names:
+        graph.add((EX[name], rdflib.RDF.type, EX.User))
+    index = UserNameIndex(graph, EX)
+    index.rebuild()
+    return index
+
+
+async def with_remote_shard(routes, check):
+    # Вузол 1 на локальному сервері; перевірка виконується з вузла 0
+    app = web.Application()
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        return await check(Shard(0, ["http://unused", str(server.make_url("")).rstrip("/")], secret_token="s"))
+    finally:
+        await server.close()
+
+
+def test_name_search_gathers_all_shards():
+    remote = Shard(1, [], secret_token="s")
+    routes = remote.routes(FakeProfiles({"Andriy": "Advanced", "Olena": "Beginner"}), name_index(["Andriy", "Olena"]),
+                           None)
+    local_names, local_profiles = name_index(["Anna", "Bohdan"]), FakeProfiles({"Anna": None, "Bohdan": None})
+
+    async def check(shard):
+        completed = await shard.gather_names(local_names, local_profiles, "an", limit=5)
+        suggested = await shard.gather_names(local_names, local_profiles, "Olna", limit=3, mode="suggest")
+        return completed, suggested
+
+    completed, suggested = asyncio.run(with_remote_shard(routes, check))
+    assert [(p["name"], p["level"]) for p in completed] == [("Andriy", "Advanced"), ("Anna", None)]
+    assert [p["name"] for p in suggested] == ["Olena"]
+
+
+def test_stats_merge_all_shards():
+    remote = Shard(1, [], secret_token="s")
+    remote_stats = user_stats({"Den": "Advanced", "Eve": "Beginner"}, {"Den": 500.0, "Eve": 200.0}, {"Eve": 50.0})
+    routes = remote.routes(FakeProfiles({}), name_index([]), remote_stats)
+    local = user_stats({"Ann": "Beginner", "Bob": "Beginner"}, {"Ann": 300.0}, {"Ann": 120.0})
+
+    async def check(shard):
+        return (await shard.gather_leaderboard(local, "planned", limit=2),
+                await shard.gather_leaderboard(local, "burned", level="Beginner"),
+                await shard.gather_cohorts(local),
+                await shard.gather_population(local, ("planned",)))
+
+    planned, burned, cohorts, (users, values) = asyncio.run(with_remote_shard(routes, check))
+    assert planned == [("Den", 500.0), ("Ann", 300.0)]
+    assert burned == [("Ann", 120.0), ("Eve", 50.0)]
+    assert list(cohorts) == ["Beginner", "Advanced"]
+    assert cohorts["Beginner"]["users"] == 3 and cohorts["Beginner"]["planned"] == 500.0 / 3
+    assert cohorts["Advanced"] == {"users": 1, "bmi": 22.0, "weight": 80.0, "planned": 500.0, "burned": 0.0}
+    assert users == 4
+    assert values["planned"].tolist() == [0.0, 200.0, 300.0, 500.0]
+    assert percentile_of(values["planned"], local.value("Ann", "planned")) == 50.0
+    assert summarize(values["planned"])[3] == 250.0
@@ -0,0 +1,54 @@
+import numpy as np
+
+from stats import UserStats
+
+
+class FakeProfiles:
+    def __init__(self, profiles):
+        self._profiles = {p["name"]: p for p in profiles}
+
+    def page(self, offset=0, limit=20):
+        names = sorted(self._profiles)
+        return len(names), [self._profiles[n] for n in names[offset:offset + limit]]
+
+    def get(self, name):
+        return self._profiles.get(name)
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+class FakeProgress:
+    def __init__(self, burned):
+        self.burned = burned
+
+    def series(self, name):
+        cals = np.array(self.burned.get(name, []), dtype=float)
+        return np.zeros(len(cals)), cals, [None] * len(cals)
+
+
+def profile(name, planned, level="Beginner"):
+    return {"name": name, "age": 30, "height": 1.8, "weight": 80.0, "bmi": 24.7, "level": level,
+            "workout_ids": ["Run"] if planned else [], "total_calories": planned}
+
+
+def make_stats():
+    profiles = FakeProfiles([profile("Ann", 300.0), profile("Bob", 0.0), profile("Den", 500.0, "Advanced"),
+                             profile("Eve", 0.0)])
+    stats = UserStats(profiles, FakeProgress({"Ann": [120.0], "Den": [0.0]}))
+    stats.rebuild()
+    return stats
+
+
+def test_leaderboard_skips_users_without_calories():
+    stats = make_stats()
+    assert stats.leaderboard("planned") == [("Den", 500.0), ("Ann", 300.0)]
+    assert stats.leaderboard("burned") == [("Ann", 120.0)]
+    assert stats.leaderboard("planned", level="Advanced") == [("Den", 500.0)]
+
+
+def test_leaderboard_empty_when_nobody_has_calories():
+    stats = make_stats()
+    assert stats.leaderboard("burned", level="Advanced") == []
+    stats.add_burned("Den", 40.0)
+    assert stats.leaderboard("burned", level="Advanced") == [("Den", 40.0)]
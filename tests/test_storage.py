@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+import rdflib
+
+import storage
+from storage import GraphStore
+
+EX = rdflib.Namespace("http://example.org/training#")
+XSD = rdflib.XSD
+
+
+def open_store(path, **kwargs):
+    store = GraphStore(str(path), fmt="n3", fsync=False, **kwargs)
+    store.load()
+    return store
+
+
+def crash(store):
+    # Процес зупинився без ущільнення: лишились знімок і журнал
+    store._journal.close()
+    store._journal = None
+
+
+def seed(tmp_path):
+    path = tmp_path / "SPARQL.ttl"
+    graph = rdflib.Graph()
+    graph.add((EX.Roma, rdflib.RDF.type, EX.User))
+    graph.add((EX.Roma, EX.вага, rdflib.Literal(80.0, datatype=XSD.float)))
+    graph.serialize(destination=str(path), format="n3", encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("backend", ["memory", "dataset"])
+def test_set_and_remove_survive_crash(tmp_path, backend):
+    path = seed(tmp_path)
+    store = open_store(path, backend=backend)
+    store.flush()
+    store.set((EX.Roma, EX.вага, rdflib.Literal(75.0, datatype=XSD.float)))
+    store.remove((EX.Roma, rdflib.RDF.type, EX.User))
+    crash(store)
+
+    graph = open_store(path, backend=backend).graph
+    assert set(graph.objects(EX.Roma, EX.вага)) == {rdflib.Literal(75.0, datatype=XSD.float)}
+    assert (EX.Roma, rdflib.RDF.type, EX.User) not in graph
+
+
+def test_replay_keeps_order_of_add_and_remove(tmp_path):
+    path = seed(tmp_path)
+    store = open_store(path)
+    triple = (EX.Den, rdflib.RDF.type, EX.User)
+    store.add(triple)
+    store.remove(triple)
+    store.add((EX.Ya, rdflib.RDF.type, EX.User))
+    with store.transaction() as tx:
+        tx.add((EX.Ya, EX.вага, rdflib.Literal(60.0, datatype=XSD.float)))
+        tx.remove((EX.Ya, rdflib.RDF.type, EX.User))
+        tx.add((EX.Ya, rdflib.RDF.type, EX.User))
+    crash(store)
+
+    graph = open_store(path).graph
+    assert triple not in graph
+    assert (EX.Ya, rdflib.RDF.type, EX.User) in graph
+    assert (EX.Ya, EX.вага, rdflib.Literal(60.0, datatype=XSD.float)) in graph
+
+
+def test_removal_survives_interrupted_compaction(tmp_path):
+    path = seed(tmp_path)
+    store = open_store(path)
+    store.add((EX.Den, rdflib.RDF.type, EX.User))
+    # Ротація відбулась, знімок не записано: журнал .1 і свіжий журнал
+    store._journal.close()
+    store._rotate_journal()
+    store._journal = open(store.journal_path, "ab")
+    store.remove((EX.Den, rdflib.RDF.type, EX.User))
+    crash(store)
+
+    assert (EX.Den, rdflib.RDF.type, EX.User) not in open_store(path).graph
+
+
+def test_compaction_applies_journal_and_literals_with_suffix_text(tmp_path):
+    path = seed(tmp_path)
+    store = open_store(path)
+    tricky = rdflib.Literal("<urn:x-journal:removed> .")
+    store.add((EX.Roma, EX.нотатка, tricky))
+    store.remove((EX.Roma, EX.вага, None))
+    crash(store)
+
+    store = open_store(path)
+    assert (EX.Roma, EX.нотатка, tricky) in store.graph
+    assert store.flush()
+    store.stop()
+    graph = open_store(path).graph
+    assert (EX.Roma, EX.нотатка, tricky) in graph
+    assert not list(graph.objects(EX.Roma, EX.вага))
+
+
+def test_persistent_backend_has_no_pending_writes(tmp_path):
+    pytest.importorskip("rdflib_sqlalchemy")
+    store = open_store(tmp_path / "SPARQL.ttl", backend="sqlite")
+    store.add((EX.Den, rdflib.RDF.type, EX.User))
+    store.set((EX.Den, EX.вага, rdflib.Literal(70.0, datatype=XSD.float)))
+    assert store.pending == 0
+    assert (EX.Den, rdflib.RDF.type, EX.User) in store.graph
+    store.stop()
+
+
+def test_migrate_reads_dataset_store(tmp_path):
+    pytest.importorskip("rdflib_sqlalchemy")
+    from migrate_store import migrate
+
+    path = seed(tmp_path)
+    store = open_store(path, backend="dataset")
+    store.add((EX.Den, rdflib.RDF.type, EX.User))
+    store.stop()
+
+    with pytest.raises(ValueError):
+        migrate("sqlite", str(path))
+    target = migrate("sqlite", str(path), source_backend="dataset")
+    store = GraphStore(str(path), backend="sqlite", store_path=target)
+    store.load()
+    assert (EX.Den, rdflib.RDF.type, EX.User) in store.graph
+    store.stop()
+
+
+def test_writes_do_not_wait_for_compaction(tmp_path, monkeypatch):
+    path = seed(tmp_path)
+    store = open_store(path)
+    store.add((EX.Den, rdflib.RDF.type, EX.User))
+    # Ущільнення зупиняється посеред побудови нового знімка
+    building, release = threading.Event(), threading.Event()
+    replay_journal = storage.replay_journal
+
+    def parked(graph, journal):
+        building.set()
+        release.wait(5)
+        return replay_journal(graph, journal)
+
+    monkeypatch.setattr(storage, "replay_journal", parked)
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert building.wait(5)
+    started = time.perf_counter()
+    store.add((EX.Ya, rdflib.RDF.type, EX.User))
+    assert time.perf_counter() - started < 1
+    release.set()
+    flusher.join()
+    crash(store)
+
+    graph = open_store(path).graph
+    assert (EX.Den, rdflib.RDF.type, EX.User) in graph
+    assert (EX.Ya, rdflib.RDF.type, EX.User) in graph
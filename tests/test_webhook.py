@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, WebhookServer
+
+
+def update(update_id, text="/start"):
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "date": 0, "text": text,
+                        "chat": {"id": 1, "type": "private"},
+                        "from": {"id": 1, "is_bot": False, "first_name": "u"}}}
+
+
+def fake_app(running=True):
+    # Лише те, що WebhookServer бере з Application
+    return SimpleNamespace(bot=None, update_queue=asyncio.Queue(), running=running)
+
+
+def run(server, scenario):
+    async def main():
+        async with TestClient(TestServer(server.web_app())) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_rejects_wrong_secret_token():
+    app = fake_app()
+    server = WebhookServer(app, path="/hook", secret_token="s3cret")
+
+    async def scenario(client):
+        missing = await client.post("/hook", json=update(1))
+        wrong = await client.post("/hook", json=update(1), headers={SECRET_HEADER: "other"})
+        right = await client.post("/hook", json=update(1), headers={SECRET_HEADER: "s3cret"})
+        return missing.status, wrong.status, right.status
+
+    assert run(server, scenario) == (403, 403, 200)
+    assert app.update_queue.qsize() == 1
+
+
+def test_repeated_update_id_is_queued_once():
+    app = fake_app()
+    server = WebhookServer(app, path="/hook")
+
+    async def scenario(client):
+        statuses = [(await client.post("/hook", json=update(i))).status for i in (7, 7, 8, 7)]
+        bad = await client.post("/hook", data="not json")
+        return statuses, bad.status
+
+    statuses, bad = run(server, scenario)
+    # Повтор підтверджується 200, інакше Telegram доставлятиме його знову
+    assert statuses == [200, 200, 200, 200]
+    assert bad == 400
+    queued = [app.update_queue.get_nowait().update_id for _ in range(app.update_queue.qsize())]
+    assert queued == [7, 8]
+    assert server.dedup.duplicates == 2
+    assert server.received == 4
+
+
+def test_healthz_reports_state_and_extra_fields():
+    app = fake_app()
+    server = WebhookServer(app, path="/hook", health=lambda: {"graph_triples": 42})
+
+    async def scenario(client):
+        await client.post("/hook", json=update(1))
+        await client.post("/hook", json=update(1))
+        ok = await client.get("/healthz")
+        body = await ok.json()
+        app.running = False
+        stopping = await client.get("/healthz")
+        return ok.status, body, stopping.status, (await stopping.json())["status"]
+
+    status, body, stopping_status, stopping = run(server, scenario)
+    assert status == 200
+    assert body == {"status": "ok", "received": 2, "duplicates": 1, "update_queue": 1, "graph_triples": 42}
+    assert (stopping_status, stopping) == (503, "stopping")
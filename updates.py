@@ -0,0 +1,41 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Паралельна обробка оновлень різних чатів, послідовна — в межах одного.
+
+    ConversationHandler розраховує, що повідомлення однієї розмови
+    обробляються по черзі, тому оновлення з тим самим (чат, користувач)
+    чекають на попереднє; решта йде паралельно до max_concurrent_updates.
+    """
+
+    def __init__(self, max_concurrent_updates=64):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        user = getattr(update, "effective_user", None)
+        if chat is None and user is None:
+            await coroutine
+            return
+        key = (chat.id if chat else None, user.id if user else None)
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
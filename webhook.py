@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import signal
+from collections import deque
+from urllib.parse import urlparse
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateDeduplicator:
+    """Вікно останніх update_id.
+
+    Telegram повторює доставку, якщо відповідь на webhook запізнилась,
+    тож одне оновлення може прийти двічі; повтори відкидаються.
+    """
+
+    def __init__(self, size=4096):
+        self._order = deque()
+        self._seen = set()
+        self.size = size
+        self.duplicates = 0
+
+    def seen(self, update_id):
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.size:
+            self._seen.discard(self._order.popleft())
+        return False
+
+
+class WebhookServer:
+    """Приймання оновлень через webhook на вбудованому aiohttp сервері.
+
+    Альтернатива app.run_polling(): оновлення одразу кладуться у чергу
+    Application, а /healthz віддає стан бота для балансувальника.
+    SIGINT/SIGTERM спершу закривають сервер, потім дочікуються обробки
+    вже прийнятих оновлень; збереження графа лишається за викликачем.
+    Без url webhook у Telegram не реєструється — так працюють вузли
+    за диспетчером (див. sharding.py), які отримують оновлення на path.
+    """
+
+    def __init__(self, app, url=None, listen="0.0.0.0", port=8443, secret_token=None, health=None,
+                 drop_pending_updates=False, path=None, routes=()):
+        self.app = app
+        self.url = url
+        self.path = path or urlparse(url).path or "/"
+        self.listen = listen
+        self.port = port
+        self.secret_token = secret_token
+        self.health = health
+        self.drop_pending_updates = drop_pending_updates
+        self.routes = list(routes)
+        self.dedup = UpdateDeduplicator()
+        self.received = 0
+        self._stop = None
+
+    def web_app(self):
+        web_app = web.Application()
+        web_app.router.add_post(self.path, self.handle_update)
+        web_app.router.add_get("/healthz", self.handle_health)
+        for method, path, handler in self.routes:
+            web_app.router.add_route(method, path, handler)
+        return web_app
+
+    async def handle_update(self, request):
+        if self.secret_token and request.headers.get(SECRET_HEADER) != self.secret_token:
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.app.bot)
+        except (ValueError, TypeError, KeyError):
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+        self.received += 1
+        if not self.dedup.seen(update.update_id):
+            await self.app.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request):
+        body = {
+            "status": "ok" if self.app.running else "stopping",
+            "received": self.received,
+            "duplicates": self.dedup.duplicates,
+            "update_queue": self.app.update_queue.qsize(),
+        }
+        if self.health is not None:
+            body.update(self.health())
+        return web.json_response(body, status=200 if self.app.running else 503,
+                                 dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def serve(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        async with self.app:
+            # Як і run_polling(): post_init запускає фонові задачі бота
+            if self.app.post_init:
+                await self.app.post_init(self.app)
+            if self.url:
+                await self.app.bot.set_webhook(self.url, secret_token=self.secret_token,
+                                               allowed_updates=Update.ALL_TYPES,
+                                               drop_pending_updates=self.drop_pending_updates)
+            await self.app.start()
+            runner = web.AppRunner(self.web_app())
+            await runner.setup()
+            site = web.TCPSite(runner, self.listen, self.port)
+            await site.start()
+            logger.info(f"🌐 Webhook слухає {self.listen}:{self.port}{self.path}")
+            try:
+                await self._stop.wait()
+            finally:
+                # Нові оновлення більше не приймаються, прийняті — обробляються до кінця
+                await runner.cleanup()
+                await self.app.stop()
+                # Як і run_polling(): post_stop дописує відкладене (черга відповідей тощо)
+                if self.app.post_stop:
+                    await self.app.post_stop(self.app)
+                logger.info("🛑 Webhook зупинено")
+
+    def run(self):
+        asyncio.run(self.serve())